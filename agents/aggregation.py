@@ -0,0 +1,324 @@
+"""
+Time-series rollups of the transformed data, computed once per run so
+insights and Q&A read compact tables instead of re-scanning raw rows.
+
+Everything is derived from one base table: per (district, mandal, day),
+the sum and non-null count of each measure. Base tables are additive, so
+streaming and incremental runs build them chunk by chunk and merge them.
+From the base table, for every level (whole dataset, district, mandal):
+
+    rollup_daily      daily values, rolling windows, cumulative seasonal totals
+    rollup_weekly     weekly values (weeks start on Monday)
+    rollup_monthly    monthly values
+    rollup_seasonal   totals per season and year (IMD seasons by default)
+    rollup_anomalies  monthly departure from normal, with IMD rainfall categories
+
+Additive measures (rainfall, units, ...) are totalled; others (humidity,
+...) are averaged.
+"""
+import os
+import numpy as np
+import pandas as pd
+from agents import dtypes, query_engine
+
+TABLES = ["daily", "weekly", "monthly", "seasonal", "anomalies"]
+PERIOD = "period"
+LEVEL = "level"
+ROWS = "rows"
+LEVEL_ALL = "all"
+DEFAULT_DIMENSIONS = ["district", "mandal"]
+DEFAULT_ROLLING_DAYS = [7, 30]
+# Normals come from the entity's own history once it has this many years of a
+# month; before that, from its peers (mandals of the same district, or all
+# districts) in the same month.
+DEFAULT_MIN_HISTORY_YEARS = 3
+# India Meteorological Department seasons.
+DEFAULT_SEASONS = {
+    "winter": [1, 2],
+    "pre_monsoon": [3, 4, 5],
+    "southwest_monsoon": [6, 7, 8, 9],
+    "northeast_monsoon": [10, 11, 12],
+}
+# IMD categories for rainfall departure from normal, in percent.
+DEPARTURE_BINS = [-np.inf, -99.5, -59.5, -19.5, 19.5, 59.5, np.inf]
+DEPARTURE_LABELS = ["no rain", "large deficient", "deficient", "normal", "excess", "large excess"]
+
+
+def rollup_path(output_dir, table):
+    return os.path.join(output_dir, f"rollup_{table}.parquet")
+
+
+def rollup_files():
+    """File names the stage writes, for cache replay."""
+    return [os.path.basename(rollup_path("", t)) for t in TABLES]
+
+
+def is_additive(measure):
+    return any(h in str(measure).lower() for h in query_engine.ADDITIVE_HINTS)
+
+
+def plan(df, config):
+    """
+    (dimensions, date column, measures) to roll up `df` by, from the
+    `aggregation` config section or inferred; date column is None if the
+    data has no dates.
+    """
+    agg_cfg = (config or {}).get("aggregation", {}) or {}
+    date_col = agg_cfg.get("date_column") or next(
+        (c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])), None
+    )
+    dims = agg_cfg.get("dimensions")
+    if dims is None:
+        dims = [d for d in DEFAULT_DIMENSIONS if d in df.columns]
+        if not dims:
+            # Otherwise the two coarsest text columns (e.g. circle > division).
+            text = [c for c in df.select_dtypes(include=["object", "category"]).columns
+                    if not str(c).startswith("_") and not str(c).endswith("_yyyy_mm")]
+            dims = sorted(text, key=lambda c: df[c].nunique())[:2]
+    measures = agg_cfg.get("measures") or [
+        c for c in df.select_dtypes(include=["number"]).columns if not str(c).startswith("_qc_")
+    ]
+    return [d for d in dims if d in df.columns], date_col, [m for m in measures if m in df.columns]
+
+
+def base_table(df, dims, date_col, measures):
+    """Per (dims..., day): `<m>:sum`, `<m>:count` for each measure and a row count."""
+    df = df[dims + [date_col] + measures]
+    if df[date_col].isna().any():
+        df = df[df[date_col].notna()]
+    keys = [df[d].astype("category") for d in dims] + [df[date_col].dt.normalize().rename(PERIOD)]
+    # Compact (float32) measures are still summed in float64.
+    grouped = dtypes.widen(df, measures).groupby(keys, observed=True, sort=False, dropna=False)
+    sums = grouped.sum(min_count=1).add_suffix(":sum")
+    counts = grouped.count().add_suffix(":count")
+    base = pd.concat([sums, counts], axis=1)
+    base[ROWS] = grouped.size()
+    return base.reset_index()
+
+
+def merge_base(parts, dims):
+    """One base table from several (e.g. per chunk), re-summing overlapping cells."""
+    parts = [p for p in parts if p is not None and len(p)]
+    if not parts:
+        return None
+    base = pd.concat(parts, ignore_index=True)
+    for d in dims:
+        base[d] = base[d].astype("category")
+    value_cols = [c for c in base.columns if c not in dims and c != PERIOD]
+    return base.groupby(dims + [PERIOD], observed=True, sort=False, dropna=False)[value_cols].sum(min_count=1).reset_index()
+
+
+def _values(frame, measures):
+    """Measure values from summed cells: totals for additive measures, means otherwise."""
+    out = {}
+    for m in measures:
+        total, count = frame[f"{m}:sum"], frame[f"{m}:count"]
+        out[m] = total if is_additive(m) else total / count.where(count > 0)
+    return pd.DataFrame(out, index=frame.index)
+
+
+def _levels(dims):
+    return [(LEVEL_ALL, [])] + [(d, dims[: i + 1]) for i, d in enumerate(dims)]
+
+
+def _by_level(base, dims, measures, extra_keys, period_of=None):
+    """
+    Roll `base` up to every level by `extra_keys` (e.g. period); a long table
+    with a `level` column and the dims that level doesn't use left empty.
+    """
+    base = base.copy(deep=False)
+    if period_of is not None:
+        base[PERIOD] = period_of(base[PERIOD])
+    cells = [c for c in base.columns if c.endswith((":sum", ":count")) or c == ROWS]
+    tables = []
+    for level, keys in _levels(dims):
+        grouped = base.groupby(keys + extra_keys, observed=True, sort=True, dropna=False)[cells].sum(min_count=1)
+        grouped = grouped.reset_index()
+        table = pd.concat([grouped[keys + extra_keys], _values(grouped, measures), grouped[ROWS]], axis=1)
+        for d in dims:
+            if d not in keys:
+                table[d] = pd.Categorical([None] * len(table), categories=base[d].cat.categories)
+        table.insert(0, LEVEL, level)
+        tables.append(table[[LEVEL] + dims + extra_keys + measures + [ROWS]])
+    out = pd.concat(tables, ignore_index=True)
+    out[LEVEL] = out[LEVEL].astype("category")
+    for d in dims:
+        out[d] = out[d].astype(pd.CategoricalDtype(base[d].cat.categories))
+    return out
+
+
+def _week_start(period):
+    return period - pd.to_timedelta(period.dt.dayofweek, unit="D")
+
+
+def _month_start(period):
+    return pd.Series(period.to_numpy().astype("datetime64[M]").astype("datetime64[ns]"), index=period.index)
+
+
+def _season_lookup(seasons):
+    lookup = np.full(13, None, dtype=object)
+    for name, months in seasons.items():
+        for month in months:
+            lookup[int(month)] = name
+    return lookup
+
+
+def _window_starts(group, day, window):
+    """
+    Position of the first row inside each row's trailing `window` days
+    within its group, like a time-based rolling("<window>D"); rows must be
+    sorted by group, then day.
+    """
+    stride = int(day.max() - day.min()) + window
+    key = group * stride + (day - day.min())
+    return np.searchsorted(key, key - (window - 1))
+
+
+def _add_rolling_and_seasonal(daily, dims, measures, windows, seasons):
+    """
+    Rolling-window and cumulative-season columns on the daily table, per
+    level and entity. The table is sorted by level, entity and day, so
+    each entity's rows are contiguous and a window is the difference of
+    two running totals.
+    """
+    lookup = _season_lookup(seasons)
+    daily["season"] = pd.Categorical(lookup[daily[PERIOD].dt.month.to_numpy()], categories=list(seasons))
+    daily["season_year"] = daily[PERIOD].dt.year
+    group = daily.groupby([LEVEL] + dims, observed=True, sort=False, dropna=False).ngroup().to_numpy()
+    day = daily[PERIOD].to_numpy().astype("datetime64[D]").astype("int64")
+    first = np.searchsorted(group, group)
+    starts = {window: _window_starts(group, day, window) for window in windows}
+    season_keys = [group, daily["season_year"].to_numpy(), daily["season"].cat.codes.to_numpy()]
+    columns = {}
+    for m in measures:
+        values = daily[m].to_numpy(dtype="float64", na_value=np.nan)
+        valid = ~np.isnan(values)
+        filled = np.where(valid, values, 0.0)
+        # Running totals restart per entity, so long histories don't lose precision.
+        total = pd.Series(filled).groupby(group).cumsum().to_numpy()
+        count = np.cumsum(valid)
+        for window, left in starts.items():
+            prev = left - 1
+            sums = total - np.where(left > first, total[prev], 0.0)
+            counts = count - np.where(left > 0, count[prev], 0)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                columns[f"{m}:roll{window}d"] = np.where(counts > 0, sums if is_additive(m) else sums / counts, np.nan)
+        if is_additive(m):
+            columns[f"{m}:season_cum"] = pd.Series(values).groupby(season_keys).cumsum().to_numpy()
+    for window in windows:
+        for m in measures:
+            daily[f"{m}:roll{window}d"] = columns.pop(f"{m}:roll{window}d")
+    for name, values in columns.items():
+        daily[name] = values
+    return daily
+
+
+def _anomalies(monthly, dims, measures, min_years):
+    """Long table: per level, entity, month and measure the actual value, normal and departure."""
+    frames = []
+    month = monthly[PERIOD].dt.month
+    year = monthly[PERIOD].dt.year
+    for level, keys in _levels(dims):
+        part = monthly[monthly[LEVEL] == level]
+        if part.empty:
+            continue
+        cal = month[part.index].rename("_cal_month")
+        history_keys = [part[k] for k in keys] + [cal]
+        years = year[part.index].groupby(history_keys, observed=True, dropna=False).transform("nunique")
+        parent_keys = [part[k] for k in keys[:-1]] + [part[PERIOD]]
+        for m in measures:
+            actual = part[m]
+            history = actual.groupby(history_keys, observed=True, dropna=False).transform("mean")
+            peers = actual.groupby(parent_keys, observed=True, dropna=False).transform("mean") if keys else \
+                pd.Series(np.nan, index=part.index)
+            use_history = years >= min_years
+            normal = history.where(use_history, peers)
+            departure = actual - normal
+            pct = departure / normal.where(normal != 0) * 100
+            frame = part[[LEVEL] + dims + [PERIOD]].copy()
+            frame["measure"] = m
+            frame["actual"] = actual
+            frame["normal"] = normal
+            frame["departure"] = departure
+            frame["departure_pct"] = pct
+            frame["category"] = pd.cut(pct if is_additive(m) else pct * np.nan, DEPARTURE_BINS, labels=DEPARTURE_LABELS)
+            frame["basis"] = np.where(use_history, "history", "peers")
+            frames.append(frame[normal.notna()])
+    if not frames:
+        return pd.DataFrame(columns=[LEVEL] + dims + [PERIOD, "measure", "actual", "normal", "departure",
+                                     "departure_pct", "category", "basis"])
+    out = pd.concat(frames, ignore_index=True)
+    for col in ("measure", "category", "basis", LEVEL):
+        out[col] = out[col].astype("category")
+    return out
+
+
+def build_rollups(base, dims, measures, config=None):
+    """All rollup tables ({name: DataFrame}) from a base table."""
+    agg_cfg = (config or {}).get("aggregation", {}) or {}
+    windows = agg_cfg.get("rolling_days", DEFAULT_ROLLING_DAYS)
+    seasons = agg_cfg.get("seasons") or DEFAULT_SEASONS
+    min_years = agg_cfg.get("min_history_years", DEFAULT_MIN_HISTORY_YEARS)
+
+    daily = _by_level(base, dims, measures, [PERIOD])
+    daily = _add_rolling_and_seasonal(daily, dims, measures, windows, seasons)
+    weekly = _by_level(base, dims, measures, [PERIOD], _week_start)
+    monthly = _by_level(base, dims, measures, [PERIOD], _month_start)
+
+    with_season = base.copy(deep=False)
+    with_season["season"] = pd.Categorical(
+        _season_lookup(seasons)[base[PERIOD].dt.month.to_numpy()], categories=list(seasons)
+    )
+    with_season["season_year"] = base[PERIOD].dt.year
+    seasonal = _by_level(with_season, dims, measures, ["season_year", "season"])
+
+    return {
+        "daily": daily,
+        "weekly": weekly,
+        "monthly": monthly,
+        "seasonal": seasonal,
+        "anomalies": _anomalies(monthly, dims, measures, min_years),
+    }
+
+
+def write_rollups(tables, output_dir):
+    """Write each table to rollup_<name>.parquet; returns {name: path}."""
+    paths = {}
+    for name, table in tables.items():
+        paths[name] = rollup_path(output_dir, name)
+        table.to_parquet(paths[name], index=False)
+    return paths
+
+
+def aggregate_frame(df, config, output_dir):
+    """
+    Roll the transformed `df` up into the precomputed tables, written to
+    `output_dir`. Returns (None, meta) like the other stages; meta["tables"]
+    maps table names to paths and is empty when the data has no dates (or no rows).
+    """
+    dims, date_col, measures = plan(df, config)
+    if date_col is None or not measures or not len(df):
+        return None, {"tables": {}, "dimensions": dims, "date_column": None, "measures": measures}
+    base = base_table(df, dims, date_col, measures)
+    return None, rollups_meta(build_rollups(base, dims, measures, config), output_dir, dims, date_col, measures)
+
+
+def rollups_meta(tables, output_dir, dims, date_col, measures):
+    paths = write_rollups(tables, output_dir)
+    return {
+        "tables": paths,
+        "rows": {name: len(t) for name, t in tables.items()},
+        "dimensions": dims,
+        "date_column": date_col,
+        "measures": measures,
+    }
+
+
+def load_rollups(run_dir):
+    """{name: DataFrame} of the rollup tables found in `run_dir` (empty if none)."""
+    tables = {}
+    for name in TABLES:
+        path = rollup_path(run_dir, name)
+        if os.path.exists(path):
+            tables[name] = pd.read_parquet(path)
+    return tables
@@ -0,0 +1,192 @@
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import pandas as pd
+
+# Checkpoints a run can export, in pipeline order.
+CHECKPOINTS = ["raw", "standardized", "cleaned", "transformed"]
+DEFAULT_CHECKPOINTS = ["transformed"]
+
+# Tabular entries of `export_formats` and their file extensions.
+TABLE_FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".arrow"}
+DEFAULT_COMPRESSION = {"parquet": "zstd", "feather": "lz4"}
+
+
+def run_directory(root, location, now=None):
+    """
+    New, isolated output dir for one run of dataset `location`:
+    <root>/<YYYY-MM-DD>/<dataset>_<HHMMSS>, suffixed _2, _3... if a run of
+    the same dataset started in the same second. Created atomically, so
+    concurrent runs never share a directory.
+    """
+    now = now or datetime.now()
+    name = os.path.splitext(os.path.basename(str(location).rstrip("/").split("?")[0]))[0]
+    slug = re.sub(r"[^0-9a-zA-Z]+", "_", name).strip("_").lower()[:60] or "dataset"
+    base = os.path.join(root, now.strftime("%Y-%m-%d"), f"{slug}_{now.strftime('%H%M%S')}")
+    path, n = base, 1
+    while True:
+        try:
+            os.makedirs(path)
+            return path
+        except FileExistsError:
+            n += 1
+            path = f"{base}_{n}"
+
+
+def table_formats(config: dict):
+    """Tabular artifact formats requested in `export_formats` (csv if none)."""
+    formats = [f for f in (config or {}).get("export_formats", []) or [] if f in TABLE_FORMATS]
+    return formats or ["csv"]
+
+
+def write_artifact(df, path, fmt="csv", compression=None):
+    """Write `df` to `path` as csv, parquet or feather (Arrow IPC)."""
+    if fmt == "csv":
+        df.to_csv(path, index=False)
+        return path
+
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    compression = compression or DEFAULT_COMPRESSION[fmt]
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        pq.write_table(table, path, compression=compression)
+    elif fmt == "feather":
+        import pyarrow.feather as feather
+        feather.write_feather(table, path, compression=compression)
+    else:
+        raise ValueError(f"Unsupported artifact format: {fmt}")
+    return path
+
+
+def read_artifact(path, columns=None, nrows=None):
+    """
+    Read an artifact written by write_artifact, loading only `columns` (and
+    only the first `nrows` rows if given). Parquet and feather files are
+    memory-mapped rather than read into a buffer.
+    """
+    if path.endswith(".csv"):
+        return pd.read_csv(path, usecols=columns, nrows=nrows)
+    if path.endswith(".parquet"):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        if nrows is not None:
+            pf = pq.ParquetFile(path, memory_map=True)
+            batch = next(pf.iter_batches(batch_size=nrows, columns=columns), None)
+            if batch is None:
+                return pf.schema_arrow.empty_table().to_pandas()
+            return pa.Table.from_batches([batch]).to_pandas()
+        table = pq.read_table(path, columns=columns, memory_map=True)
+    elif path.endswith(".arrow") or path.endswith(".feather"):
+        import pyarrow.feather as feather
+        table = feather.read_table(path, columns=columns, memory_map=True)
+        if nrows is not None:
+            table = table.slice(0, nrows)
+    else:
+        raise ValueError(f"Unsupported artifact type: {path}")
+    return table.to_pandas()
+
+
+class ChunkWriter:
+    """Appends DataFrame chunks to a single csv, parquet or feather artifact."""
+
+    def __init__(self, path, fmt="csv", compression=None):
+        self.path = path
+        self.fmt = fmt
+        self.compression = compression or DEFAULT_COMPRESSION.get(fmt)
+        self._writer = None
+        self._schema = None
+        self._started = False
+
+    def write(self, df):
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+            self._started = True
+            return
+
+        import pyarrow as pa
+
+        if self._writer is None:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            self._schema = table.schema
+            if self.fmt == "parquet":
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, self._schema, compression=self.compression)
+            else:
+                options = pa.ipc.IpcWriteOptions(compression=self.compression)
+                self._writer = pa.ipc.new_file(self.path, self._schema, options=options)
+        else:
+            table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+
+def find_artifact(output_dir, name):
+    """Path of checkpoint `name` in `output_dir`, preferring columnar formats."""
+    for fmt in ["parquet", "feather", "csv"]:
+        path = os.path.join(output_dir, name + TABLE_FORMATS[fmt])
+        if os.path.exists(path):
+            return path
+    return None
+
+
+class ArtifactExporter:
+    """
+    Writes stage DataFrames to disk at configured checkpoints.
+
+    Stages hand DataFrames to each other in memory; the exporter only
+    persists the checkpoints listed under `artifacts.checkpoints` in the
+    config, in every tabular format listed under `export_formats`, on a
+    background thread unless `artifacts.async` is false.
+    """
+
+    def __init__(self, output_dir, config: dict = None):
+        artifacts_cfg = (config or {}).get("artifacts", {}) or {}
+        checkpoints = artifacts_cfg.get("checkpoints", DEFAULT_CHECKPOINTS)
+        if checkpoints == "all":
+            checkpoints = CHECKPOINTS
+        self.output_dir = output_dir
+        self.checkpoints = [c for c in (checkpoints or []) if c in CHECKPOINTS]
+        self.formats = table_formats(config)
+        self.compression = artifacts_cfg.get("compression")
+        self.asynchronous = artifacts_cfg.get("async", True)
+        self._pool = ThreadPoolExecutor(max_workers=1) if self.asynchronous else None
+        self._pending = []
+
+    def path_for(self, name, fmt="csv"):
+        return os.path.join(self.output_dir, name + TABLE_FORMATS[fmt])
+
+    def export(self, name, df):
+        """Queue `df` for export if `name` is a configured checkpoint; return its paths."""
+        if name not in self.checkpoints:
+            return []
+        # Shallow copy so later stages adding/replacing columns don't race the writer.
+        snapshot = df.copy(deep=False)
+        paths = []
+        for fmt in self.formats:
+            path = self.path_for(name, fmt)
+            if self._pool:
+                fut = self._pool.submit(write_artifact, snapshot, path, fmt, self.compression)
+                self._pending.append((name, path, fut))
+            else:
+                write_artifact(snapshot, path, fmt, self.compression)
+            paths.append(path)
+        return paths
+
+    def wait(self):
+        """Block until all queued exports are on disk; return {checkpoint: [paths]}."""
+        written = {}
+        for name, path, fut in self._pending:
+            fut.result()
+            written.setdefault(name, []).append(path)
+        self._pending.clear()
+        if self._pool:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+        return written
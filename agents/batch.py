@@ -0,0 +1,188 @@
+"""
+Batch runner: one pipeline run per dataset, spread over a process pool.
+
+Each dataset gets its own run directory (see artifacts.run_directory),
+LLM calls from all workers share one global concurrency limit, and a
+consolidated index (index.json + index.md) of every dataset's status,
+rows and stage timings is written to a batch directory next to the runs.
+"""
+import os
+import glob
+import copy
+import json
+import time
+import traceback
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+from agents import logging_agent
+from agents.artifacts import run_directory
+
+DEFAULT_PROCESSES = max(1, min(4, (os.cpu_count() or 1)))
+DEFAULT_LLM_CONCURRENCY = 4
+DEFAULT_ROOT = "run_artifacts"
+INDEX_JSON = "index.json"
+INDEX_MD = "index.md"
+
+
+def expand_sources(patterns):
+    """
+    Dataset locations from `patterns`: URLs are kept as given, anything else
+    is a path or glob (expanded, sorted). Duplicates are dropped, order kept.
+    """
+    sources = []
+    for pattern in patterns:
+        if pattern.startswith(("http://", "https://")):
+            matches = [pattern]
+        else:
+            matches = sorted(glob.glob(pattern)) or ([pattern] if os.path.exists(pattern) else [])
+            if not matches:
+                print(f"[WARN] No datasets match {pattern}")
+        for match in matches:
+            if match not in sources:
+                sources.append(match)
+    return sources
+
+
+def read_source_list(path):
+    """Patterns from a text file, one per line (blank lines and # comments skipped)."""
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+
+
+def source_config(config, location):
+    """Copy of `config` with dataset_source pointing at `location`."""
+    config = copy.deepcopy(config)
+    kind = "url" if location.startswith(("http://", "https://")) else "file"
+    config["dataset_source"] = dict(config.get("dataset_source") or {}, type=kind, location=location)
+    return config
+
+
+def _init_worker(llm_slots):
+    # Charts are rendered headless in workers.
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    from agents import llm_agent
+
+    llm_agent.set_global_limit(llm_slots)
+
+
+def _summarize_run(run_dir):
+    """Rows, stage timings and LLM usage from a finished run's performance report."""
+    try:
+        with open(os.path.join(run_dir, logging_agent.PERFORMANCE_REPORT), encoding="utf-8") as f:
+            report = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    counters = report.get("counters", {})
+    llm_latency = report.get("observations", {}).get("llm.latency_s", {})
+    return {
+        "rows_in": counters.get("rows_out.ingestion"),
+        "rows_out": counters.get("rows_out.transformation", counters.get("rows_out.streaming")),
+        "stages": {s["stage"]: s["seconds"] for s in report.get("stages", [])},
+        "critical_path": report.get("critical_path"),
+        "peak_rss_mb": report.get("peak_rss_mb"),
+        "llm_calls": counters.get("llm.calls", 0),
+        "llm_cache_hits": counters.get("llm.cache_hits", 0),
+        "llm_latency_p95_s": llm_latency.get("p95"),
+    }
+
+
+def run_source(config, location, run_dir, config_path=None, workers=None):
+    """Run the pipeline on one dataset into `run_dir`; returns its index entry (never raises)."""
+    from agents import llm_agent
+    from agents.orchestrator import Orchestrator
+
+    entry = {"source": location, "run_dir": run_dir, "pid": os.getpid()}
+    start = time.perf_counter()
+    try:
+        config = source_config(config, location)
+        logging_agent.log_event(f"Run started for {location}", run_dir)
+        orchestrator = Orchestrator(llm_agent.LLMAgent(config), run_dir, config, config_path=config_path, workers=workers)
+        orchestrator.run_pipeline()
+        logging_agent.log_event("Run completed", run_dir)
+        entry["status"] = "ok"
+    except Exception as e:
+        logging_agent.log_event(f"[ERROR] Run failed: {e}\n{traceback.format_exc()}", run_dir)
+        entry.update(status="failed", error=f"{type(e).__name__}: {e}")
+    finally:
+        logging_agent.flush(run_dir)
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    entry.update(_summarize_run(run_dir))
+    return entry
+
+
+def write_index(batch_dir, index):
+    """Write index.json and a readable index.md table into `batch_dir`."""
+    from tabulate import tabulate
+
+    with open(os.path.join(batch_dir, INDEX_JSON), "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, default=str)
+    rows = [
+        [d["source"], d["status"], d.get("rows_in"), d.get("rows_out"), d["seconds"],
+         d.get("llm_calls"), os.path.relpath(d["run_dir"], batch_dir), d.get("error", "")]
+        for d in index["datasets"]
+    ]
+    with open(os.path.join(batch_dir, INDEX_MD), "w", encoding="utf-8") as f:
+        f.write(f"# Batch run {index['started']}\n\n")
+        f.write(f"{index['ok']} ok, {index['failed']} failed, {index['wall_seconds']}s wall "
+                f"({index['processes']} processes, {index['llm_concurrency']} concurrent LLM calls)\n\n")
+        f.write(tabulate(rows, headers=["source", "status", "rows in", "rows out", "seconds",
+                                        "LLM calls", "run dir", "error"], tablefmt="github"))
+        f.write("\n")
+
+
+def run_batch(config, sources, config_path=None, processes=None, llm_concurrency=None,
+              root=DEFAULT_ROOT, workers=None, on_result=None):
+    """
+    Run every dataset in `sources` on a pool of `processes` worker processes
+    (default: batch.processes in the config). At most `llm_concurrency` LLM
+    calls are in flight across all workers. `on_result(entry)` is called as
+    each dataset finishes. Returns the index dict, also written to the
+    batch directory as index.json / index.md.
+    """
+    batch_cfg = config.get("batch", {}) or {}
+    processes = processes or batch_cfg.get("processes") or DEFAULT_PROCESSES
+    llm_concurrency = llm_concurrency or batch_cfg.get("llm_concurrency") or DEFAULT_LLM_CONCURRENCY
+    started = datetime.now()
+    batch_dir = run_directory(root, "batch", started)
+    # Each run's own stage pool; processes x workers threads in total.
+    workers = workers or batch_cfg.get("workers_per_run") or 1
+
+    start = time.perf_counter()
+    ctx = mp.get_context("spawn")
+    llm_slots = ctx.BoundedSemaphore(llm_concurrency)
+    entries = []
+    with ProcessPoolExecutor(max_workers=min(processes, len(sources)) or 1, mp_context=ctx,
+                             initializer=_init_worker, initargs=(llm_slots,)) as pool:
+        futures = {
+            pool.submit(run_source, config, location, run_directory(root, location, started),
+                        config_path, workers): location
+            for location in sources
+        }
+        for future in as_completed(futures):
+            entry = future.result()
+            entries.append(entry)
+            logging_agent.log_event(
+                f"{entry['source']}: {entry['status']} in {entry['seconds']}s -> {entry['run_dir']}",
+                batch_dir, event="batch_result", **{k: entry.get(k) for k in ("source", "status", "seconds")},
+            )
+            if on_result:
+                on_result(entry)
+
+    order = {location: i for i, location in enumerate(sources)}
+    entries.sort(key=lambda e: order[e["source"]])
+    index = {
+        "started": started.isoformat(),
+        "wall_seconds": round(time.perf_counter() - start, 3),
+        "processes": processes,
+        "llm_concurrency": llm_concurrency,
+        "config_path": config_path,
+        "ok": sum(e["status"] == "ok" for e in entries),
+        "failed": sum(e["status"] != "ok" for e in entries),
+        "datasets": entries,
+    }
+    write_index(batch_dir, index)
+    logging_agent.flush(batch_dir)
+    index["batch_dir"] = batch_dir
+    return index
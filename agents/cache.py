@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import shutil
+import hashlib
+import inspect
+import threading
+import pandas as pd
+
+# Bump when the on-disk entry layout changes.
+CACHE_FORMAT = 2
+
+
+def _package_deps(module, package):
+    """Modules of `package` that `module` references directly (imported modules, or where imported names live)."""
+    for value in vars(module).values():
+        dep = value if inspect.ismodule(value) else sys.modules.get(getattr(value, "__module__", None) or "")
+        if dep is not None and dep.__name__.split(".")[0] == package and getattr(dep, "__file__", None):
+            yield dep
+
+
+def code_version(module) -> str:
+    """
+    Hash of a stage module's source and of every package module it
+    imports, transitively (e.g. cleaning -> quality -> dtypes), so editing
+    a stage or any helper it relies on invalidates its entries.
+    """
+    package = module.__name__.split(".")[0]
+    deps = {module.__name__: module}
+    pending = [module]
+    while pending:
+        for dep in _package_deps(pending.pop(), package):
+            if dep.__name__ not in deps:
+                deps[dep.__name__] = dep
+                pending.append(dep)
+    h = hashlib.sha256()
+    for name in sorted(deps):
+        with open(inspect.getsourcefile(deps[name]), "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def frame_fingerprint(df) -> str:
+    """Content hash of a DataFrame (values, index, column names and dtypes)."""
+    h = hashlib.sha256()
+    h.update(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    h.update(json.dumps([(str(c), str(t)) for c, t in df.dtypes.items()]).encode())
+    return h.hexdigest()
+
+
+class StageCache:
+    """
+    Content-addressed cache of stage outputs shared across runs.
+
+    An entry is keyed on the stage's input key, its config slice and its
+    code version, and holds the output DataFrame, the stage metadata and
+    the side files (summaries, plots) the stage wrote. The cache is kept
+    under `max_bytes` by evicting least recently used entries.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """Build a StageCache from the `cache` config section, or None if disabled."""
+        cache_cfg = (config or {}).get("cache", {}) or {}
+        if not cache_cfg.get("enabled", True):
+            return None
+        max_mb = cache_cfg.get("max_size_mb", 1024)
+        return cls(cache_cfg.get("dir", ".stage_cache"), int(max_mb * 1024 * 1024))
+
+    def key(self, stage, input_key, config_slice, module) -> str:
+        payload = json.dumps(
+            {
+                "format": CACHE_FORMAT,
+                "stage": stage,
+                "input": input_key,
+                "config": config_slice,
+                "code": code_version(module),
+                "pandas": pd.__version__,
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, key, output_dir):
+        """
+        Return (df, meta) for `key`, copying the cached side files into
+        `output_dir`, or None on a miss.
+        """
+        entry = self._entry_dir(key)
+        meta_path = os.path.join(entry, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            record = json.load(f)
+
+        frame_path = os.path.join(entry, "frame.pkl")
+        df = pd.read_pickle(frame_path) if os.path.exists(frame_path) else None
+        for name in record["files"]:
+            target = os.path.join(output_dir, name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copy2(os.path.join(entry, "files", name), target)
+
+        # Mark as recently used for LRU eviction.
+        os.utime(meta_path)
+        return df, _relocate(record["meta"], record["files"], output_dir)
+
+    def put(self, key, df, meta, files, output_dir=None):
+        """
+        Store a stage output; `files` are side artifacts the stage wrote,
+        kept by their path relative to `output_dir` (by name if not given).
+        Returns the keys evicted to stay within max_bytes.
+        """
+        entry = self._entry_dir(key)
+        tmp = f"{entry}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(os.path.join(tmp, "files"))
+
+        names = []
+        for path in files:
+            if os.path.exists(path):
+                name = os.path.relpath(path, output_dir) if output_dir else os.path.basename(path)
+                os.makedirs(os.path.dirname(os.path.join(tmp, "files", name)), exist_ok=True)
+                shutil.copy2(path, os.path.join(tmp, "files", name))
+                names.append(name)
+        if df is not None:
+            df.to_pickle(os.path.join(tmp, "frame.pkl"))
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"meta": meta, "files": names}, f, default=str)
+
+        with self._lock:
+            shutil.rmtree(entry, ignore_errors=True)
+            os.replace(tmp, entry)
+            return self.evict()
+
+    def _entries(self):
+        for prefix in os.listdir(self.cache_dir):
+            prefix_dir = os.path.join(self.cache_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                if key.endswith(".tmp"):
+                    continue  # being written by another thread or process
+                meta_path = os.path.join(prefix_dir, key, "meta.json")
+                if os.path.exists(meta_path):
+                    yield os.path.join(prefix_dir, key), os.path.getmtime(meta_path)
+
+    def evict(self):
+        """
+        Drop least recently used entries until the cache fits in max_bytes.
+        Called with the cache lock held by put.
+        """
+        entries = []
+        total = 0
+        for entry, last_used in self._entries():
+            size = sum(
+                os.path.getsize(os.path.join(root, name))
+                for root, _, names in os.walk(entry)
+                for name in names
+            )
+            entries.append((last_used, size, entry))
+            total += size
+
+        evicted = []
+        for last_used, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            evicted.append(os.path.basename(entry))
+        return evicted
+
+
+def output_files(value, output_dir):
+    """Paths of existing files inside `output_dir` mentioned in stage metadata."""
+    if isinstance(value, dict):
+        return [p for v in value.values() for p in output_files(v, output_dir)]
+    if isinstance(value, list):
+        return [p for v in value for p in output_files(v, output_dir)]
+    if isinstance(value, str) and os.path.isfile(value) and \
+            os.path.abspath(value).startswith(os.path.join(os.path.abspath(output_dir), "")):
+        return [value]
+    return []
+
+
+def _relocate(value, files, output_dir):
+    """Point file paths recorded in cached metadata at the current output dir."""
+    if isinstance(value, dict):
+        return {k: _relocate(v, files, output_dir) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_relocate(v, files, output_dir) for v in value]
+    if isinstance(value, str):
+        for name in files:
+            if value == name or value.endswith(os.sep + name):
+                return os.path.join(output_dir, name)
+    return value
@@ -1,64 +1,26 @@
 import os
 import pandas as pd
+from agents import dedup, imputation, quality
+from agents.artifacts import read_artifact
 from agents.llm_agent import call_llm_for_cleaning_suggestions
 
 
-def _iqr_outlier_mask(s: pd.Series) -> pd.Series:
-    """Return a boolean Series True where s is an outlier by IQR."""
-    s_num = pd.to_numeric(s, errors="coerce").dropna()
-    if s_num.empty:
-        return pd.Series(False, index=s.index)
-    q1, q3 = s_num.quantile(0.25), s_num.quantile(0.75)
-    iqr = q3 - q1
-    if iqr == 0:
-        return pd.Series(False, index=s.index)
-    lower, upper = q1 - 1.5 * iqr, q3 + 1.5 * iqr
-    return ~s_num.between(lower, upper).reindex(s.index, fill_value=False)
-
-
-def clean_data(std_path, config, output_dir):
-    df = pd.read_csv(std_path)
-    n_rows_before = len(df)
-    dup_count = df.duplicated().sum()
-    missing_before = df.isna().sum()
+def write_cleaning_summary(output_dir, n_rows_before, dup_count, n_rows_after, missing_before, missing_after, profile=None,
+                           flag_layout=None, imputed=None, seen_before=None):
+    """
+    Write 03_cleaning_summary.md. `imputed` is imputation metadata with
+    at least {"filled": {column: {strategy: cells}}}; `seen_before` counts
+    rows dropped by the cross-run dedup index (None if it is off).
+    """
     total_missing_before = int(missing_before.sum())
-    try:
-        _ = call_llm_for_cleaning_suggestions(df.head(100).to_dict(), config)
-    except Exception:
-        _ = None
-    
-    # Flag rows with any missing values before cleaning
-    df["_qc_missing"] = df.isna().any(axis=1)
-
-    # Generic outlier flags for all numeric columns
-    numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
-    for col in numeric_cols:
-        df[f"_qc_outlier_{col}"] = _iqr_outlier_mask(df[col])
-
-    # Flag rows with missing values before imputation
-    imputed_mask = df.isna().any(axis=1)
-
-    # Cleaning: drop duplicates, then impute missing with forward/back fill
-    df = df.drop_duplicates()
-    df = df.ffill().bfill()
-
-    # Flag rows that had missing values before cleaning
-    df["_qc_imputed"] = imputed_mask
-
-    n_rows_after = len(df)
-    missing_after = df.isna().sum()
     total_missing_after = int(missing_after.sum())
-
-    # Save cleaned data
-    cleaned_path = os.path.join(output_dir, "cleaned.csv")
-    df.to_csv(cleaned_path, index=False)
-
-    # --- Cleaning summary ---
     summary_path = os.path.join(output_dir, "03_cleaning_summary.md")
     with open(summary_path, "w", encoding="utf-8") as f:
         f.write("# Cleaning Summary\n\n")
         f.write(f"- **Rows before:** {n_rows_before}\n")
         f.write(f"- **Duplicates removed:** {dup_count}\n")
+        if seen_before is not None:
+            f.write(f"- **Rows seen in earlier runs (removed):** {seen_before}\n")
         f.write(f"- **Rows after:** {n_rows_after}\n")
         f.write(f"- **Missing values (total) before:** {total_missing_before}\n")
         f.write(f"- **Missing values (total) after:** {total_missing_after}\n\n")
@@ -69,9 +31,122 @@ def clean_data(std_path, config, output_dir):
         f.write(missing_after.to_frame("missing_count").to_markdown())
         f.write("\n\n")
 
+        if imputed is not None:
+            scope = f"within each {', '.join(imputed['group_by'])} group" if imputed.get("group_by") else "dataset-wide"
+            order = f"in {imputed['time_column']} order" if imputed.get("time_column") else "in row order"
+            f.write(f"## Imputation ({scope}, {order}, max gap {imputed.get('max_gap')})\n\n")
+            filled = pd.DataFrame(imputed["filled"]).T.reindex(columns=list(imputation.STRATEGIES)).fillna(0)
+            if len(filled):
+                f.write(filled.astype(int).rename_axis("column").to_markdown())
+            else:
+                f.write("No values were imputed.")
+            f.write("\n\n")
+
+        if profile is not None and profile.numeric_cols:
+            scope = f"per {', '.join(profile.group_by)}" if profile.group_by else "dataset-wide"
+            f.write(f"## Outlier Counts (IQR method, {scope})\n\n")
+            f.write(profile.outlier_table().to_markdown(index=False))
+            f.write("\n\n")
+            if not profile.group_by:
+                f.write("## IQR Fences\n\n")
+                f.write(profile.fences.to_markdown(index=False))
+                f.write("\n\n")
+
         f.write("## Notes on Quality Flags\n\n")
-        f.write("- `_qc_missing`: True if the row had any missing values before cleaning.\n")
-        f.write("- `_qc_outlier_<column>`: True if the value in that numeric column was an outlier by IQR rule.\n")
-        f.write("- `_qc_imputed`: True if missing values were filled during cleaning.\n")
+        f.write("- `missing`: the row had any missing values before cleaning.\n")
+        f.write("- `outlier:<column>`: the value in that numeric column was an outlier by IQR rule.\n")
+        f.write("- `imputed`: missing values in the row were filled during cleaning.\n")
+        f.write("- `imputed:<column>`: how that cell was filled: "
+                + ", ".join(f"{code} {name}" for name, code in imputation.STRATEGIES.items())
+                + " (0: observed).\n\n")
+        if flag_layout:
+            f.write(pd.DataFrame(list(flag_layout.items()), columns=["flag", "stored in"]).to_markdown(index=False))
+            f.write("\n")
+    return summary_path
 
+
+def suggest_cleaning(df, config, output_dir):
+    """
+    Ask the LLM for cleaning suggestions on a sample of `df` and save them to
+    03_llm_cleaning_suggestions.md. Independent of clean_frame, so the
+    Orchestrator runs it alongside the cleaning stage; returns the path.
+    """
+    try:
+        suggestions = call_llm_for_cleaning_suggestions(df.head(100).to_dict(), config)
+    except Exception as e:
+        suggestions = f"LLM cleaning suggestions unavailable: {e}"
+
+    path = os.path.join(output_dir, "03_llm_cleaning_suggestions.md")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# LLM Cleaning Suggestions\n\n")
+        f.write(f"{suggestions}\n")
+    return path
+
+
+def clean_frame(df, config, output_dir, index=None):
+    """
+    Flag, deduplicate and impute `df`; returns (cleaned df, meta).
+    Duplicates are rows with the same hash over `dedup.key_columns`; with
+    a cross-run `index` (dedup.HashIndex), rows it already holds are
+    dropped too and the rest are added to it (the caller saves it).
+    Missing values are imputed per group and in time order (see
+    imputation.impute_frame). The input frame is left untouched, but only
+    the columns that are actually deduplicated or filled get copied.
+    """
+    df = df.copy(deep=False)
+    group_by = (config.get("quality", {}) or {}).get("group_by")
+    packed = (config.get("memory", {}) or {}).get("pack_qc_flags", True)
+    # One hash per row, reused for counting, dropping and the cross-run index
+    keys = dedup.key_columns(df, config)
+    hashes = dedup.row_hashes(df, keys)
+    profile = quality.profile_frame(df, group_by, hashes)
+    n_rows_before = profile.rows
+    dup_count = profile.duplicates
+    missing_before = profile.missing
+
+    # Cleaning: drop duplicates (found by the profile) and rows seen in earlier runs,
+    # then impute missing values within groups
+    row_missing, outliers = profile.row_missing, profile.outliers
+    keep = ~profile.duplicated
+    seen_before = None
+    if index is not None:
+        seen = index.contains(hashes) & keep
+        seen_before = int(seen.sum())
+        keep &= ~seen
+        index.add(hashes[keep])
+    if not keep.all():
+        df, row_missing, outliers = df[keep], row_missing[keep], outliers[keep]
+    df, codes, imputed = imputation.impute_frame(df, config)
+
+    # QC flags: rows with missing values, how each cell was imputed and outliers
+    # per numeric column, from the profile's batched pass
+    for name, values in quality.flag_columns(row_missing, codes, outliers, packed).items():
+        df[name] = values
+
+    n_rows_after = len(df)
+    missing_after = df.drop(columns=[c for c in df.columns if str(c).startswith("_qc_")]).isna().sum()
+    flag_layout = quality.flag_layout(profile.numeric_cols, packed, list(codes.columns))
+
+    summary_path = write_cleaning_summary(
+        output_dir, n_rows_before, dup_count, n_rows_after, missing_before, missing_after, profile, flag_layout,
+        imputed, seen_before,
+    )
+
+    meta = {
+        "rows_before": n_rows_before,
+        "rows_after": n_rows_after,
+        "duplicates_removed": int(dup_count),
+        "dedup": {"key_columns": keys, "seen_in_earlier_runs": seen_before},
+        "qc_profile": profile.to_dict(),
+        "qc_flags": flag_layout,
+        "imputation": imputed,
+        "summary": summary_path,
+    }
+    return df, meta
+
+
+def clean_data(std_path, config, output_dir):
+    df, _ = clean_frame(read_artifact(std_path), config, output_dir)
+    cleaned_path = os.path.join(output_dir, "cleaned.csv")
+    df.to_csv(cleaned_path, index=False)
     return cleaned_path
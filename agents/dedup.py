@@ -0,0 +1,202 @@
+import os
+import fcntl
+from contextlib import contextmanager
+import numpy as np
+import pandas as pd
+from agents import dtypes
+
+DEFAULT_INDEX_PATH = ".dedup_index/rows.npy"
+# The index table is kept at most half full, so probes stay short.
+MAX_LOAD = 0.5
+MIN_CAPACITY = 1 << 12
+EMPTY = np.uint64(0)
+
+
+def key_columns(df, config=None):
+    """Columns that identify a row (`dedup.key_columns`, default every data column)."""
+    keys = ((config or {}).get("dedup", {}) or {}).get("key_columns") or []
+    missing = [c for c in keys if c not in df.columns]
+    if missing:
+        raise ValueError(f"dedup.key_columns not in the data: {', '.join(map(str, missing))}")
+    return keys or [c for c in df.columns if not str(c).startswith("_qc_")]
+
+
+def _canonical(s):
+    """`s` in a dtype-independent form, so a row hashes the same whether or not its frame was compacted."""
+    if s.dtype == "float32":
+        return dtypes.to_float64(s)
+    if pd.api.types.is_integer_dtype(s) and s.dtype != "int64":
+        return s.to_numpy(dtype="int64")
+    return s
+
+
+def row_hashes(df, columns=None):
+    """One uint64 hash per row of `df[columns]`, computed in a single vectorized pass."""
+    columns = list(df.columns) if columns is None else columns
+    frame = pd.DataFrame({c: _canonical(df[c]) for c in columns}, index=df.index)
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+@contextmanager
+def _file_lock(path):
+    """Exclusive advisory lock on `path` (created if missing), held across processes."""
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _stamp(path):
+    """Identity of the file at `path` (a save replaces it with a new inode), or None."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def duplicated(hashes):
+    """True for every row whose hash already occurred earlier in `hashes`."""
+    return pd.Series(hashes, copy=False).duplicated().to_numpy()
+
+
+class HashIndex:
+    """
+    Persistent set of uint64 row hashes: a linear-probing hash table
+    stored as one .npy file and memory-mapped for lookups, so checking a
+    batch costs O(1) per row and only touches the probed pages. Hash 0
+    marks an empty slot (a real 0 hash is stored as 1). Additions stay in
+    memory until save(), which merges them into whatever is on disk by
+    then (under a file lock), so overlapping runs don't drop each other's
+    rows. Rows first seen by two overlapping runs are kept by both.
+
+    The table is built in bulk: entries sorted by home slot (the low bits
+    of the hash, over a power-of-two capacity) land at
+    max(home, previous position + 1), so positions come from one
+    cumulative maximum. Runs past the last home slot spill into a few
+    extra tail slots instead of wrapping around.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._stamp = _stamp(path) if path else None
+        if self._stamp:
+            self.table = np.load(path, mmap_mode="r")
+        else:
+            self.table = np.zeros(MIN_CAPACITY + 1, dtype="uint64")
+        self._count = None
+        self._added = []
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """The cross-run index of the `dedup` config section, or None if disabled."""
+        cfg = (config or {}).get("dedup", {}) or {}
+        if not cfg.get("cross_run", False):
+            return None
+        return cls(cfg.get("index_path", DEFAULT_INDEX_PATH))
+
+    def __len__(self):
+        if self._count is None:
+            self._count = int(np.count_nonzero(self.table))
+        return self._count
+
+    @property
+    def capacity(self):
+        # The tail is shorter than the capacity, so this is the largest power of two that fits.
+        return 1 << (len(self.table).bit_length() - 1)
+
+    @staticmethod
+    def _stored(hashes):
+        hashes = np.asarray(hashes, dtype="uint64")
+        return np.where(hashes == EMPTY, np.uint64(1), hashes)
+
+    def contains(self, hashes):
+        """Boolean mask: which of `hashes` are in the index."""
+        hashes = self._stored(hashes)
+        table = self.table
+        slot = (hashes & np.uint64(self.capacity - 1)).astype("int64")
+        found = np.zeros(len(hashes), dtype=bool)
+        pending = np.arange(len(hashes))
+        while pending.size:
+            current = table[slot[pending]]
+            hit = current == hashes[pending]
+            found[pending[hit]] = True
+            # Probing stops at a hit or an empty slot; the table always ends with one.
+            pending = pending[~hit & (current != EMPTY)]
+            slot[pending] += 1
+        return found
+
+    def _build(self, hashes):
+        """Rebuild the table from distinct, non-zero `hashes`."""
+        capacity = max(MIN_CAPACITY, 1 << int(np.ceil(np.log2(max(len(hashes), 1) / MAX_LOAD))))
+        home = (hashes & np.uint64(capacity - 1)).astype("int64")
+        order = np.argsort(home, kind="stable")
+        hashes, home = hashes[order], home[order]
+        i = np.arange(len(hashes))
+        position = np.maximum.accumulate(home - i) + i if len(hashes) else i
+        table = np.zeros(max(capacity, int(position[-1]) + 1 if len(hashes) else 0) + 1, dtype="uint64")
+        table[position] = hashes
+        self.table = table
+
+    def _insert(self, hashes):
+        """
+        Probe-insert distinct `hashes` that aren't in the table yet (cheaper
+        than a rebuild for a batch much smaller than the table). Returns the
+        hashes left over if a probe reached the table's last slot, which
+        must stay empty.
+        """
+        if not self.table.flags.writeable:
+            self.table = np.array(self.table)
+        table = self.table
+        slot = (hashes & np.uint64(self.capacity - 1)).astype("int64")
+        while hashes.size:
+            if slot.max() >= len(table) - 1:
+                return hashes
+            free = np.flatnonzero(table[slot] == EMPTY)
+            # One hash per free slot wins it; the rest probe on.
+            by_slot = free[np.argsort(slot[free], kind="stable")]
+            winners = by_slot[np.append(True, slot[by_slot][1:] != slot[by_slot][:-1])[:len(by_slot)]]
+            table[slot[winners]] = hashes[winners]
+            placed = np.zeros(len(hashes), dtype=bool)
+            placed[winners] = True
+            hashes, slot = hashes[~placed], slot[~placed] + 1
+        return hashes
+
+    def add(self, hashes):
+        """Add `hashes` to the index (in memory); returns how many were new."""
+        hashes = np.sort(self._stored(hashes))
+        hashes = hashes[np.append(True, hashes[1:] != hashes[:-1])[:len(hashes)]]
+        hashes = hashes[~self.contains(hashes)]
+        if not len(hashes):
+            return 0
+        count = len(self) + len(hashes)
+        if count > MAX_LOAD * self.capacity or len(hashes) * 8 > count:
+            leftover = hashes
+        else:
+            leftover = self._insert(hashes)
+        if len(leftover):
+            self._build(np.concatenate([self.table[self.table != EMPTY], leftover]))
+        self._count = count
+        self._added.append(hashes)
+        return len(hashes)
+
+    def save(self):
+        """
+        Write the table to `path` (atomically, via a temporary file). If
+        another run saved since this index was loaded, the hashes added
+        here are merged into its table rather than overwriting it.
+        """
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with _file_lock(self.path + ".lock"):
+            if _stamp(self.path) != self._stamp:
+                merged = HashIndex(self.path)
+                for hashes in self._added:
+                    merged.add(hashes)
+                self.table, self._count = merged.table, None
+            tmp = f"{self.path}.{os.getpid()}.tmp.npy"
+            np.save(tmp, self.table)
+            os.replace(tmp, self.path)
+            self._stamp = _stamp(self.path)
+        self._added = []
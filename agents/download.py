@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from agents import logging_agent
+
+DEFAULT_CACHE_DIR = ".download_cache"
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT_S = 30
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_S = 0.5
+CHUNK_BYTES = 1024 * 1024
+META_FILE = ".meta.json"
+# Statuses worth retrying (the partial file is kept, so a retry resumes).
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def _name(url):
+    return os.path.basename(url.split("?")[0].rstrip("/")) or "download"
+
+
+class DownloadCache:
+    """
+    On-disk cache of downloaded URLs. Each URL has a directory holding the
+    body (named after the URL), a `.part` file while a download is in
+    progress and the ETag/Last-Modified validators the server sent, so
+    later runs revalidate with a conditional request and interrupted
+    downloads resume with a range request.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def entry(self, url):
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.cache_dir, key)
+
+    def lock(self, url):
+        with self._lock:
+            return self._locks.setdefault(url, threading.Lock())
+
+    def meta(self, url):
+        try:
+            with open(os.path.join(self.entry(url), META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_meta(self, url, meta):
+        entry = self.entry(url)
+        os.makedirs(entry, exist_ok=True)
+        tmp = os.path.join(entry, f"{META_FILE}.{threading.get_ident()}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(dict(meta, url=url), f)
+        os.replace(tmp, os.path.join(entry, META_FILE))
+
+
+class Downloader:
+    """
+    Streams URLs to the download cache over one pooled httpx client.
+
+    A cached body is revalidated with If-None-Match / If-Modified-Since
+    and reused on 304; a `.part` left by an interrupted download is
+    resumed with Range / If-Range. Transport errors and 5xx responses are
+    retried with exponential backoff, each retry resuming where the last
+    attempt stopped. fetch_many downloads several URLs concurrently.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, concurrency=DEFAULT_CONCURRENCY, timeout_s=DEFAULT_TIMEOUT_S,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff_s=DEFAULT_BACKOFF_S, client=None):
+        import httpx
+
+        self.cache = DownloadCache(cache_dir)
+        self._owns_client = client is None
+        self.concurrency = max(1, int(concurrency))
+        self.max_retries = int(max_retries)
+        self.backoff_s = backoff_s
+        self.client = client or httpx.Client(
+            timeout=timeout_s,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency),
+        )
+
+    @classmethod
+    def from_config(cls, config: dict, client=None):
+        """Build a Downloader from the `download` config section."""
+        cfg = (config or {}).get("download", {}) or {}
+        return cls(
+            cache_dir=cfg.get("cache_dir", DEFAULT_CACHE_DIR),
+            concurrency=cfg.get("concurrency", DEFAULT_CONCURRENCY),
+            timeout_s=cfg.get("timeout_s", DEFAULT_TIMEOUT_S),
+            max_retries=cfg.get("max_retries", DEFAULT_MAX_RETRIES),
+            backoff_s=cfg.get("backoff_s", DEFAULT_BACKOFF_S),
+            client=client,
+        )
+
+    def close(self):
+        if self._owns_client:
+            self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def fetch(self, url):
+        """Local path of `url`'s current body, downloading only what the cache lacks."""
+        import httpx
+
+        with self.cache.lock(url):
+            for attempt in range(self.max_retries + 1):
+                try:
+                    return self._fetch_once(url)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                        raise
+                logging_agent.count("download.retries")
+                time.sleep(self.backoff_s * 2 ** attempt)
+
+    def fetch_many(self, urls):
+        """fetch() each of `urls` concurrently; paths in the same order."""
+        if len(urls) == 1:
+            return [self.fetch(urls[0])]
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(urls)), thread_name_prefix="download") as pool:
+            return list(pool.map(self.fetch, urls))
+
+    def _fetch_once(self, url):
+        entry = self.cache.entry(url)
+        path = os.path.join(entry, _name(url))
+        part = path + ".part"
+        meta = self.cache.meta(url)
+        validator = meta.get("etag") or meta.get("last_modified")
+
+        headers = {}
+        offset = 0
+        if os.path.exists(part) and validator:
+            offset = os.path.getsize(part)
+            headers.update({"Range": f"bytes={offset}-", "If-Range": validator})
+        elif os.path.exists(path) and meta.get("complete"):
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        with self.client.stream("GET", url, headers=headers) as r:
+            if r.status_code == 416 and offset:
+                # The partial file is already as long as the body (or longer): start over.
+                os.remove(part)
+                return self._fetch_once(url)
+            if r.status_code == 304:
+                logging_agent.count("download.not_modified")
+                return path
+            r.raise_for_status()
+            resumed = r.status_code == 206 and _range_start(r.headers.get("content-range")) == offset
+            if r.status_code == 206 and not resumed:
+                raise ValueError(f"Unexpected Content-Range {r.headers.get('content-range')!r} from {url}")
+            if resumed:
+                logging_agent.count("download.resumed")
+            else:
+                # Record the validators before the body, so an interrupted download can resume.
+                self.cache.save_meta(url, {
+                    "etag": r.headers.get("etag"), "last_modified": r.headers.get("last-modified"), "complete": False,
+                })
+            os.makedirs(entry, exist_ok=True)
+            with open(part, "ab" if resumed else "wb") as f:
+                for chunk in r.iter_bytes(CHUNK_BYTES):
+                    f.write(chunk)
+                    logging_agent.count("download.bytes", len(chunk))
+        os.replace(part, path)
+        self.cache.save_meta(url, dict(self.cache.meta(url), complete=True))
+        return path
+
+
+def _range_start(content_range):
+    """First byte of a `Content-Range: bytes a-b/n` header, or None."""
+    try:
+        return int(content_range.split()[1].split("-")[0])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def page_urls(location, pages, start_index, count):
+    """URLs of pages start_index..start_index+count-1 of a paginated resource."""
+    import httpx
+
+    first, step = pages.get("start", 1), pages.get("step", 1)
+    return [
+        str(httpx.URL(location).copy_merge_params({pages["param"]: first + i * step}))
+        for i in range(start_index, start_index + count)
+    ]
+
+
+def _has_rows(path):
+    """True if a delimited file has anything past its header line."""
+    with open(path, "rb") as f:
+        f.readline()
+        return bool(f.read(4096).strip())
+
+
+def fetch_pages(downloader, location, pages):
+    """
+    Download a paginated resource (`pages`: {param, start, step, max_pages})
+    a batch of `concurrency` pages at a time, stopping at the first page
+    without data rows or that doesn't exist (404).
+    """
+    import httpx
+
+    max_pages = int(pages.get("max_pages", 1000))
+    paths = []
+    while len(paths) < max_pages:
+        batch = page_urls(location, pages, len(paths), min(downloader.concurrency, max_pages - len(paths)))
+        with ThreadPoolExecutor(max_workers=len(batch), thread_name_prefix="download") as pool:
+            futures = [pool.submit(downloader.fetch, url) for url in batch]
+        for future in futures:
+            try:
+                path = future.result()
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code != 404 or not paths:
+                    raise
+                return paths
+            if not _has_rows(path):
+                return paths
+            paths.append(path)
+    return paths
+
+
+def combine_parts(paths, target):
+    """
+    Concatenate delimited files that share a header into `target`, keeping
+    the first file's header. Skipped when `target` is newer than every part.
+    """
+    if os.path.exists(target) and os.path.getmtime(target) >= max(os.path.getmtime(p) for p in paths):
+        return target
+    tmp = f"{target}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as out:
+        for i, path in enumerate(paths):
+            with open(path, "rb") as f:
+                if i:
+                    f.readline()
+                shutil.copyfileobj(f, out, CHUNK_BYTES)
+            if not _ends_with_newline(path):
+                out.write(b"\n")
+    os.replace(tmp, target)
+    return target
+
+
+def _ends_with_newline(path):
+    if not os.path.getsize(path):
+        return True
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+def fetch_source(source_config, config=None, client=None):
+    """
+    Local copy of a `url` dataset_source. `location` is downloaded on its
+    own, together with any extra `parts` URLs (fetched concurrently), or
+    page by page when `pages` describes a paginated resource; several
+    parts or pages are combined into one file with a single header.
+    """
+    location = source_config["location"]
+    with Downloader.from_config(config, client=client) as downloader:
+        if source_config.get("pages"):
+            paths = fetch_pages(downloader, location, source_config["pages"])
+            if not paths:
+                raise ValueError(f"No rows found in {location}")
+        else:
+            paths = downloader.fetch_many([location] + list(source_config.get("parts") or []))
+        if len(paths) == 1:
+            return paths[0]
+        target = os.path.join(downloader.cache.entry(json.dumps(paths)), _name(location))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        return combine_parts(paths, target)
+
+
+def local_path(source_config, config=None):
+    """Path of the dataset_source on disk: the file itself, or the downloaded copy of a URL."""
+    kind = source_config.get("type", "file")
+    if kind == "file":
+        return source_config["location"]
+    if kind == "url":
+        return fetch_source(source_config, config)
+    raise ValueError(f"Unknown dataset source type: {kind}")
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from agents import schema_profile
+
+# Decimal places tried when checking that float32 keeps a column's values.
+MAX_DECIMALS = 6
+
+
+def frame_bytes(df):
+    """Memory held by `df`, including the strings of object columns."""
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def _decimals(values):
+    """Fewest decimal places (up to MAX_DECIMALS) that represent every value, or None."""
+    for d in range(MAX_DECIMALS + 1):
+        if np.array_equal(np.round(values, d), values):
+            return d
+    return None
+
+
+def float32_safe(s):
+    """
+    True if a float64 column can be stored as float32 without changing any
+    value at the precision it was recorded with (e.g. rainfall in 0.1 mm):
+    every value rounds back to itself from float32 at that many decimals.
+    """
+    values = s.to_numpy(dtype="float64", na_value=np.nan)
+    values = values[np.isfinite(values)]
+    if not values.size:
+        return True
+    d = _decimals(values)
+    if d is None or np.abs(values).max() * 10 ** d >= 2 ** 24:
+        return False
+    return np.array_equal(np.round(values.astype("float32").astype("float64"), d), values)
+
+
+def to_float64(s):
+    """
+    float64 values of column `s`. A float32 column is widened back to the
+    decimals its values were recorded with (the fewest that round-trip to
+    the same float32), so 12.3 comes back as 12.3, not 12.300000190734863.
+    """
+    values = s.to_numpy(dtype="float64", na_value=np.nan)
+    if s.dtype != "float32":
+        return values
+    finite = np.isfinite(values)
+    narrow = values[finite].astype("float32")
+    for d in range(MAX_DECIMALS + 1):
+        rounded = np.round(values, d)
+        if np.array_equal(rounded[finite].astype("float32"), narrow):
+            return rounded
+    return values
+
+
+def widen(df, columns):
+    """`df[columns]`, with float32 columns widened to float64 by to_float64."""
+    return pd.DataFrame(
+        {c: to_float64(df[c]) if df[c].dtype == "float32" else df[c] for c in columns}, index=df.index
+    )
+
+
+def optimize_frame(df, config=None):
+    """
+    Shrink `df`'s dtypes (the `memory` config section); returns (df, meta).
+
+    Integer columns are downcast to the smallest type holding their range,
+    float64 columns become float32 where float32_safe holds, and text
+    columns with repeating values become categoricals. The frame is
+    modified in place; meta records the bytes before and after and which
+    columns changed.
+    """
+    cfg = (config or {}).get("memory", {}) or {}
+    before = frame_bytes(df)
+    changed = {}
+    if cfg.get("downcast", True):
+        for col in df.select_dtypes(include=["integer"]).columns:
+            s = pd.to_numeric(df[col], downcast="integer")
+            if s.dtype != df[col].dtype:
+                df[col] = s
+                changed[col] = str(s.dtype)
+        for col in df.select_dtypes(include=["float64"]).columns:
+            if float32_safe(df[col]):
+                df[col] = df[col].astype("float32")
+                changed[col] = "float32"
+    for col in schema_profile.categorical_columns(df):
+        df[col] = df[col].astype("category")
+        changed[col] = "category"
+    meta = {"bytes_before": before, "bytes_after": frame_bytes(df), "columns": changed}
+    return df, meta
@@ -0,0 +1,363 @@
+"""
+Scope filter engine for `scope.filters`.
+
+A filter spec is a mapping; its entries are ANDed:
+
+    district: Adilabad                     # equality, case-insensitive for text
+    mandal: [Bela, Boath]                  # in
+    rain_(mm): {gte: 10, lt: 100}          # ranges on numbers
+    date: {between: [2025-06-01, 2025-06-15]}   # ...and dates (inclusive)
+    district: {not_in: [Nirmal]}           # also eq, ne, in, gt, lte
+    or: [{district: Adilabad}, {rain_(mm): {gt: 50}}]
+    not: {mandal: Bela}
+
+Column names match exactly, case-insensitively or after the same snake_case
+normalization standardization applies ("Rain (mm)" -> "rain_(mm)").
+Predicates on columns the data doesn't have are ignored, as before.
+
+Text columns are matched through a dictionary encoding (category codes,
+or factorized values) built once per frame and column and cached, so a
+predicate is evaluated over the distinct values and mapped back with one
+lookup instead of lowercasing every row. All predicates combine into a
+single boolean mask. For parquet/feather input, read_filtered pushes the
+predicates down to the Arrow scanner so non-matching rows are never
+materialized.
+"""
+import weakref
+import numpy as np
+import pandas as pd
+
+OPERATORS = {"eq", "ne", "in", "not_in", "gt", "gte", "lt", "lte", "between"}
+
+
+def compile_filters(spec):
+    """
+    Parse a filter spec into a tree of ("and"|"or", [nodes]), ("not", node)
+    and ("pred", column, op, value) tuples; None for an empty spec. Raises
+    ValueError on an unknown operator or a malformed `between`.
+    """
+    if not spec:
+        return None
+    if isinstance(spec, (list, tuple)):
+        return _combine("and", [compile_filters(s) for s in spec])
+    nodes = []
+    for key, value in spec.items():
+        if key in ("and", "or"):
+            if not isinstance(value, (list, tuple)):
+                raise ValueError(f"'{key}' filter expects a list of filters, got {value!r}")
+            nodes.append(_combine(key, [compile_filters(v) for v in value]))
+        elif key == "not":
+            nodes.append(("not", compile_filters(value)))
+        elif isinstance(value, dict):
+            for op, arg in value.items():
+                if op not in OPERATORS:
+                    raise ValueError(f"Unknown filter operator '{op}' for {key} (expected one of {sorted(OPERATORS)})")
+                if op == "between" and not (isinstance(arg, (list, tuple)) and len(arg) == 2):
+                    raise ValueError(f"'between' filter on {key} expects [low, high], got {arg!r}")
+                if op in ("in", "not_in") and not isinstance(arg, (list, tuple)):
+                    arg = [arg]
+                nodes.append(("pred", key, op, arg))
+        elif isinstance(value, (list, tuple)):
+            nodes.append(("pred", key, "in", list(value)))
+        else:
+            nodes.append(("pred", key, "eq", value))
+    return _combine("and", nodes)
+
+
+def _combine(kind, nodes):
+    nodes = [n for n in nodes if n is not None]
+    if not nodes:
+        return None
+    return nodes[0] if len(nodes) == 1 else (kind, nodes)
+
+
+def resolve_columns(node, columns):
+    """
+    `node` with predicate columns mapped onto `columns`; predicates on
+    missing columns are dropped (a dropped branch of an `or`/`not` drops
+    the whole branch). Returns None if nothing is left to filter on.
+    """
+    if node is None:
+        return None
+    kind = node[0]
+    if kind == "pred":
+        column = _match_column(node[1], columns)
+        return None if column is None else ("pred", column, node[2], node[3])
+    if kind == "not":
+        inner = resolve_columns(node[1], columns)
+        return None if inner is None else ("not", inner)
+    children = [resolve_columns(child, columns) for child in node[1]]
+    if kind == "or" and any(child is None for child in children):
+        return None
+    return _combine(kind, children)
+
+
+def _match_column(name, columns):
+    if name in columns:
+        return name
+    wanted = str(name).strip().lower()
+    for candidate in (wanted, wanted.replace(" ", "_")):
+        for column in columns:
+            if str(column).lower() == candidate:
+                return column
+    return None
+
+
+def columns_of(node):
+    """Columns referenced by compiled `node`, in first-use order."""
+    if node is None:
+        return []
+    if node[0] == "pred":
+        return [node[1]]
+    children = [node[1]] if node[0] == "not" else node[1]
+    seen = []
+    for child in children:
+        seen += [c for c in columns_of(child) if c not in seen]
+    return seen
+
+
+def describe(node):
+    """Readable one-line form of a compiled filter, e.g. `district in ['a', 'b'] and not mandal = 'x'`."""
+    if node is None:
+        return "none"
+    kind = node[0]
+    if kind == "pred":
+        _, column, op, value = node
+        symbol = {"eq": "=", "ne": "!=", "gt": ">", "gte": ">=", "lt": "<", "lte": "<=",
+                  "in": "in", "not_in": "not in", "between": "between"}[op]
+        return f"{column} {symbol} {value!r}"
+    if kind == "not":
+        return f"not ({describe(node[1])})"
+    return f" {kind} ".join(f"({describe(c)})" if c[0] in ("and", "or") else describe(c) for c in node[1])
+
+
+# -- in-memory evaluation -------------------------------------------------
+
+class FilterIndex:
+    """
+    Dictionary encodings of a frame's text columns: per column, integer
+    codes per row (-1 for missing) and the lowercased distinct values.
+    Built lazily per column; holds no reference to the frame itself.
+    Like the stage cache, it assumes pipeline frames are not modified in
+    place once handed on.
+    """
+
+    def __init__(self, n_rows):
+        self.n_rows = n_rows
+        self._columns = {}
+
+    def encoding(self, df, column):
+        if column not in self._columns:
+            s = df[column]
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                codes, values = s.cat.codes.to_numpy(), s.cat.categories
+            else:
+                codes, values = pd.factorize(s, use_na_sentinel=True)
+            self._columns[column] = (codes, pd.Index(values.astype(str)).str.lower())
+        return self._columns[column]
+
+
+_indexes = {}
+
+
+def index_for(df):
+    """FilterIndex cached for `df` (dropped when the frame is garbage collected)."""
+    key = id(df)
+    index = _indexes.get(key)
+    if index is None or index.n_rows != len(df):
+        index = FilterIndex(len(df))
+        _indexes[key] = index
+        weakref.finalize(df, _indexes.pop, key, None)
+    return index
+
+
+def _is_text(s):
+    return isinstance(s.dtype, pd.CategoricalDtype) or s.dtype == object or pd.api.types.is_string_dtype(s.dtype)
+
+
+def _coerce(s, value):
+    """`value` converted to compare against column `s`; raises ValueError naming the column if it can't be."""
+    if pd.api.types.is_datetime64_any_dtype(s.dtype):
+        try:
+            value = pd.Timestamp(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Filter on {s.name} expects a date, got {value!r}") from None
+        tz = getattr(s.dtype, "tz", None)
+        if tz is not None and value.tzinfo is None:
+            value = value.tz_localize(tz)
+        return value
+    if pd.api.types.is_bool_dtype(s.dtype) and isinstance(value, str):
+        return value.strip().lower() in ("true", "1", "yes")
+    if pd.api.types.is_numeric_dtype(s.dtype) and isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            raise ValueError(f"Filter on {s.name} expects a number, got {value!r}") from None
+    return value
+
+
+def _compare(values, op, arg):
+    if op == "eq":
+        return values == arg
+    if op == "ne":
+        return values != arg
+    if op == "gt":
+        return values > arg
+    if op == "gte":
+        return values >= arg
+    if op == "lt":
+        return values < arg
+    if op == "lte":
+        return values <= arg
+    return (values >= arg[0]) & (values <= arg[1])  # between
+
+
+def _predicate_mask(df, index, column, op, value):
+    s = df[column]
+    if _is_text(s):
+        # Evaluate on the distinct values, then map back through the codes.
+        codes, lowered = index.encoding(df, column)
+        if op in ("in", "not_in"):
+            arg = [str(v).lower() for v in value]
+            hits = lowered.isin(arg) if op == "in" else ~lowered.isin(arg)
+        elif op == "between":
+            hits = _compare(lowered, op, [str(v).lower() for v in value])
+        else:
+            hits = _compare(lowered, op, str(value).lower())
+        lookup = np.zeros(len(lowered) + 1, dtype=bool)
+        lookup[:-1] = np.asarray(hits, dtype=bool)
+        if op in ("ne", "not_in"):
+            lookup[-1] = True  # missing values are "not equal", as with plain pandas comparisons
+        return lookup[codes]
+    if op in ("in", "not_in"):
+        values = [_coerce(s, v) for v in value]
+        if pd.api.types.is_float_dtype(s.dtype):
+            values = np.asarray(values, dtype=s.dtype)  # float32 columns match their decimal literals
+        hits = s.isin(values).to_numpy()
+        return hits if op == "in" else ~hits
+    arg = [_coerce(s, v) for v in value] if op == "between" else _coerce(s, value)
+    return np.asarray(_compare(s, op, arg), dtype=bool)
+
+
+def evaluate(df, node, index=None):
+    """Boolean mask (numpy) of the rows of `df` matching compiled, resolved `node`."""
+    if node is None:
+        return np.ones(len(df), dtype=bool)
+    index = index or index_for(df)
+    kind = node[0]
+    if kind == "pred":
+        return _predicate_mask(df, index, *node[1:])
+    if kind == "not":
+        return ~evaluate(df, node[1], index)
+    masks = [evaluate(df, child, index) for child in node[1]]
+    return np.logical_and.reduce(masks) if kind == "and" else np.logical_or.reduce(masks)
+
+
+def apply(df, spec):
+    """Rows of `df` matching filter spec `spec` (all of `df` if the spec is empty)."""
+    node = resolve_columns(compile_filters(spec), list(df.columns))
+    if node is None:
+        return df
+    mask = evaluate(df, node)
+    return df if mask.all() else df[mask]
+
+
+# -- predicate pushdown ---------------------------------------------------
+
+def to_expression(node, schema):
+    """
+    pyarrow.compute Expression selecting a superset of the rows `node`
+    matches in data with Arrow `schema`, or None if no useful part of the
+    filter can be pushed down. Text matching is case-insensitive.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if node is None:
+        return None
+    kind = node[0]
+    if kind == "not":
+        return None  # null semantics differ from pandas; filtered in memory instead
+    if kind in ("and", "or"):
+        parts = [to_expression(child, schema) for child in node[1]]
+        if kind == "or" and any(p is None for p in parts):
+            return None
+        parts = [p for p in parts if p is not None]
+        if not parts:
+            return None
+        expr = parts[0]
+        for p in parts[1:]:
+            expr = (expr & p) if kind == "and" else (expr | p)
+        return expr
+
+    _, column, op, value = node
+    arrow_type = schema.field(column).type
+    field = pc.field(column)
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+        field = field.cast(arrow_type)
+    if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+        field = pc.utf8_lower(field)
+        convert = lambda v: str(v).lower()
+    elif pa.types.is_timestamp(arrow_type) or pa.types.is_date(arrow_type):
+        convert = lambda v: pd.Timestamp(v).to_pydatetime()
+    elif pa.types.is_floating(arrow_type):
+        # In the column's own precision, so float32 values match their decimal literals.
+        convert = lambda v: pa.scalar(float(v), type=arrow_type)
+    elif pa.types.is_integer(arrow_type):
+        convert = float
+    elif pa.types.is_boolean(arrow_type):
+        convert = lambda v: v.strip().lower() in ("true", "1", "yes") if isinstance(v, str) else bool(v)
+    else:
+        return None
+    try:
+        if op in ("in", "not_in"):
+            values = [convert(v) for v in value]
+            expr = field.isin(values)
+            return (~expr | field.is_null()) if op == "not_in" else expr
+        if op == "between":
+            return (field >= convert(value[0])) & (field <= convert(value[1]))
+        arg = convert(value)
+    except (TypeError, ValueError):
+        return None
+    return {
+        "eq": lambda: field == arg,
+        "ne": lambda: (field != arg) | field.is_null(),
+        "gt": lambda: field > arg,
+        "gte": lambda: field >= arg,
+        "lt": lambda: field < arg,
+        "lte": lambda: field <= arg,
+    }[op]()
+
+
+def _dataset(paths):
+    import pyarrow.dataset as ds
+
+    return ds.dataset(paths, format="parquet" if paths[0].endswith(".parquet") else "feather")
+
+
+def count_rows(paths):
+    """Total rows in parquet/feather file(s) `paths`, from metadata."""
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    return _dataset(paths).count_rows() if paths else 0
+
+
+def read_filtered(paths, spec, columns=None):
+    """
+    Read parquet/feather file(s) `paths`, keeping only rows matching `spec`.
+    Predicates are pushed down to the Arrow scanner (row groups whose
+    statistics rule them out are skipped; other rows are dropped before
+    conversion to pandas), then re-checked in memory for exact semantics.
+    """
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    if not paths:
+        return pd.DataFrame(columns=columns)
+    dataset = _dataset(paths)
+    node = resolve_columns(compile_filters(spec), dataset.schema.names)
+    expr = to_expression(node, dataset.schema)
+    extra = [c for c in columns_of(node) if columns is not None and c not in columns]
+    read_columns = None if columns is None else list(columns) + extra
+    df = dataset.to_table(filter=expr, columns=read_columns).to_pandas()
+    if node is not None:
+        df = df[evaluate(df, node)].reset_index(drop=True)
+    return df.drop(columns=extra) if extra else df
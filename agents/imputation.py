@@ -0,0 +1,253 @@
+import numpy as np
+import pandas as pd
+from agents import dtypes
+
+# Imputation strategies, by the code recorded for each cell they fill
+# (0 means the value was observed).
+STRATEGIES = {"locf": 1, "interpolate": 2, "group_median": 3}
+DEFAULT_STRATEGY = ["interpolate", "locf", "group_median"]
+DEFAULT_GROUP_BY = ["district", "mandal"]
+DEFAULT_MAX_GAP = 7
+# Strategies that only look at earlier rows, so chunked modes can apply them.
+CHUNKED_STRATEGIES = ["locf"]
+NANOS_PER_DAY = 86_400 * 10 ** 9
+
+
+def _strategies(value):
+    strategies = [value] if isinstance(value, str) else list(value or [])
+    unknown = [s for s in strategies if s not in STRATEGIES]
+    if unknown:
+        raise ValueError(f"Unknown imputation strategy {unknown[0]!r}; expected one of {', '.join(STRATEGIES)}")
+    return strategies
+
+
+def imputable_columns(df, keys=(), time_col=None):
+    """Data columns that can be imputed: not QC flags, group keys, dates or derived month labels."""
+    return [
+        c for c in df.columns
+        if not str(c).startswith("_qc_") and c not in keys and c != time_col
+        and not str(c).endswith("_yyyy_mm") and not pd.api.types.is_datetime64_any_dtype(df[c])
+    ]
+
+
+def settings(df, config=None, chunked=False):
+    """
+    (group keys, time column, {column: strategies}, max_gap) for `df` from
+    the `imputation` config section. Group keys the frame lacks are
+    ignored; the time column defaults to the first date column.
+    """
+    cfg = (config or {}).get("imputation", {}) or {}
+    keys = [c for c in cfg.get("group_by", DEFAULT_GROUP_BY) if c in df.columns]
+    time_col = cfg.get("time_column")
+    if time_col not in df.columns:
+        time_col = next((c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])), None)
+    default = _strategies(cfg.get("strategy", DEFAULT_STRATEGY))
+    overrides = cfg.get("columns", {}) or {}
+    columns = {}
+    for col in imputable_columns(df, keys, time_col):
+        strategies = _strategies(overrides.get(col, default))
+        columns[col] = [s for s in strategies if s in CHUNKED_STRATEGIES] if chunked else strategies
+    return keys, time_col, columns, cfg.get("max_gap", DEFAULT_MAX_GAP)
+
+
+def _group_ids(df, keys):
+    """Group id per row; combined from category codes when every key is categorical (ids need not be dense)."""
+    sizes = [len(df[k].cat.categories) + 1 if isinstance(df[k].dtype, pd.CategoricalDtype) else 0 for k in keys]
+    if all(sizes) and np.prod(sizes, dtype="float64") < 2 ** 62:
+        group = np.zeros(len(df), dtype="int64")
+        for k, size in zip(keys, sizes):
+            group = group * size + df[k].cat.codes.to_numpy() + 1  # code -1 (missing) becomes 0
+        return group
+    return df.groupby(keys, sort=False, dropna=False, observed=True).ngroup().to_numpy()
+
+
+def _positions(df, keys, time_col):
+    """Group id and time (days, or row number without a time column) per row, and the rows sorted by both."""
+    n = len(df)
+    group = _group_ids(df, keys) if keys else np.zeros(n, dtype="int64")
+    if time_col:
+        t = df[time_col].to_numpy(dtype="datetime64[ns]")
+        days = t.astype("int64") / NANOS_PER_DAY
+        days[np.isnat(t)] = np.nan
+    else:
+        days = np.arange(n, dtype="float64")
+    return group, days, np.lexsort((days, group))
+
+
+def _neighbours(group, observed):
+    """Positions of the previous and next observed row of the same group (-1 if none), rows sorted by group."""
+    n = len(group)
+    pos = np.arange(n)
+    prev = np.maximum.accumulate(np.where(observed, pos, -1))
+    nxt = np.minimum.accumulate(np.where(observed, pos, n)[::-1])[::-1]
+    prev[(prev >= 0) & (group[np.maximum(prev, 0)] != group)] = -1
+    nxt[nxt == n] = -1
+    nxt[(nxt >= 0) & (group[np.maximum(nxt, 0)] != group)] = -1
+    return prev, nxt
+
+
+def _carry_lookup(df, keys, group, carry, col):
+    """Per-row (value, time) of the last observation of `col` in earlier chunks of the row's group."""
+    n = len(df)
+    if carry is None or col not in carry or not len(carry[col]):
+        return np.full(n, None, dtype=object), np.full(n, np.nan)
+    previous = carry[col]
+    if keys:
+        _, first, group = np.unique(group, return_index=True, return_inverse=True)
+        groups = df[keys].iloc[first].reset_index(drop=True)
+        groups = groups.astype(object).merge(previous.astype({k: object for k in keys}), on=keys, how="left")
+    else:
+        groups = previous.iloc[[0]].reset_index(drop=True)
+    return groups["value"].to_numpy(dtype=object)[group], groups["time"].to_numpy(dtype="float64")[group]
+
+
+def _next_carry(df, keys, order, g, t, observed, previous, s, shift):
+    """
+    Last observation (value, time) per group of column `s`, over `previous`
+    and this chunk. Without a time column times are row numbers, shifted
+    by the chunk length so they stay relative to the next chunk.
+    """
+    seen = np.flatnonzero(observed)
+    last = seen[np.append(g[seen][1:] != g[seen][:-1], True)]
+    rows = order[last]
+    latest = pd.DataFrame({k: df[k].to_numpy(dtype=object)[rows] for k in keys})
+    latest["value"] = s.to_numpy(dtype=object)[rows]
+    latest["time"] = t[last]
+    if previous is not None and len(previous):
+        latest = pd.concat([previous, latest], ignore_index=True)
+    latest = latest.sort_values("time", kind="stable")
+    latest = latest.drop_duplicates(keys, keep="last") if keys else latest.tail(1)
+    latest["time"] -= shift
+    return latest.reset_index(drop=True)
+
+
+def _impute(df, keys, time_col, columns, max_gap, carry=None):
+    """
+    Fill the missing values of `columns` ({column: strategies, tried in
+    order}) within groups of `keys`, in time order. Only originally
+    observed values are used as sources. Returns (df, codes, carry): the
+    per-cell strategy codes and, when `carry` is given (chunked modes),
+    the last observation of each column per group for the next chunk.
+    """
+    n = len(df)
+    codes = pd.DataFrame({c: np.zeros(n, dtype="uint8") for c in columns}, index=df.index)
+    next_carry = {} if carry is not None else None
+    targets = [c for c, strategies in columns.items() if strategies or next_carry is not None]
+    if not n or not targets:
+        return df, codes, (carry if next_carry is not None else None)
+
+    group, days, order = _positions(df, keys, time_col)
+    g, t = group[order], days[order]
+    timed = np.isfinite(t)
+    for col in targets:
+        s = df[col]
+        missing = s.isna().to_numpy()
+        numeric = pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s)
+        observed = ~missing[order] & timed
+        prev, nxt = _neighbours(g, observed)
+
+        if next_carry is not None:
+            next_carry[col] = _next_carry(df, keys, order, g, t, observed, carry.get(col), s, shift=0 if time_col else n)
+        if not missing.any() or not columns[col]:
+            continue
+
+        todo = missing[order]
+        fill_from = np.full(n, -1)
+        base = dtypes.to_float64(s) if numeric else None
+        values = base[order] if numeric else None
+        filled_values = np.full(n, np.nan)
+        from_carry = np.zeros(n, dtype=bool)
+        code = np.zeros(n, dtype="uint8")
+        for strategy in columns[col]:
+            if not todo.any():
+                break
+            if strategy == "locf":
+                ok = todo & timed & (prev >= 0)
+                ok[ok] = t[ok] - t[prev[ok]] <= max_gap
+                fill_from[ok] = prev[ok]
+                if carry is not None:
+                    carry_value, carry_time = _carry_lookup(df, keys, group, carry, col)
+                    carry_value, carry_time = carry_value[order], carry_time[order]
+                    late = todo & ~ok & timed & (prev < 0) & (t - carry_time <= max_gap) & (carry_time <= t)
+                    from_carry |= late
+                    ok |= late
+            elif not numeric:
+                continue  # interpolation and medians need numbers
+            elif strategy == "interpolate":
+                ok = todo & timed & (prev >= 0) & (nxt >= 0)
+                p, q = prev[ok], nxt[ok]
+                close = (t[ok] - t[p] <= max_gap) & (t[q] - t[ok] <= max_gap)
+                span = t[q] - t[p]
+                weight = np.divide(t[ok] - t[p], span, out=np.zeros_like(span), where=span > 0)
+                ok[ok] = close
+                filled_values[ok] = (values[p] + (values[q] - values[p]) * weight)[close]
+            else:  # group_median
+                medians = pd.Series(values).groupby(g).transform("median").to_numpy()
+                ok = todo & ~np.isnan(medians)
+                filled_values[ok] = medians[ok]
+            code[ok] = STRATEGIES[strategy]
+            todo &= ~ok
+
+        if not code.any():
+            continue
+        rows = order[code > 0]
+        locf_rows = (code == STRATEGIES["locf"]) & ~from_carry
+        if numeric:
+            filled_values[locf_rows] = values[fill_from[locf_rows]]
+            if from_carry.any():
+                filled_values[from_carry] = carry_value[from_carry].astype("float64")
+            out = base.copy()  # to_numpy may share the input frame's memory
+            out[rows] = filled_values[code > 0]
+            df[col] = out.astype(s.dtype) if pd.api.types.is_float_dtype(s) else out
+        else:
+            source = np.arange(n)
+            source[order[locf_rows]] = order[fill_from[locf_rows]]
+            out = s.array.take(source)
+            if from_carry.any():
+                out = np.asarray(out, dtype=object)
+                out[order[from_carry]] = carry_value[from_carry]
+            df[col] = pd.Series(out, index=df.index)
+        column_codes = np.zeros(n, dtype="uint8")
+        column_codes[order] = code
+        codes[col] = column_codes
+    return df, codes, next_carry
+
+
+def impute_frame(df, config=None):
+    """
+    Impute `df` (in place) per the `imputation` config section; returns
+    (df, codes, meta). `codes` holds one uint8 strategy code per cell (see
+    STRATEGIES) for every imputable column.
+    """
+    keys, time_col, columns, max_gap = settings(df, config)
+    df, codes, _ = _impute(df, keys, time_col, columns, max_gap)
+    return df, codes, summary(df, config, count_codes(codes))
+
+
+def impute_chunk(df, config=None, carry=None):
+    """
+    impute_frame for one chunk of a streamed dataset: only the chunked
+    strategies (locf) apply, seeded from `carry`, the last observations
+    per group from earlier chunks. Returns (df, codes, carry).
+    """
+    keys, time_col, columns, max_gap = settings(df, config, chunked=True)
+    return _impute(df, keys, time_col, columns, max_gap, carry if carry is not None else {})
+
+
+def count_codes(codes):
+    """{(column, strategy): cells filled} from a codes frame (adds up across chunks in a Counter)."""
+    names = {code: name for name, code in STRATEGIES.items()}
+    counts = {}
+    for col in codes.columns:
+        values, n = np.unique(codes[col].to_numpy(), return_counts=True)
+        counts.update({(col, names[int(v)]): int(k) for v, k in zip(values, n) if v})
+    return counts
+
+
+def summary(df, config, filled, chunked=False):
+    """Imputation metadata for the cleaning summary; `filled` is {(column, strategy): cells}."""
+    keys, time_col, columns, max_gap = settings(df, config, chunked)
+    nested = {}
+    for (col, strategy), k in filled.items():
+        nested.setdefault(col, {})[strategy] = int(k)
+    return {"group_by": keys, "time_column": time_col, "max_gap": max_gap, "strategies": columns, "filled": nested}
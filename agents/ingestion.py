@@ -1,36 +1,50 @@
 import os
-import pandas as pd
-import httpx
+from agents import download, dtypes, schema_profile
 
-def load_dataset(source_config, output_dir):
-    dtype = source_config.get("type", "file")
-    location = source_config["location"]
-
-    if dtype == "file":
-        df = pd.read_csv(location)
-    elif dtype == "url":
-        r = httpx.get(location)
-        r.raise_for_status()
-        import io
-        df = pd.read_csv(io.BytesIO(r.content))
-    else:
-        raise ValueError(f"Unknown dataset source type: {dtype}")
-
-    raw_path = os.path.join(output_dir, "raw.csv")
-    df.to_csv(raw_path, index=False)
-    # New: ingestion summary 
-    dataset_name = os.path.basename(location)
+def write_ingestion_summary(output_dir, dataset_name, shape, columns, preview):
     summary_path = os.path.join(output_dir, "01_ingestion_summary.md")
     with open(summary_path, "w", encoding="utf-8") as f:
         f.write(f"# Ingestion Summary\n\n")
         f.write(f"- **Dataset name:** `{dataset_name}`\n")
-        f.write(f"- **Rows x Cols:** {df.shape[0]} x {df.shape[1]}\n")
-        f.write(f"- **Columns:** {', '.join(map(str, df.columns))}\n\n")
+        f.write(f"- **Rows x Cols:** {shape[0]} x {shape[1]}\n")
+        f.write(f"- **Columns:** {', '.join(map(str, columns))}\n\n")
         try:
             f.write("## Preview (first 5 rows)\n\n")
-            f.write(df.head(5).to_markdown(index=False))
+            f.write(preview.to_markdown(index=False))
             f.write("\n")
         except Exception:
             pass
+    return summary_path
+
+
+def load_frame(source_config, output_dir, profile=None, config=None):
+    """
+    Load the configured source into a DataFrame; returns (df, meta).
+    Local files, and URLs once streamed to the download cache (see
+    download.fetch_source), are read with the delimiter and dtypes cached
+    in the source's schema profile, when given. The frame's dtypes are then
+    compacted (dtypes.optimize_frame, per the `memory` section of `config`).
+    """
+    dtype = source_config.get("type", "file")
+    location = source_config["location"]
+
+    if dtype == "file":
+        df = schema_profile.read_csv(location, profile)
+    elif dtype == "url":
+        df = schema_profile.read_csv(download.fetch_source(source_config, config), profile)
+    else:
+        raise ValueError(f"Unknown dataset source type: {dtype}")
 
+    dataset_name = os.path.basename(location)
+    summary_path = write_ingestion_summary(output_dir, dataset_name, df.shape, df.columns, df.head(5))
+    df, memory = dtypes.optimize_frame(df, config)
+
+    meta = {"dataset_name": dataset_name, "rows": len(df), "summary": summary_path, "memory": memory}
+    return df, meta
+
+
+def load_dataset(source_config, output_dir):
+    df, _ = load_frame(source_config, output_dir)
+    raw_path = os.path.join(output_dir, "raw.csv")
+    df.to_csv(raw_path, index=False)
     return raw_path
@@ -1,6 +1,6 @@
-from .ingestion import load_dataset
-from .standardization import standardize_data
-from .cleaning import clean_data
-from .transformation import transform_data
-from .insights import generate_insights
+from .ingestion import load_dataset, load_frame
+from .standardization import standardize_data, standardize_frame
+from .cleaning import clean_data, clean_frame
+from .transformation import transform_data, transform_frame
+from .insights import generate_insights, insights_frame
 from .logging_agent import log_event
\ No newline at end of file
@@ -1,54 +1,251 @@
 import os
+import re
 import json
+import threading
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from tabulate import tabulate
+from agents import quality
+from agents.artifacts import read_artifact
 
+CHARTS_DIR = "charts"
+CHART_DPI = 110
+DEFAULT_BINS = 20
+DEFAULT_TOP_VALUES = 5
+DEFAULT_CHART_PROCESSES = max(1, min(4, os.cpu_count() or 1))
+# Below this many charts, drawing in-process beats starting worker processes.
+PARALLEL_MIN_CHARTS = 4
 
-def _iqr_outlier_counts(s: pd.Series):
-    s = pd.to_numeric(s, errors="coerce").dropna()
-    if s.empty:
-        return 0
-    q1, q3 = s.quantile(0.25), s.quantile(0.75)
-    iqr = q3 - q1
-    if iqr == 0:
-        return 0
-    lower, upper = q1 - 1.5*iqr, q3 + 1.5*iqr
-    return int(((s < lower) | (s > upper)).sum())
+_pool = None
+_pool_size = 0
+_pool_lock = threading.Lock()
 
 
-def generate_insights(transformed_path, config, output_dir):
-    df = pd.read_csv(transformed_path)
-    numeric_cols = df.select_dtypes(include=["number"]).columns.tolist()
+def _outlier_table(df, profile):
+    """
+    IQR outlier counts per numeric column. Reuses the cleaning stage's
+    outlier flags (fences from the QC profile) when present, otherwise
+    profiles `df` in one batched pass.
+    """
+    flags = quality.outlier_flags(df, profile.numeric_cols) if profile is not None else None
+    if flags is not None and len(flags.columns):
+        return pd.DataFrame({"column": flags.columns, "iqr_outliers": flags.sum().astype(int).to_numpy()})
+    return quality.profile_frame(df).outlier_table()
+
+
+def _insights_config(config):
+    return (config or {}).get("insights", {}) or {}
+
+
+def chart_path(output_dir, name):
+    """charts/<name>.png in `output_dir`, with `name` reduced to a safe file name."""
+    slug = re.sub(r"[^0-9A-Za-z]+", "_", str(name)).strip("_").lower() or "chart"
+    return os.path.join(output_dir, CHARTS_DIR, f"{slug}.png")
+
+
+def column_histograms(df, numeric_cols, bins=DEFAULT_BINS):
+    """{column: (counts, edges)}, binned with NumPy over the finite values."""
+    hists = {}
+    for col in numeric_cols:
+        values = df[col].to_numpy(dtype="float64", na_value=np.nan)
+        values = values[np.isfinite(values)]
+        hists[col] = np.histogram(values, bins=bins) if values.size else (np.zeros(bins), np.linspace(0, 1, bins + 1))
+    return hists
+
+
+def group_histograms(df, group_col, hists):
+    """
+    {group value: {column: (counts, edges)}} on the dataset-wide bin edges
+    of `hists`; one bincount per column covers every group.
+    """
+    groups = df[group_col].astype("category")
+    codes = groups.cat.codes.to_numpy().astype("int64")
+    names = list(groups.cat.categories)
+    out = {name: {} for name in names}
+    for col, (_, edges) in hists.items():
+        bins = len(edges) - 1
+        values = df[col].to_numpy(dtype="float64", na_value=np.nan)
+        ok = np.isfinite(values) & (codes >= 0)
+        # np.histogram's last bin is closed on the right.
+        idx = np.clip(np.searchsorted(edges, values[ok], side="right") - 1, 0, bins - 1)
+        counts = np.bincount(codes[ok] * bins + idx, minlength=len(names) * bins).reshape(len(names), bins)
+        for i, name in enumerate(names):
+            out[name][col] = (counts[i], edges)
+    return out
+
+
+def _render_chart(path, title, panels):
+    """Draw one chart of pre-binned histograms [(name, counts, edges)] to `path`."""
+    from matplotlib.figure import Figure  # deferred: matplotlib is slow to import
+
+    ncols = min(3, len(panels))
+    nrows = (len(panels) + ncols - 1) // ncols
+    width, height = 4 * ncols, 3.2 * nrows
+    fig = Figure(figsize=(width, height))
+    axes = fig.subplots(nrows, ncols, squeeze=False).flat
+    for (name, counts, edges), ax in zip(panels, axes):
+        ax.stairs(counts, edges, fill=True)
+        ax.set_title(name)
+        ax.grid(True)
+    for ax in axes:
+        ax.set_visible(False)
+    if title:
+        fig.suptitle(title)
+    # Fixed margins: tight_layout measures every tick label and costs as much as drawing.
+    fig.subplots_adjust(left=0.6 / width, right=1 - 0.15 / width, bottom=0.35 / height,
+                        top=1 - (0.6 if title else 0.35) / height, wspace=0.3, hspace=0.45)
+    fig.savefig(path, dpi=CHART_DPI)
+    return path
+
+
+def _init_chart_worker():
+    os.environ["MPLBACKEND"] = "Agg"
+    import matplotlib.figure  # noqa: F401  (import once per worker, not per chart)
+
+
+def _chart_pool(processes):
+    """Process pool for chart rendering, started on first use and reused by later runs."""
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(processes, mp_context=mp.get_context("spawn"), initializer=_init_chart_worker)
+            _pool_size = processes
+        return _pool
+
+
+def render_charts(charts, processes=DEFAULT_CHART_PROCESSES):
+    """
+    Render [(path, title, panels)] charts; returns their paths. Several
+    charts are drawn in parallel worker processes (at most one per CPU)
+    with the Agg backend; a few charts, or charts requested from inside a
+    worker process (batch runs), are drawn in-process.
+    """
+    global _pool
+    processes = min(processes, os.cpu_count() or 1)
+    for path, _, _ in charts:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    if processes <= 1 or len(charts) < PARALLEL_MIN_CHARTS or mp.parent_process() is not None:
+        return [_render_chart(*chart) for chart in charts]
+    try:
+        return list(_chart_pool(processes).map(_render_chart, *zip(*charts)))
+    except BrokenProcessPool:
+        with _pool_lock:
+            _pool = None
+        return [_render_chart(*chart) for chart in charts]
+
+
+def histogram_charts(hists, output_dir, groups=None, group_col=None):
+    """Chart specs: one per column, plus one per group value when `groups` is given."""
+    charts = [(chart_path(output_dir, f"dist_{col}"), None, [(col, *h)]) for col, h in hists.items()]
+    for value, panels in (groups or {}).items():
+        charts.append((chart_path(output_dir, f"{group_col}_{value}"), f"{group_col}: {value}",
+                       [(col, *h) for col, h in panels.items()]))
+    return charts
+
+
+def render_distributions(df, output_dir, config=None):
+    """
+    Histogram chart per numeric column (and, with `insights.charts_by`, one
+    chart per value of that column, e.g. per district); returns the chart
+    paths. Bins are computed with NumPy up front, so only the binned counts
+    reach Matplotlib.
+    """
+    cfg = _insights_config(config)
+    numeric_cols = quality.numeric_columns(df)
+    if not numeric_cols:
+        return []
+    hists = column_histograms(df, numeric_cols, cfg.get("bins", DEFAULT_BINS))
+    group_col = cfg.get("charts_by")
+    groups = group_histograms(df, group_col, hists) if group_col in df.columns else None
+    charts = histogram_charts(hists, output_dir, groups, group_col)
+    return render_charts(charts, cfg.get("chart_processes", DEFAULT_CHART_PROCESSES))
+
+
+def top_values(series, n=DEFAULT_TOP_VALUES):
+    """(top `n` value counts including missing, number of distinct values), in one pass."""
+    counts = series.value_counts(dropna=False, sort=False)
+    counts = counts[counts > 0]
+    return counts.nlargest(n), int(counts.index.notna().sum())
+
+
+def chart_note(numeric_cols, output_dir):
+    """Summary line pointing at the distribution charts render_distributions writes."""
+    paths = [os.path.relpath(chart_path(output_dir, f"dist_{c}"), output_dir) for c in numeric_cols]
+    return f"**Distribution charts saved:** {', '.join(f'`{p}`' for p in paths)}\n" if paths else ""
+
+
+TOP_ANOMALIES = 5
+
+
+def trends_section(rollups):
+    """
+    Markdown for the "Trends and Anomalies" section, read straight from the
+    rollup tables (aggregation.load_rollups); empty if there are none.
+    """
+    monthly, seasonal, anomalies = (rollups or {}).get("monthly"), (rollups or {}).get("seasonal"), (rollups or {}).get("anomalies")
+    if monthly is None or monthly.empty:
+        return ""
+    measures = [c for c in monthly.columns if c not in ("level", "period", "rows") and monthly[c].dtype.kind in "fiu"]
+    lines = ["## Trends and Anomalies\n"]
+
+    overall = monthly[monthly["level"] == "all"].set_index("period")[measures]
+    overall.index = overall.index.strftime("%Y-%m")
+    lines += ["### Monthly totals (additive measures) and means\n", overall.to_markdown(floatfmt=".2f"), ""]
+
+    if seasonal is not None and not seasonal.empty:
+        seasons = seasonal[seasonal["level"] == "all"].set_index(["season_year", "season"])[measures]
+        lines += ["### By season\n", seasons.to_markdown(floatfmt=".2f"), ""]
+
+    if anomalies is not None and not anomalies.empty:
+        coarsest = next((lvl for lvl in anomalies["level"].cat.categories if lvl != "all"), None)
+        rain = anomalies[(anomalies["level"] == coarsest) & anomalies["category"].notna()]
+        if not rain.empty:
+            latest = rain[rain["period"] == rain["period"].max()].sort_values("departure_pct")
+            cols = [coarsest, "measure", "actual", "normal", "departure_pct", "category", "basis"]
+            month = latest["period"].iloc[0].strftime("%Y-%m")
+            lines += [f"### Departure from normal, {month}: most deficient {coarsest}s\n",
+                      latest[cols].head(TOP_ANOMALIES).to_markdown(index=False, floatfmt=".1f"), ""]
+            lines += [f"### Departure from normal, {month}: most excess {coarsest}s\n",
+                      latest[cols].tail(TOP_ANOMALIES).iloc[::-1].to_markdown(index=False, floatfmt=".1f"), ""]
+            if (latest["basis"] == "peers").any():
+                lines.append(f"_Normals marked `peers` are the mean over all {coarsest}s that month, "
+                             "used until there are enough years of history._\n")
+    return "\n".join(lines) + "\n"
+
+
+def write_insights_report(df, config, output_dir, profile=None, rollups=None):
+    """
+    Write summary.md for `df`; returns its path. `profile` is the cleaning
+    stage's QCProfile, reused instead of recomputing quantiles; `rollups`
+    (aggregation tables) add the trends and anomalies section.
+    """
+    n_top = _insights_config(config).get("top_values", DEFAULT_TOP_VALUES)
+    numeric_cols = quality.numeric_columns(df)
     categorical_cols = df.select_dtypes(include=["object", "category"]).columns.tolist()
-    summary_stats = df.describe(include="all").transpose()
+    summary_stats = df[numeric_cols].describe().transpose() if numeric_cols else pd.DataFrame()
 
     missing = df.isna().sum().rename("missing_count").to_frame()
     missing["missing_pct"] = (missing["missing_count"] / max(len(df), 1) * 100).round(2)
 
-    outliers = []
-    for c in numeric_cols:
-        outliers.append({"column": c, "iqr_outliers": _iqr_outlier_counts(df[c])})
-    outlier_df = pd.DataFrame(outliers) if outliers else pd.DataFrame(columns=["column", "iqr_outliers"])
+    outlier_df = _outlier_table(df, profile)
 
+    # One value_counts per text column serves both the stats table and the top values.
     categorical_summary = {}
+    categorical_stats = []
     for c in categorical_cols:
-        top_vals = df[c].value_counts(dropna=False).head(5)
+        top_vals, distinct = top_values(df[c], n_top)
         categorical_summary[c] = top_vals
-    
-    numeric_plot_paths = []
-    if numeric_cols:
-        plt.figure(figsize=(12, 6))
-        df[numeric_cols].hist(bins=20, figsize=(12, 8))
-        plot_path = os.path.join(output_dir, "numeric_distributions.png")
-        plt.tight_layout()
-        plt.savefig(plot_path, dpi=150)
-        plt.close()
-        numeric_plot_paths.append(plot_path)
-    else:
-        numeric_plot_paths = []
-
- 
+        top = top_vals[top_vals.index.notna()]
+        categorical_stats.append({
+            "column": c, "count": int(len(df) - missing.at[c, "missing_count"]), "distinct": distinct,
+            "top": top.index[0] if len(top) else None, "freq": int(top.iloc[0]) if len(top) else 0,
+        })
+
     summary_md = os.path.join(output_dir, "summary.md")
     with open(summary_md, "w", encoding="utf-8") as f:
         f.write("# Dataset Summary & Insights\n\n")
@@ -70,6 +267,9 @@ def generate_insights(transformed_path, config, output_dir):
         f.write("## Summary Statistics\n\n")
         try:
             f.write(tabulate(summary_stats, headers="keys", tablefmt="github"))
+            if categorical_stats:
+                f.write("\n\n")
+                f.write(pd.DataFrame(categorical_stats).to_markdown(index=False))
         except Exception:
             f.write("Could not render summary statistics.\n")
         f.write("\n\n")
@@ -84,13 +284,24 @@ def generate_insights(transformed_path, config, output_dir):
             f.write("\n\n")
 
         if categorical_summary:
-            f.write("## Categorical Columns Value Counts (Top 5)\n\n")
+            f.write(f"## Categorical Columns Value Counts (Top {n_top})\n\n")
             for c, counts in categorical_summary.items():
                 f.write(f"### Column: {c}\n\n")
                 f.write(counts.to_frame(name="count").to_markdown())
                 f.write("\n\n")
 
-        if numeric_plot_paths:
-            f.write(f"**Numeric distributions plot saved:** `{os.path.basename(numeric_plot_paths[0])}`\n")
+        f.write(trends_section(rollups))
+
+        f.write(chart_note(numeric_cols, output_dir))
 
-    return summary_md, numeric_plot_paths
+    return summary_md
+
+
+def insights_frame(df, config, output_dir, profile=None):
+    """Write summary.md and distribution plots for `df`; returns (summary_md, plot_paths)."""
+    plot_paths = render_distributions(df, output_dir, config)
+    return write_insights_report(df, config, output_dir, profile), plot_paths
+
+
+def generate_insights(transformed_path, config, output_dir):
+    return insights_frame(read_artifact(transformed_path), config, output_dir)
@@ -1,16 +1,233 @@
 import os
 import json
+import time
+import asyncio
+import hashlib
+import threading
 from dotenv import load_dotenv
-import google.generativeai as genai
+from agents import logging_agent
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 DEFAULT_GEMINI_MODEL = "gemini-1.5-flash"
 
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
-else:
-    print("[ERROR] Gemini API key not found. Please set GEMINI_API_KEY in .env")
+_genai = None
+_genai_lock = threading.Lock()
+
+
+def genai():
+    """google.generativeai, imported and configured on first use (it takes about a second to import)."""
+    global _genai
+    with _genai_lock:
+        if _genai is None:
+            import google.generativeai
+
+            if GEMINI_API_KEY:
+                google.generativeai.configure(api_key=GEMINI_API_KEY)
+            else:
+                print("[ERROR] Gemini API key not found. Please set GEMINI_API_KEY in .env")
+            _genai = google.generativeai
+        return _genai
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_TIMEOUT_S = 30
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_S = 0.5
+DEFAULT_CACHE_DIR = ".llm_cache"
+
+
+class ResponseCache:
+    """Persistent LLM response cache keyed on (provider, model, prompt hash, temperature)."""
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(provider_name, model_name, prompt, temperature):
+        prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        payload = json.dumps([provider_name, model_name, prompt_hash, temperature])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + ".json")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)["text"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key, text):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"text": text}, f)
+        os.replace(tmp, path)
+
+
+class GeminiProvider:
+    """Gemini backend; the GenerativeModel is created once and reused."""
+
+    name = "gemini"
+    cacheable = True
+
+    def __init__(self, model_name, temperature=None):
+        self.model_name = model_name
+        self.temperature = temperature
+        self._model = None
+
+    @property
+    def configured(self):
+        return bool(GEMINI_API_KEY)
+
+    async def generate(self, prompt):
+        if self._model is None:
+            self._model = genai().GenerativeModel(self.model_name)
+        generation_config = {"temperature": self.temperature} if self.temperature is not None else None
+        response = await self._model.generate_content_async(prompt, generation_config=generation_config)
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            logging_agent.count("llm.tokens.prompt", getattr(usage, "prompt_token_count", 0) or 0)
+            logging_agent.count("llm.tokens.completion", getattr(usage, "candidates_token_count", 0) or 0)
+        return response.text if response and response.text else "No response from Gemini."
+
+
+class StubProvider:
+    """Offline backend that answers instantly and deterministically (tests, dry runs)."""
+
+    name = "stub"
+    configured = True
+    # Canned answers are cheap and must never be mistaken for real ones.
+    cacheable = False
+
+    def __init__(self, model_name, temperature=None):
+        self.model_name = model_name
+        self.temperature = temperature
+
+    async def generate(self, prompt):
+        first_line = next((line.strip() for line in prompt.splitlines() if line.strip()), "")
+        text = f"[stub:{self.model_name}] {first_line[:120]}"
+        # Whitespace-separated words stand in for tokens.
+        logging_agent.count("llm.tokens.prompt", len(prompt.split()))
+        logging_agent.count("llm.tokens.completion", len(text.split()))
+        return text
+
+
+PROVIDERS = {"gemini": GeminiProvider, "stub": StubProvider}
+
+
+class _LoopThread:
+    """One background event loop shared by all clients, so sync callers on any thread can await."""
+
+    _lock = threading.Lock()
+    _loop = None
+
+    @classmethod
+    def loop(cls):
+        with cls._lock:
+            if cls._loop is None:
+                cls._loop = asyncio.new_event_loop()
+                threading.Thread(target=cls._loop.run_forever, name="llm-loop", daemon=True).start()
+            return cls._loop
+
+
+# Optional cross-process limit on in-flight LLM calls (a multiprocessing
+# semaphore shared by batch workers); see set_global_limit.
+_global_slots = None
+
+
+def set_global_limit(semaphore):
+    """Make every client in this process also hold a slot of `semaphore` while calling the provider."""
+    global _global_slots
+    _global_slots = semaphore
+
+
+class AsyncLLMClient:
+    """
+    asyncio LLM client: reuses one provider (and its model/connection), caps
+    in-flight calls at `concurrency`, applies a per-call timeout, retries
+    with exponential backoff and serves repeated prompts from a persistent
+    response cache.
+    """
+
+    def __init__(self, provider, concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT_S,
+                 max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF_S, cache=None):
+        self.provider = provider
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+        self._semaphore = None
+
+    @classmethod
+    def from_config(cls, llm_cfg: dict):
+        llm_cfg = llm_cfg or {}
+        provider_cls = PROVIDERS[llm_cfg.get("provider", "gemini")]
+        provider = provider_cls(llm_cfg.get("model") or DEFAULT_GEMINI_MODEL, llm_cfg.get("temperature"))
+        cache_dir = llm_cfg.get("cache_dir", DEFAULT_CACHE_DIR)
+        return cls(
+            provider,
+            concurrency=llm_cfg.get("concurrency", DEFAULT_CONCURRENCY),
+            timeout=llm_cfg.get("timeout_s", DEFAULT_TIMEOUT_S),
+            max_retries=llm_cfg.get("max_retries", DEFAULT_MAX_RETRIES),
+            backoff=llm_cfg.get("backoff_s", DEFAULT_BACKOFF_S),
+            cache=ResponseCache(cache_dir) if cache_dir else None,
+        )
+
+    async def complete(self, prompt: str) -> str:
+        key = None
+        if self.cache is not None and self.provider.cacheable:
+            key = ResponseCache.key(self.provider.name, self.provider.model_name, prompt, self.provider.temperature)
+            cached = self.cache.get(key)
+            if cached is not None:
+                logging_agent.count("llm.cache_hits")
+                return cached
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        async with self._semaphore:
+            slots = _global_slots
+            if slots is not None:
+                # Blocking acquire, so wait on a thread rather than the shared loop.
+                waited = time.perf_counter()
+                await asyncio.get_running_loop().run_in_executor(None, slots.acquire)
+                logging_agent.observe("llm.slot_wait_s", time.perf_counter() - waited)
+            try:
+                text = await self._generate(prompt)
+            finally:
+                if slots is not None:
+                    slots.release()
+
+        if key is not None:
+            self.cache.put(key, text)
+        return text
+
+    async def _generate(self, prompt):
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                text = await asyncio.wait_for(self.provider.generate(prompt), self.timeout)
+                logging_agent.observe("llm.latency_s", time.perf_counter() - start)
+                logging_agent.count("llm.calls")
+                return text
+            except Exception:
+                logging_agent.count("llm.errors")
+                if attempt == self.max_retries:
+                    raise
+                logging_agent.count("llm.retries")
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def complete_many(self, prompts):
+        """Run prompts concurrently (bounded by `concurrency`); results keep prompt order."""
+        return await asyncio.gather(*(self.complete(p) for p in prompts), return_exceptions=True)
+
+    def run(self, coro):
+        """Run a coroutine on the shared LLM loop and block for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, _LoopThread.loop()).result()
 
 
 class LLMAgent:
@@ -26,50 +243,86 @@ class LLMAgent:
         """
         if config:
             self.config = config
-            self.model_name = config.get("llm", {}).get("model", DEFAULT_GEMINI_MODEL)
+            self.model_name = (config.get("llm") or {}).get("model") or DEFAULT_GEMINI_MODEL
         else:
             self.config = {}
             self.model_name = model_name or DEFAULT_GEMINI_MODEL
+        llm_cfg = dict(self.config.get("llm") or {}, model=self.model_name)
+        self.client = AsyncLLMClient.from_config(llm_cfg)
+        self._engines = {}
 
-    def call_gemini_llm(self, prompt: str) -> str:
-        """Calls Gemini Generative AI API."""
-        if not GEMINI_API_KEY:
+    def _fallback(self, error=None):
+        if not self.client.provider.configured:
             return "Gemini API key not configured."
+        print(f"[LLM ERROR: {self.client.provider.name}] {error}")
+        return "LLM unavailable, using fallback response."
+
+    async def _ask(self, prompt: str) -> str:
+        if not self.client.provider.configured:
+            return self._fallback()
         try:
-            model = genai.GenerativeModel(self.model_name)
-            response = model.generate_content(prompt)
-            return response.text if response and response.text else "No response from Gemini."
+            return await self.client.complete(prompt)
         except Exception as e:
-            print(f"[LLM ERROR: Gemini] {e}")
-            return "LLM unavailable, using fallback response."
+            return self._fallback(e)
+
+    async def ask_async(self, prompt: str) -> str:
+        """Awaitable ask() usable from any event loop; errors become the usual fallback text."""
+        future = asyncio.run_coroutine_threadsafe(self._ask(prompt), _LoopThread.loop())
+        return await asyncio.wrap_future(future)
+
+    def call_gemini_llm(self, prompt: str) -> str:
+        """Calls the configured LLM provider (Gemini by default), blocking for the answer."""
+        return self.client.run(self._ask(prompt))
 
     def ask(self, prompt: str) -> str:
         """Ask Gemini a general question."""
         return self.call_gemini_llm(prompt)
 
+    def ask_many(self, prompts) -> list:
+        """Ask several questions concurrently; answers keep prompt order."""
+        async def gather():
+            return await asyncio.gather(*(self._ask(p) for p in prompts))
+        return self.client.run(gather())
+
     def cleaning_suggestions(self, sample_data) -> str:
         """Ask Gemini for cleaning suggestions given a sample of raw data."""
         prompt = (
             f"Suggest data cleaning steps for this data sample:\n"
-            f"{json.dumps(sample_data, indent=2)}"
+            f"{json.dumps(sample_data, indent=2, default=str)}"
         )
         return self.ask(prompt)
 
     def answer_question(self, user_question: str, transformed_path: str) -> str:
-        """Ask Gemini a question about the transformed dataset."""
-        try:
-            with open(transformed_path, "r", encoding="utf-8") as f:
-                data_snippet = "".join([next(f) for _ in range(20)])
-        except Exception as e:
-            print(f"[ERROR] Could not read transformed data: {e}")
-            data_snippet = ""
+        """
+        Answer a question about the transformed dataset from a query engine
+        kept resident per path; Gemini is only asked about questions the
+        engine can't map.
+        """
+        from agents import aggregation, query_engine
+        from agents.artifacts import read_artifact
 
-        prompt = f"Data snippet:\n{data_snippet}\n\nQuestion: {user_question}"
-        return self.ask(prompt)
+        engine = self._engines.get(transformed_path)
+        if engine is None:
+            try:
+                rollups = aggregation.load_rollups(os.path.dirname(transformed_path))
+                engine = query_engine.QueryEngine(read_artifact(transformed_path), rollups=rollups)
+            except Exception as e:
+                print(f"[ERROR] Could not read transformed data: {e}")
+                return self.ask(f"Question: {user_question}")
+            self._engines[transformed_path] = engine
+        phrase = (self.config.get("query", {}) or {}).get("phrase_with_llm", False)
+        return query_engine.answer(engine, user_question, self, phrase_with_llm=phrase)
+
+
+_agents = {}
+_agents_lock = threading.Lock()
 
 
 # Keep backward-compatible function for cleaning.py
 def call_llm_for_cleaning_suggestions(sample_data, config: dict) -> str:
-    """Compatibility wrapper for cleaning agent."""
-    agent = LLMAgent(config)
-    return agent.cleaning_suggestions(sample_data)
+    """Compatibility wrapper for cleaning agent; reuses one LLMAgent per llm config."""
+    agent_key = json.dumps((config or {}).get("llm", {}), sort_keys=True, default=str)
+    with _agents_lock:
+        if agent_key not in _agents:
+            _agents[agent_key] = LLMAgent(config)
+    return _agents[agent_key].cleaning_suggestions(sample_data)
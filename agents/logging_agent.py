@@ -1,8 +1,324 @@
 import os
+import sys
+import json
+import time
+import atexit
+import functools
+import pstats
+import cProfile
+import resource
+import threading
+from collections import Counter
+from contextlib import contextmanager
 from datetime import datetime
 
-def log_event(message, output_dir):
-    logfile = os.path.join(output_dir, "run.log")
-    with open(logfile, "a") as f:
-        timestamp = datetime.now().isoformat()
-        f.write(f"[{timestamp}] {message}\n")
+# Buffered events are written out once this many accumulate (and on flush/exit).
+FLUSH_EVERY = 50
+PERFORMANCE_REPORT = "performance_report.json"
+EVENTS_FILE = "events.jsonl"
+DEFAULT_SAMPLE_INTERVAL_MS = 5
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class RunLog:
+    """
+    Structured log of one run (one output dir): run.log lines plus an
+    events.jsonl stream, both buffered, and counters/observations (rows,
+    bytes, cache hits, LLM latency/tokens) summarized in the performance
+    report.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.started = time.time()
+        self.counters = Counter()
+        self.observations = {}
+        self.stages = []
+        self.reported = False
+        self._lines = []
+        self._events = []
+        self._lock = threading.Lock()
+
+    def event(self, kind, message=None, **fields):
+        now = datetime.now().isoformat()
+        record = {"ts": now, "event": kind, **fields}
+        if message is not None:
+            record["message"] = message
+        with self._lock:
+            if message is not None:
+                self._lines.append(f"[{now}] {message}\n")
+            self._events.append(json.dumps(record, default=str) + "\n")
+            if len(self._events) >= FLUSH_EVERY:
+                self._flush_locked()
+
+    def count(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, name, value):
+        with self._lock:
+            self.observations.setdefault(name, []).append(value)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not (self._lines or self._events) or not os.path.isdir(self.output_dir):
+            return
+        if self._lines:
+            with open(os.path.join(self.output_dir, "run.log"), "a") as f:
+                f.writelines(self._lines)
+        if self._events:
+            with open(os.path.join(self.output_dir, EVENTS_FILE), "a", encoding="utf-8") as f:
+                f.writelines(self._events)
+        self._lines, self._events = [], []
+
+    def report(self):
+        with self._lock:
+            observations = {name: _summarize(values) for name, values in self.observations.items()}
+            return {
+                "wall_seconds": round(time.time() - self.started, 6),
+                "peak_rss_mb": _peak_rss_mb(),
+                "stages": list(self.stages),
+                "counters": dict(self.counters),
+                "observations": observations,
+            }
+
+
+def _summarize(values):
+    ordered = sorted(values)
+    n = len(ordered)
+    return {
+        "count": n,
+        "total": round(sum(ordered), 6),
+        "mean": round(sum(ordered) / n, 6),
+        "p50": round(ordered[n // 2], 6),
+        "p95": round(ordered[min(n - 1, int(n * 0.95))], 6),
+        "max": round(ordered[-1], 6),
+    }
+
+
+_runs = {}
+_runs_lock = threading.Lock()
+_active = None
+
+
+def get_run(output_dir=None):
+    """RunLog for `output_dir` (created on first use), or for the active run when omitted."""
+    global _active
+    output_dir = output_dir or _active
+    if output_dir is None:
+        return None
+    with _runs_lock:
+        if output_dir not in _runs:
+            _runs[output_dir] = RunLog(output_dir)
+        if _active is None:
+            _active = output_dir
+        return _runs[output_dir]
+
+
+def start_run(output_dir):
+    """Make `output_dir` the run that counters from shared components (LLM client, caches) go to."""
+    global _active
+    run = get_run(output_dir)
+    _active = output_dir
+    return run
+
+
+def log_event(message, output_dir, **fields):
+    """Append `message` to run.log (and a structured event with `fields` to events.jsonl)."""
+    get_run(output_dir).event(fields.pop("event", "log"), message, **fields)
+
+
+def count(name, value=1, output_dir=None):
+    run = get_run(output_dir)
+    if run is not None:
+        run.count(name, value)
+
+
+def observe(name, value, output_dir=None):
+    run = get_run(output_dir)
+    if run is not None:
+        run.observe(name, value)
+
+
+def flush(output_dir=None):
+    """
+    Write out buffered lines and events. Once the run's performance report
+    has been written its RunLog is also dropped from the registry, so
+    long-lived processes (batch workers, the service) don't keep every
+    finished run's observations in memory.
+    """
+    global _active
+    run = get_run(output_dir)
+    if run is None:
+        return
+    run.flush()
+    if run.reported:
+        with _runs_lock:
+            if _runs.get(run.output_dir) is run:
+                del _runs[run.output_dir]
+            if _active == run.output_dir:
+                _active = None
+
+
+@atexit.register
+def _flush_all():
+    for run in list(_runs.values()):
+        run.flush()
+
+
+class _SamplingProfiler:
+    """Samples one thread's stack every `interval_ms`; writes collapsed stacks (flamegraph input)."""
+
+    def __init__(self, interval_ms=DEFAULT_SAMPLE_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._target = None
+        self._thread = None
+
+    def start(self):
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="stage-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def stop(self, path_prefix):
+        self._stop.set()
+        self._thread.join()
+        path = path_prefix + ".collapsed.txt"
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.samples.most_common():
+                f.write(f"{stack} {n}\n")
+        return [path]
+
+
+# Only one cProfile profiler can be active per process on Python 3.12+
+# (sys.monitoring), so concurrent stages take turns: see _start_profiler.
+_cprofile_lock = threading.Lock()
+
+
+class _CProfiler:
+    """cProfile of the stage's thread; writes the raw .prof and a cumulative-time text summary."""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        if not _cprofile_lock.acquire(blocking=False):
+            raise RuntimeError("another stage is being profiled with cProfile")
+        try:
+            self.profile.enable()
+        except BaseException:
+            _cprofile_lock.release()
+            raise
+
+    def stop(self, path_prefix):
+        try:
+            self.profile.disable()
+        finally:
+            _cprofile_lock.release()
+        self.profile.dump_stats(path_prefix + ".prof")
+        with open(path_prefix + ".txt", "w", encoding="utf-8") as f:
+            pstats.Stats(self.profile, stream=f).sort_stats("cumulative").print_stats(40)
+        return [path_prefix + ".prof", path_prefix + ".txt"]
+
+
+PROFILERS = {"cprofile": _CProfiler, "sampling": _SamplingProfiler}
+
+
+def _warn(run, message):
+    if run is not None:
+        run.event("log", f"[WARN] {message}")
+
+
+def _start_profiler(name, stage, run):
+    """
+    Started profiler `name` for this stage's thread, or None. A stage that
+    can't have cProfile (another stage or tool holds it) is sampled
+    instead; profiling problems are logged, never raised.
+    """
+    for candidate in (name, "sampling") if name == "cprofile" else (name,):
+        prof = PROFILERS[candidate]()
+        try:
+            prof.start()
+            return prof
+        except Exception as e:
+            fallback = "sampling it instead" if candidate == "cprofile" else "not profiling it"
+            _warn(run, f"Could not profile stage {stage} with {candidate} ({e}); {fallback}")
+    return None
+
+
+@contextmanager
+def stage_timer(stage, output_dir=None, rows_in=None, profiler=None, **fields):
+    """
+    Time a stage: yields a dict the caller can add fields to (e.g.
+    `rows_out`, `cache`), then records wall and CPU time and peak RSS as a
+    "stage" event and in the performance report. `profiler` ("cprofile" or
+    "sampling") attaches that profiler to this stage's thread and writes
+    its output next to the report as profile_<stage>.*.
+    """
+    run = get_run(output_dir)
+    info = {"stage": stage, **fields}
+    if rows_in is not None:
+        info["rows_in"] = int(rows_in)
+    prof = _start_profiler(profiler, stage, run) if profiler else None
+    start, cpu_start = time.perf_counter(), time.thread_time()
+    try:
+        yield info
+    finally:
+        info["seconds"] = round(time.perf_counter() - start, 6)
+        info["cpu_seconds"] = round(time.thread_time() - cpu_start, 6)
+        info["peak_rss_mb"] = _peak_rss_mb()
+        if prof:
+            try:
+                info["profile"] = prof.stop(os.path.join(run.output_dir if run else ".", f"profile_{stage}"))
+            except Exception as e:
+                _warn(run, f"Could not write the profile of stage {stage}: {e}")
+        if run is not None:
+            with run._lock:
+                run.stages.append(info)
+            for key in ("rows_in", "rows_out"):
+                if key in info:
+                    run.count(f"{key}.{stage}", info[key])
+            run.event("stage", **info)
+
+
+def timed(stage, output_dir_attr="output_dir"):
+    """Decorator form of stage_timer for methods of objects with an output dir attribute."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            with stage_timer(stage, getattr(self, output_dir_attr, None)):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def write_performance_report(output_dir, **extra):
+    """Write performance_report.json (stage timings, counters, LLM latency) into `output_dir`."""
+    run = get_run(output_dir)
+    report = {"generated": datetime.now().isoformat(), **run.report(), **extra}
+    path = os.path.join(output_dir, PERFORMANCE_REPORT)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    run.reported = True
+    run.flush()
+    return path
@@ -1,85 +1,456 @@
 # agents/orchestrator.py
 
 import os
-from agents import ingestion, standardization, cleaning, transformation, insights, logging_agent
+import json
+import pandas as pd
+from agents import dedup, download, ingestion, standardization, cleaning, transformation, aggregation, insights, incremental, logging_agent, query_engine, streaming
+from agents.artifacts import ArtifactExporter, find_artifact, read_artifact
+from agents.cache import StageCache, frame_fingerprint, output_files
+from agents import planner, provenance, run_store
+from agents.provenance import file_checksum, save_run_metadata
+from agents.quality import QCProfile
+from agents.query_engine import QueryEngine
+from agents.schema_profile import SchemaProfile, sniff_delimiter
+from agents.scheduler import TaskGraph
+
+# Config sections each stage's output depends on (part of its cache key).
+STAGE_CONFIG_KEYS = {
+    "ingestion": ["dataset_source", "memory"],
+    "standardization": [],
+    "cleaning": ["quality", "imputation", "dedup", "memory"],
+    "transformation": ["scope"],
+    "aggregation": ["aggregation"],
+    "llm_suggestions": ["llm"],
+    "insights_charts": ["insights"],
+    "insights_report": ["aggregation", "insights"],
+}
+
+# Side files each stage writes into the output dir, replayed on a cache hit
+# (besides any files named in the stage's metadata, such as chart paths).
+STAGE_FILES = {
+    "ingestion": ["01_ingestion_summary.md"],
+    "standardization": ["schema_map.json", "02_standardization_summary.md"],
+    "cleaning": ["03_cleaning_summary.md"],
+    "transformation": ["04_transformation_summary.md"],
+    "aggregation": aggregation.rollup_files(),
+    "llm_suggestions": ["03_llm_cleaning_suggestions.md"],
+    "insights_charts": [],
+    "insights_report": ["summary.md"],
+}
+
+DEFAULT_WORKERS = 4
 
 class Orchestrator:
-    def __init__(self, llm, output_dir, config):
+    def __init__(self, llm, output_dir, config, config_path=None, workers=None):
         """
         Orchestrator manages the execution flow of all pipeline agents.
+        When `config_path` is given, run provenance is collected in the
+        background while the stages run. `workers` bounds how many independent tasks run at once
+        (default: `execution.workers` in the config, else 4). With
+        `dedup.cross_run`, rows seen by earlier runs are dropped during
+        cleaning (see dedup.HashIndex).
         """
         self.llm = llm
         self.output_dir = output_dir
         self.config = config
+        self.config_path = config_path
+        self.workers = workers or (config.get("execution", {}) or {}).get("workers") or DEFAULT_WORKERS
+        self.cache = StageCache.from_config(config)
+        self.schema = SchemaProfile.for_source(config)
+        logging_agent.start_run(output_dir)
+        self._exporter = None
+        self._dedup_index = dedup.HashIndex.from_config(config)
+        self._source_checksum = None
+        self.planner = planner.Planner.from_config(config, llm, output_dir)
+        self._columns = None
+        self._query_engine = None
+        self._query_source = None
 
     def decide_next_step(self, context: dict) -> str:
         """
-        Ask LLM which step to run next based on context.
-        For now, fallback to static order.
+        Next stage to run given `context` ({"completed": [...], "goal": ...,
+        optionally "columns"}), from the plan for this dataset's schema and
+        goal (see planner.Planner). Only a goal not planned before costs an
+        LLM round-trip; otherwise this is a dictionary lookup.
+        """
+        goal = context.get("goal")
+        columns = context.get("columns") or (self._source_columns() if self.planner.uses_schema(goal) else None)
+        plan, _ = self.planner.plan(columns, goal)
+        return planner.next_step(plan, context.get("completed", []))
+
+    def _source_columns(self):
+        """Column names of the configured source (from its schema profile or CSV header), or None."""
+        if self._columns is None:
+            dtypes = self.schema.get("dtypes") if self.schema is not None else None
+            source = self.config["dataset_source"]
+            location = source.get("location", "")
+            if dtypes:
+                self._columns = list(dtypes)
+            elif source.get("type", "file") == "file" and location.endswith(".csv") and os.path.exists(location):
+                with open(location, "r", encoding="utf-8", errors="replace") as f:
+                    header = f.readline().rstrip("\r\n")
+                self._columns = header.split(sniff_delimiter(location))
+        return self._columns
+
+    def _config_slice(self, stage):
+        return {k: self.config.get(k) for k in STAGE_CONFIG_KEYS[stage]}
+
+    def _profiler(self, stage):
+        """Profiler to attach to `stage`, if `profiling.stage` names it."""
+        profiling = self.config.get("profiling", {}) or {}
+        if profiling.get("stage") in (stage, "all"):
+            return profiling.get("profiler", "cprofile")
+        return None
+
+    def _run_stage(self, stage, module, input_key, run, rows_in=None):
         """
-        prompt = f"""
-        You are an AI orchestrator. 
-        Current context: {context}.
-        Decide which module to run next out of:
-        [ingestion, standardization, cleaning, transformation, insights, stop].
+        Run one stage through the stage cache, timed by logging_agent.stage_timer.
+        `run()` returns (df, meta); returns (df, meta, key) where `key`
+        addresses this stage's output and becomes the input key of the next stage.
         """
-        try:
-            decision = self.llm.ask(prompt)
-            if decision:
-                return decision.lower().strip()
-        except Exception:
-            pass
+        with logging_agent.stage_timer(stage, self.output_dir, rows_in, self._profiler(stage)) as timing:
+            df, meta, key = self._run_cached(stage, module, input_key, run, timing)
+            if df is not None:
+                timing["rows_out"] = len(df)
+        return df, meta, key
+
+    def _run_cached(self, stage, module, input_key, run, timing):
+        if self.cache is None or input_key is None:
+            df, meta = run()
+            return df, meta, None
+
+        key = self.cache.key(stage, input_key, self._config_slice(stage), module)
+        hit = self.cache.get(key, self.output_dir)
+        timing["cache"] = "hit" if hit is not None else "miss"
+        logging_agent.count(f"cache.{'hits' if hit is not None else 'misses'}", output_dir=self.output_dir)
+        if hit is not None:
+            logging_agent.log_event(f"Cache hit for {stage} ({key[:12]})", self.output_dir)
+            return hit[0], hit[1], key
+
+        logging_agent.log_event(f"Cache miss for {stage} ({key[:12]})", self.output_dir)
+        df, meta = run()
+        files = [os.path.join(self.output_dir, name) for name in STAGE_FILES[stage]]
+        files += [p for p in output_files(meta, self.output_dir) if p not in files]
+        evicted = self.cache.put(key, df, meta, files, self.output_dir)
+        if evicted:
+            logging_agent.count("cache.evictions", len(evicted), self.output_dir)
+            logging_agent.log_event(f"Cache evicted {len(evicted)} entries", self.output_dir)
+        return df, meta, key
+
+    def _ingest(self):
+        source = self.config["dataset_source"]
+        if source.get("type", "file") == "url":
+            # Downloaded (or revalidated) up front, so the copy is keyed like a local file.
+            with logging_agent.stage_timer("download", self.output_dir):
+                source = dict(source, type="file", location=download.fetch_source(source, self.config))
+        # Local files are keyed on their checksum
+        source_key = None
+        if source.get("type", "file") == "file" and os.path.exists(source["location"]):
+            source_key = self._source_checksum = file_checksum(source["location"])
+            logging_agent.count("bytes.read", os.path.getsize(source["location"]), self.output_dir)
+        df, meta, key = self._run_stage(
+            "ingestion", ingestion, source_key,
+            lambda: ingestion.load_frame(source, self.output_dir, self.schema, self.config),
+        )
+        if key is None and self.cache is not None:
+            key = frame_fingerprint(df)
+        self._exporter.export("raw", df)
+        logging_agent.log_event(f"Ingested {meta['rows']} rows from {meta['dataset_name']}", self.output_dir)
+        memory = meta["memory"]
+        logging_agent.count("memory.saved_bytes", memory["bytes_before"] - memory["bytes_after"], self.output_dir)
+        logging_agent.log_event(
+            f"Compacted dtypes of {len(memory['columns'])} columns: "
+            f"{memory['bytes_before'] / 1e6:.1f} MB -> {memory['bytes_after'] / 1e6:.1f} MB", self.output_dir
+        )
+        return df, meta, key
+
+    def _standardize(self, ingested):
+        df, _, key = ingested
+        df, meta, key = self._run_stage(
+            "standardization", standardization, key,
+            lambda: standardization.standardize_frame(df, self.output_dir, self.schema),
+            rows_in=len(df),
+        )
+        self._exporter.export("standardized", df)
+        logging_agent.log_event(f"Standardized data, parsed dates: {meta['parsed_dates']}", self.output_dir)
+        return df, meta, key
+
+    def _suggest_cleaning(self, standardized):
+        df, _, key = standardized
+        _, meta, _ = self._run_stage(
+            "llm_suggestions", cleaning, key,
+            lambda: (None, {"path": cleaning.suggest_cleaning(df, self.config, self.output_dir)}),
+            rows_in=len(df),
+        )
+        logging_agent.log_event(f"LLM cleaning suggestions saved at {meta['path']}", self.output_dir)
+        return meta["path"]
+
+    def _clean(self, standardized):
+        df, _, key = standardized
+        index = self._dedup_index
+        # Against the cross-run index the output depends on earlier runs, so it isn't cached
+        df, meta, key = self._run_stage(
+            "cleaning", cleaning, key if index is None else None,
+            lambda: cleaning.clean_frame(df, self.config, self.output_dir, index),
+            rows_in=len(df),
+        )
+        if key is None and self.cache is not None:
+            key = frame_fingerprint(df)
+        self._exporter.export("cleaned", df)
+        seen = meta["dedup"]["seen_in_earlier_runs"]
+        logging_agent.log_event(
+            f"Cleaned data: {meta['rows_before']} -> {meta['rows_after']} rows"
+            + (f" ({seen} seen in earlier runs)" if seen else ""), self.output_dir
+        )
+        return df, meta, key
+
+    def _transform(self, cleaned):
+        df, _, key = cleaned
+        df, meta, key = self._run_stage(
+            "transformation", transformation, key,
+            lambda: transformation.transform_frame(df, self.config, self.output_dir),
+            rows_in=len(df),
+        )
+        self._exporter.export("transformed", df)
+        logging_agent.log_event(
+            f"Transformed data: {meta['rows_before']} -> {meta['rows_after']} rows", self.output_dir
+        )
+        return df, meta, key
+
+    def _aggregate(self, transformed):
+        df, _, key = transformed
+        _, meta, _ = self._run_stage(
+            "aggregation", aggregation, key,
+            lambda: aggregation.aggregate_frame(df, self.config, self.output_dir),
+            rows_in=len(df),
+        )
+        if meta["tables"]:
+            logging_agent.log_event(
+                f"Rollups: {', '.join(f'{name} ({n} rows)' for name, n in meta['rows'].items())}", self.output_dir
+            )
+        else:
+            logging_agent.log_event("Rollups skipped: no date column or measures", self.output_dir)
+        return aggregation.load_rollups(self.output_dir)
+
+    def _render_charts(self, transformed):
+        df, _, key = transformed
+        _, meta, _ = self._run_stage(
+            "insights_charts", insights, key,
+            lambda: (None, {"plots": insights.render_distributions(df, self.output_dir, self.config)}),
+            rows_in=len(df),
+        )
+        logging_agent.log_event(f"Charts: {len(meta['plots'])} in {insights.CHARTS_DIR}/", self.output_dir)
+        return meta["plots"]
+
+    def _write_report(self, transformed, cleaned, rollups):
+        df, _, key = transformed
+        profile = QCProfile.from_dict(cleaned[1]["qc_profile"])
+        _, meta, _ = self._run_stage(
+            "insights_report", insights, key,
+            lambda: (None, {"summary": insights.write_insights_report(df, self.config, self.output_dir, profile, rollups)}),
+            rows_in=len(df),
+        )
+        logging_agent.log_event(f"Insights generated: {meta['summary']}", self.output_dir)
+        return meta["summary"]
 
-        # Fallback to static sequencing
-        return context.get("next_step", "stop")
+    @logging_agent.timed("provenance")
+    def _save_provenance(self):
+        dataset_file = self.config["dataset_source"].get("location")
+        llm_model = self.config.get("llm", {}).get("model")
+        save_run_metadata(self.output_dir, self.config_path, dataset_file, llm_model)
+        logging_agent.log_event("Saved run metadata", self.output_dir)
+
+    def _run_graph(self, graph):
+        graph.run(self.workers)
+        report = graph.report()
+        with open(os.path.join(self.output_dir, "task_timings.json"), "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        for name, t in report["tasks"].items():
+            logging_agent.log_event(f"Task {name}: {t['duration']:.3f}s", self.output_dir)
+        logging_agent.log_event(
+            f"Critical path: {' -> '.join(report['critical_path'])} "
+            f"({report['critical_path_seconds']:.3f}s of {report['wall_seconds']:.3f}s wall, "
+            f"{self.workers} workers)",
+            self.output_dir,
+        )
+        return graph.results
+
+    def _finish_exports(self):
+        for name, paths in self._exporter.wait().items():
+            logging_agent.count("bytes.written", sum(os.path.getsize(p) for p in paths), self.output_dir)
+            logging_agent.log_event(f"Exported {name} checkpoint to {', '.join(paths)}", self.output_dir)
+
+    def _write_performance_report(self, graph, provenance_future=None):
+        if provenance_future is not None:
+            try:
+                provenance_future.result()
+            except Exception as e:
+                logging_agent.log_event(f"[WARN] Could not save run metadata: {e}", self.output_dir)
+        path, seconds = graph.critical_path()
+        report_path = logging_agent.write_performance_report(
+            self.output_dir, workers=self.workers, critical_path=path, critical_path_seconds=seconds,
+        )
+        logging_agent.log_event(f"Performance report saved at {report_path}", self.output_dir)
+        self._record_run()
+
+    def _record_run(self):
+        """Add this run (timings, checksums, config and environment) to the provenance store."""
+        cfg = self.config.get("provenance", {}) or {}
+        try:
+            store = run_store.RunStore.from_config(self.config)
+            if store is None:
+                return
+            with store:
+                run_id = store.record(self.output_dir, self.config, self._source_checksum,
+                                      cfg.get("output_checksums", True))
+            logging_agent.log_event(f"Recorded run {run_id} in {store.path}", self.output_dir)
+        except Exception as e:
+            logging_agent.log_event(f"[WARN] Could not record run provenance: {e}", self.output_dir)
 
     def run_pipeline(self):
         """
-        Runs the pipeline in sequence.
-        Can later be replaced with fully agentic step-by-step planning.
+        Runs the pipeline as a dependency graph of stage tasks, handing
+        DataFrames from stage to stage in memory. Independent tasks (the
+        LLM cleaning-suggestion call, chart rendering and the rollups
+        feeding the insights report) run in parallel on `workers` threads; per-task timings and
+        the critical path go to task_timings.json. Run provenance is
+        collected on its own background thread and only waited for before
+        the performance report is written.
+
+        CSV artifacts are only written at the checkpoints listed under
+        `artifacts.checkpoints`, in the background. Stages whose input,
+        config slice and code are unchanged are served from the stage cache.
+        The stages run are those planned for `planner.goal` (see
+        planner.Planner; the whole pipeline without a goal). Returns the
+        DataFrame of the last stage run (normally transformation).
         """
         logging_agent.log_event("Starting orchestration", self.output_dir)
+        graph = TaskGraph()
+        prov = provenance.in_background(self._save_provenance) if self.config_path else None
 
-        # Step 1: Ingestion
-        raw_path = ingestion.load_dataset(self.config["dataset_source"], self.output_dir)
-        logging_agent.log_event(f"Ingested data at {raw_path}", self.output_dir)
+        mode = (self.config.get("execution", {}) or {}).get("mode")
+        if mode == "streaming":
+            graph.add("streaming", self.run_streaming)
+            transformed_path = self._run_graph(graph)["streaming"]
+            self._save_dedup_index()
+            self._write_performance_report(graph, prov)
+            return transformed_path
 
-        # Step 2: Standardization
-        std_path = standardization.standardize_data(raw_path, self.output_dir)
-        logging_agent.log_event(f"Standardized data saved at {std_path}", self.output_dir)
+        self._exporter = ArtifactExporter(self.output_dir, self.config)
+        if mode == "incremental":
+            graph.add("incremental", self.run_incremental)
+            transformed = self._run_graph(graph)["incremental"]
+            self._finish_exports()
+            self._write_performance_report(graph, prov)
+            return transformed
+        plan = self._plan()
+        graph.add("ingestion", self._ingest)
+        if "standardization" in plan:
+            graph.add("standardization", self._standardize, ["ingestion"])
+        if "cleaning" in plan:
+            graph.add("llm_suggestions", self._suggest_cleaning, ["standardization"])
+            graph.add("cleaning", self._clean, ["standardization"])
+        if "transformation" in plan:
+            graph.add("transformation", self._transform, ["cleaning"])
+        if "insights" in plan:
+            graph.add("aggregation", self._aggregate, ["transformation"])
+            graph.add("insights_charts", self._render_charts, ["transformation"])
+            graph.add("insights_report", self._write_report, ["transformation", "cleaning", "aggregation"])
+        results = self._run_graph(graph)
+        self._finish_exports()
+        self._save_dedup_index()
 
-        # Step 3: Cleaning
-        clean_path = cleaning.clean_data(std_path, self.config, self.output_dir)
-        logging_agent.log_event(f"Cleaned data saved at {clean_path}", self.output_dir)
+        logging_agent.log_event("Pipeline orchestrated successfully", self.output_dir)
+        self._write_performance_report(graph, prov)
 
-        # Step 4: Transformation
-        transformed_path = transformation.transform_data(clean_path, self.config, self.output_dir)
-        logging_agent.log_event(f"Transformed data saved at {transformed_path}", self.output_dir)
+        last = [s for s in plan if s in results][-1]
+        return results[last][0]
 
-        # Step 5: Insights
-        summary_md, plot_path = insights.generate_insights(transformed_path, self.config, self.output_dir)
-        logging_agent.log_event(f"Insights generated: {summary_md}, Plot: {plot_path}", self.output_dir)
+    def _plan(self):
+        goal = (self.config.get("planner", {}) or {}).get("goal")
+        with logging_agent.stage_timer("planning", self.output_dir) as timing:
+            columns = self._source_columns() if self.planner.uses_schema(goal) else None
+            plan, timing["source"] = self.planner.plan(columns, goal)
+        logging_agent.log_event(f"Plan ({timing['source']}): {' -> '.join(plan)}", self.output_dir)
+        return plan
 
-        logging_agent.log_event("Pipeline orchestrated successfully", self.output_dir)
+    def _save_dedup_index(self):
+        """Persist the rows this run added to the cross-run dedup index (only once the run succeeded)."""
+        if self._dedup_index is not None:
+            self._dedup_index.save()
+            logging_agent.log_event(
+                f"Dedup index at {self._dedup_index.path} holds {len(self._dedup_index)} rows", self.output_dir
+            )
 
-        return transformed_path
+    @logging_agent.timed("streaming")
+    def run_streaming(self):
+        """
+        Runs the data stages chunk by chunk for inputs larger than memory.
+        Returns the path of the transformed artifact rather than a DataFrame.
+        """
+        logging_agent.log_event("Running in streaming mode", self.output_dir)
+        result = streaming.run_streaming(self.config, self.output_dir, self._dedup_index, self.schema)
+        logging_agent.log_event(
+            f"Streamed {result['rows']} rows from {result['dataset_name']}: "
+            f"{result['rows_after_cleaning']} after cleaning, {result['rows_transformed']} after transformation",
+            self.output_dir,
+        )
+        logging_agent.log_event(f"Insights generated: {result['summary']}, Plot: {result['plots']}", self.output_dir)
+        return result["transformed_path"]
 
-    def handle_query(self, user_question: str, transformed_path: str) -> str:
+    @logging_agent.timed("incremental")
+    def run_incremental(self):
         """
-        Handle natural language questions about the data by delegating to LLM.
+        Processes only rows added since the last run and merges them into the
+        persisted cleaned store. The `cleaned` checkpoint holds this run's
+        new rows; returns the full transformed DataFrame.
         """
-        try:
-            with open(transformed_path, "r", encoding="utf-8") as f:
-                data_snippet = "".join([next(f) for _ in range(20)])
-        except Exception as e:
-            data_snippet = f"[ERROR reading data: {e}]"
+        logging_agent.log_event("Running in incremental mode", self.output_dir)
+        result = incremental.run_incremental(self.config, self.output_dir)
+        logging_agent.log_event(
+            f"Ingested {result['new_rows']} new rows from {result['dataset_name']} "
+            f"({'appended tail' if result['tail_only'] else 'full scan'}, "
+            f"{result['duplicates_skipped']} already seen, {result['late_rows']} at or before the previous watermark); "
+            f"watermark now {result['watermark']}",
+            self.output_dir,
+        )
+        self._exporter.export("cleaned", result["cleaned"])
+        self._exporter.export("transformed", result["transformed"])
+        logging_agent.log_event(f"Insights generated: {result['summary']}, Plot: {result['plots']}", self.output_dir)
+        return result["transformed"]
 
-        prompt = f"""
-        Dataset snippet:
-        {data_snippet}
+    def load_checkpoint(self, name, columns=None):
+        """
+        Load an exported checkpoint (e.g. "transformed") from this run's
+        output dir, reading only `columns` from columnar artifacts.
+        """
+        path = find_artifact(self.output_dir, name)
+        if path is None:
+            raise FileNotFoundError(f"No exported '{name}' checkpoint in {self.output_dir}")
+        return read_artifact(path, columns=columns)
 
-        User question: {user_question}
+    def query_engine(self, transformed):
+        """
+        QueryEngine over `transformed` (a DataFrame or artifact path), built on
+        first use and kept resident for later questions about the same data.
+        """
+        if self._query_engine is None or self._query_source is not transformed:
+            df = transformed if isinstance(transformed, pd.DataFrame) else read_artifact(transformed)
+            self._query_engine = QueryEngine(df, rollups=aggregation.load_rollups(self.output_dir))
+            self._query_source = transformed
+        return self._query_engine
 
-        Please answer concisely.
+    def handle_query(self, user_question: str, transformed) -> str:
+        """
+        Answer a natural language question about the data from the resident
+        query engine. The LLM is only asked to phrase the computed answer
+        (`query.phrase_with_llm`) or to handle questions the engine can't map.
+        `transformed` is the DataFrame returned by run_pipeline (or a path to
+        an exported transformed checkpoint in any artifact format).
         """
-        return self.llm.ask(prompt)
+        try:
+            engine = self.query_engine(transformed)
+        except Exception as e:
+            return f"[ERROR reading data: {e}]"
+        phrase = (self.config.get("query", {}) or {}).get("phrase_with_llm", False)
+        return query_engine.answer(engine, user_question, self.llm, phrase_with_llm=phrase)
@@ -0,0 +1,169 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from agents import logging_agent
+
+# The stages a plan can name, in pipeline order; each needs the one before it
+# (data is handed from stage to stage), so every valid plan is a prefix.
+STAGES = ["ingestion", "standardization", "cleaning", "transformation", "insights"]
+STOP = "stop"
+DEFAULT_CACHE_DIR = ".plan_cache"
+PLANS_FILE = "plans.json"
+# Part of every cache key: bump when STAGES or plan validation change.
+PLANNER_VERSION = 1
+
+_plans = {}
+_loaded = set()
+_lock = threading.Lock()
+
+
+def schema_fingerprint(columns):
+    """Short hash of a dataset schema: a list of column names or a {column: dtype} dict."""
+    items = sorted(columns.items()) if isinstance(columns, dict) else list(columns)
+    return hashlib.sha256(json.dumps(items, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def _normalize_goal(goal):
+    return " ".join(str(goal).lower().split()) if goal else ""
+
+
+def rule_plan():
+    """
+    The deterministic plan: the whole pipeline. Without a goal there is
+    nothing for the LLM to decide, so this is always the plan.
+    """
+    return list(STAGES)
+
+
+def validate(plan):
+    """
+    `plan` as a list of known stage names in pipeline order, starting at
+    ingestion without gaps (anything after "stop" is ignored); raises
+    ValueError otherwise.
+    """
+    if not isinstance(plan, list) or not all(isinstance(s, str) for s in plan):
+        raise ValueError("a plan is a list of stage names")
+    stages = [s.strip().lower() for s in plan]
+    if STOP in stages:
+        stages = stages[:stages.index(STOP)]
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        raise ValueError(f"unknown stage {unknown[0]!r}; expected one of {', '.join(STAGES)}")
+    if not stages or stages != STAGES[:len(stages)]:
+        raise ValueError(f"stages must run in order from {STAGES[0]}: {' -> '.join(STAGES)}")
+    return stages
+
+
+def parse_plan(text):
+    """Validated plan from an LLM answer holding a JSON list of stages (possibly fenced); raises ValueError."""
+    match = re.search(r"\[.*?\]", text or "", re.S)
+    if not match:
+        raise ValueError("no JSON list of stages in the answer")
+    try:
+        plan = json.loads(match.group(0))
+    except ValueError as e:
+        raise ValueError(f"unparseable plan: {e}") from None
+    return validate(plan)
+
+
+def next_step(plan, completed=()):
+    """First stage of `plan` not in `completed`, or "stop"."""
+    done = set(completed)
+    return next((s for s in plan if s not in done), STOP)
+
+
+def _plans_path(cache_dir):
+    return os.path.join(cache_dir, PLANS_FILE)
+
+
+def _load(cache_dir):
+    if cache_dir in _loaded:
+        return
+    try:
+        with open(_plans_path(cache_dir), "r", encoding="utf-8") as f:
+            _plans.update({(cache_dir, k): v for k, v in json.load(f).items()})
+    except (OSError, ValueError):
+        pass
+    _loaded.add(cache_dir)
+
+
+def _save(cache_dir):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _plans_path(cache_dir)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({k: v for (d, k), v in _plans.items() if d == cache_dir}, f, indent=2)
+    os.replace(tmp, path)
+
+
+class Planner:
+    """
+    Decides which stages a run executes. Without a goal, or in `rules`
+    mode, the plan is rule_plan() and no LLM is involved. In `llm` mode a
+    goal is planned by the LLM once per (schema fingerprint, goal): the
+    answer is validated against STAGES and cached on disk (a rejected
+    or unavailable answer falls back to the rule plan, uncached), so repeat
+    workloads are planned from memory in microseconds.
+    """
+
+    def __init__(self, llm=None, mode="rules", cache_dir=DEFAULT_CACHE_DIR, output_dir=None):
+        if mode not in ("rules", "llm"):
+            raise ValueError(f"Unknown planner mode {mode!r}; expected rules or llm")
+        self.llm = llm
+        self.mode = mode
+        self.cache_dir = cache_dir
+        self.output_dir = output_dir
+
+    @classmethod
+    def from_config(cls, config: dict, llm=None, output_dir=None):
+        cfg = (config or {}).get("planner", {}) or {}
+        return cls(llm, cfg.get("mode", "rules"), cfg.get("cache_dir", DEFAULT_CACHE_DIR), output_dir)
+
+    def uses_schema(self, goal):
+        """Whether plan() looks at the columns for `goal` (rules plans don't)."""
+        return self.mode == "llm" and bool(_normalize_goal(goal))
+
+    def key(self, fingerprint, goal):
+        return f"v{PLANNER_VERSION}:{fingerprint or '-'}:{_normalize_goal(goal)}"
+
+    def plan(self, columns=None, goal=None):
+        """
+        (plan, source) for a dataset's `columns` (names, or {name: dtype})
+        and a goal; source is "rules", "cache" or "llm".
+        """
+        if not self.uses_schema(goal):
+            return rule_plan(), "rules"
+        fingerprint = schema_fingerprint(columns) if columns else None
+        key = self.key(fingerprint, goal)
+        with _lock:
+            _load(self.cache_dir)
+            cached = _plans.get((self.cache_dir, key))
+        if cached is not None:
+            logging_agent.count("planner.cache_hits", output_dir=self.output_dir)
+            return list(cached["plan"]), "cache"
+
+        logging_agent.count("planner.llm_calls", output_dir=self.output_dir)
+        try:
+            plan = parse_plan(self.llm.ask(self.prompt(goal, columns)))
+        except Exception as e:
+            logging_agent.count("planner.rejected", output_dir=self.output_dir)
+            if self.output_dir:
+                logging_agent.log_event(f"[WARN] LLM plan rejected ({e}); using the rule plan", self.output_dir)
+            return rule_plan(), "rules"
+        with _lock:
+            _plans[(self.cache_dir, key)] = {"plan": plan, "goal": goal, "schema": fingerprint}
+            _save(self.cache_dir)
+        return plan, "llm"
+
+    @staticmethod
+    def prompt(goal, columns=None):
+        return (
+            "You plan a data pipeline whose stages run in this order, each needing the one before it: "
+            f"{', '.join(STAGES)}.\n"
+            + (f"Dataset columns: {', '.join(map(str, columns))}\n" if columns else "")
+            + f"Goal: {goal}\n"
+            "Answer with only a JSON list of the stages to run, starting with ingestion and stopping "
+            'after the last stage the goal needs, e.g. ["ingestion", "standardization", "cleaning"].'
+        )
@@ -1,53 +1,181 @@
 import os
+import sys
 import json
 import hashlib
 import platform
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-def file_checksum(path):
-    """Compute SHA-256 checksum for a file (used for provenance)."""
+# Environment snapshots and dataset checksums are cached here across runs.
+PROVENANCE_CACHE_DIR = ".provenance_cache"
+CHECKSUMS_FILE = "checksums.json"
+
+_checksums = {}
+_checksums_loaded = False
+_checksums_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="provenance")
+
+
+def _checksum_store():
+    return os.path.join(PROVENANCE_CACHE_DIR, CHECKSUMS_FILE)
+
+
+def _load_checksums():
+    global _checksums_loaded
+    if _checksums_loaded:
+        return
+    try:
+        with open(_checksum_store(), "r", encoding="utf-8") as f:
+            _checksums.update({tuple(json.loads(k)): v for k, v in json.load(f).items()})
+    except (OSError, ValueError):
+        pass
+    _checksums_loaded = True
+
+
+def _save_checksums():
+    os.makedirs(PROVENANCE_CACHE_DIR, exist_ok=True)
+    tmp = f"{_checksum_store()}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({json.dumps(list(k)): v for k, v in _checksums.items()}, f)
+    os.replace(tmp, _checksum_store())
+
+
+def sha256(path):
+    """SHA-256 hex digest of a file's contents (not memoized; see file_checksum)."""
     h = hashlib.sha256()
     with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
             h.update(chunk)
     return h.hexdigest()
 
+
+def file_checksum(path):
+    """
+    Compute SHA-256 checksum for a file (used for provenance and stage cache keys).
+    Memoized per (path, size, mtime), in memory and in the provenance cache,
+    so an unchanged dataset is hashed once, not once per run.
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _checksums_lock:
+        _load_checksums()
+        if memo_key in _checksums:
+            return _checksums[memo_key]
+    digest = sha256(path)
+    with _checksums_lock:
+        # Drop stale entries for this path so the store doesn't grow with every edit.
+        for key in [k for k in _checksums if k[0] == memo_key[0]]:
+            del _checksums[key]
+        _checksums[memo_key] = digest
+        _save_checksums()
+    return _checksums[memo_key]
+
+
+def environment_fingerprint():
+    """
+    Hash identifying the Python environment: interpreter, platform and the
+    modification times of the site-packages directories, which change
+    whenever packages are installed, upgraded or removed.
+    """
+    parts = [sys.executable, sys.version, platform.platform()]
+    for entry in sys.path:
+        if os.path.basename(entry) not in ("site-packages", "dist-packages"):
+            continue
+        try:
+            parts.append(f"{entry}:{os.stat(entry).st_mtime_ns}")
+        except OSError:
+            continue
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def installed_requirements():
+    """`pip freeze`-style name==version lines, read from package metadata without a subprocess."""
+    from importlib import metadata
+
+    reqs = {}
+    for dist in metadata.distributions():
+        name = dist.metadata["Name"]
+        if name and name.lower() not in reqs:
+            reqs[name.lower()] = f"{name}=={dist.version}"
+    return sorted(reqs.values(), key=str.lower)
+
+
+def environment_info():
+    """Python/platform details and installed packages, cached per environment fingerprint."""
+    fingerprint = environment_fingerprint()
+    path = os.path.join(PROVENANCE_CACHE_DIR, f"env_{fingerprint}.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    info = {
+        "environment_fingerprint": fingerprint,
+        "python_version": platform.python_version(),
+        "platform": platform.platform(),
+        "requirements": installed_requirements(),
+    }
+    os.makedirs(PROVENANCE_CACHE_DIR, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(info, f, indent=2)
+    os.replace(tmp, path)
+    return info
+
+
+def git_commit(repo_dir="."):
+    """Short HEAD commit, read from .git directly (falls back to `git rev-parse`)."""
+    git_dir = os.path.join(repo_dir, ".git")
+    if not os.path.exists(git_dir):
+        return None
+    try:
+        with open(os.path.join(git_dir, "HEAD"), "r", encoding="utf-8") as f:
+            head = f.read().strip()
+        if not head.startswith("ref: "):
+            return head[:7]
+        ref = head[5:]
+        ref_path = os.path.join(git_dir, ref)
+        if os.path.exists(ref_path):
+            with open(ref_path, "r", encoding="utf-8") as f:
+                return f.read().strip()[:7]
+        with open(os.path.join(git_dir, "packed-refs"), "r", encoding="utf-8") as f:
+            for line in f:
+                if line.rstrip().endswith(" " + ref):
+                    return line.split()[0][:7]
+    except OSError:
+        pass
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=repo_dir)
+        return commit.stdout.strip() or None
+    except Exception:
+        return None
+
+
 def save_run_metadata(output_dir, config_path, dataset_path=None, llm_model=None):
     """Save provenance metadata for reproducibility and audit."""
+    env = environment_info()
     meta = {
         "timestamp": datetime.utcnow().isoformat() + "Z",
         "user": os.getenv("USERNAME") or os.getenv("USER"),
-        "python_version": platform.python_version(),
-        "platform": platform.platform(),
-        "git_commit": None,
+        "python_version": env["python_version"],
+        "platform": env["platform"],
+        "environment_fingerprint": env["environment_fingerprint"],
+        "git_commit": git_commit(),
         "config_path": config_path,
         "dataset_checksum": file_checksum(dataset_path) if dataset_path and os.path.exists(dataset_path) else None,
         "llm_model": llm_model,
-        "requirements": None,
+        "requirements": env["requirements"],
     }
 
-    if os.path.exists(".git"):
-        try:
-            commit = subprocess.run(
-                ["git", "rev-parse", "--short", "HEAD"],
-                capture_output=True, text=True
-            )
-            meta["git_commit"] = commit.stdout.strip()
-        except Exception:
-            pass
-
-    # Try to capture pip freeze
-    try:
-        reqs = subprocess.run(
-            ["pip", "freeze"], capture_output=True, text=True
-        )
-        meta["requirements"] = reqs.stdout.splitlines()
-    except Exception:
-        pass
-
     os.makedirs(output_dir, exist_ok=True)
     with open(os.path.join(output_dir, "run_metadata.json"), "w", encoding="utf-8") as f:
         json.dump(meta, f, indent=2)
 
     return meta
+
+
+def in_background(fn, *args, **kwargs):
+    """Run `fn` on the provenance thread; returns a Future so the caller only waits when it must."""
+    return _executor.submit(fn, *args, **kwargs)
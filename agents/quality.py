@@ -0,0 +1,283 @@
+import warnings
+import numpy as np
+import pandas as pd
+from agents import dedup, dtypes
+
+# Tukey fence multiplier for the IQR outlier rule.
+IQR_K = 1.5
+
+# Row-level QC flags are packed into one unsigned integer column: bit 0 is
+# "missing before cleaning", bit 1 "imputed" and bit 2 + i "outlier in the
+# i-th numeric column". Columns past the last bit keep a boolean
+# `_qc_outlier_<col>` column.
+QC_FLAGS = "_qc_flags"
+MISSING_BIT = 0
+IMPUTED_BIT = 1
+FIRST_OUTLIER_BIT = 2
+MAX_FLAG_BITS = 64
+
+# How each cell was imputed (imputation.STRATEGIES codes, 0 = observed) is
+# packed IMPUTED_CODE_BITS per column into `_qc_imputed`, in imputable
+# column order; columns past the last bits keep a `_qc_imputed_<col>` code.
+IMPUTED = "_qc_imputed"
+IMPUTED_CODE_BITS = 2
+
+
+def iqr_fences(q1, q3):
+    """
+    Vectorized IQR fences: (lower, upper) arrays broadcast like q1/q3.
+    Fences are NaN where the IQR is zero or undefined, so nothing is flagged there.
+    """
+    q1 = np.asarray(q1, dtype="float64")
+    q3 = np.asarray(q3, dtype="float64")
+    iqr = q3 - q1
+    valid = iqr > 0
+    lower = np.where(valid, q1 - IQR_K * iqr, np.nan)
+    upper = np.where(valid, q3 + IQR_K * iqr, np.nan)
+    return lower, upper
+
+
+def outlier_matrix(values, lower, upper):
+    """Boolean matrix, True where a value lies outside its fences (NaNs never are)."""
+    with np.errstate(invalid="ignore"):
+        return (values < lower) | (values > upper)
+
+
+def numeric_columns(df):
+    """Numeric data columns of `df` (QC flag columns excluded)."""
+    return [c for c in df.select_dtypes(include=["number"]).columns if not str(c).startswith("_qc_")]
+
+
+def _uint_width(bits):
+    return next(w for w in (8, 16, 32, 64) if w >= bits)
+
+
+def flag_columns(missing, imputed, outliers, packed=True):
+    """
+    QC flag columns for a frame, as {name: values}: the packed `_qc_flags`
+    bitmask (in the smallest unsigned type that holds the bits), or with
+    `packed=False` separate boolean `_qc_missing`, `_qc_outlier_<col>`
+    and `_qc_imputed` columns. `outliers` is a boolean DataFrame with one
+    column per numeric column. `imputed` is either a boolean row mask or
+    a DataFrame of per-cell imputation codes (imputation.impute_frame),
+    which are added as the packed `_qc_imputed` codes (or one
+    `_qc_imputed_<col>` code column each with `packed=False`).
+    """
+    codes = imputed if isinstance(imputed, pd.DataFrame) else None
+    if codes is not None:
+        imputed = (codes.to_numpy() > 0).any(axis=1) if len(codes.columns) else np.zeros(len(codes), dtype=bool)
+    if not packed:
+        columns = {"_qc_missing": np.asarray(missing, dtype=bool)}
+        columns.update({f"_qc_outlier_{c}": outliers[c].to_numpy() for c in outliers.columns})
+        columns[IMPUTED] = np.asarray(imputed, dtype=bool)
+        if codes is not None:
+            columns.update({f"{IMPUTED}_{c}": codes[c].to_numpy() for c in codes.columns})
+        return columns
+
+    n_packed = min(len(outliers.columns), MAX_FLAG_BITS - FIRST_OUTLIER_BIT)
+    width = _uint_width(FIRST_OUTLIER_BIT + n_packed)
+    bits = np.zeros((len(outliers), width), dtype=bool)
+    bits[:, MISSING_BIT] = np.asarray(missing, dtype=bool)
+    bits[:, IMPUTED_BIT] = np.asarray(imputed, dtype=bool)
+    bits[:, FIRST_OUTLIER_BIT:FIRST_OUTLIER_BIT + n_packed] = outliers.to_numpy(dtype=bool)[:, :n_packed]
+    flags = np.packbits(bits, axis=1, bitorder="little").view(f"<u{width // 8}").ravel()
+    columns = {QC_FLAGS: flags.astype(f"uint{width}")}
+    columns.update({f"_qc_outlier_{c}": outliers[c].to_numpy() for c in outliers.columns[n_packed:]})
+    if codes is not None and len(codes.columns):
+        n_codes = min(len(codes.columns), MAX_FLAG_BITS // IMPUTED_CODE_BITS)
+        packed_codes = np.zeros(len(codes), dtype="uint64")
+        for i, c in enumerate(codes.columns[:n_codes]):
+            packed_codes |= codes[c].to_numpy().astype("uint64") << np.uint64(IMPUTED_CODE_BITS * i)
+        columns[IMPUTED] = packed_codes.astype(f"uint{_uint_width(IMPUTED_CODE_BITS * n_codes)}")
+        columns.update({f"{IMPUTED}_{c}": codes[c].to_numpy() for c in codes.columns[n_codes:]})
+    return columns
+
+
+def flag_layout(numeric_cols, packed=True, imputed_cols=None):
+    """{flag: column or "_qc_flags bit N"}, describing where each QC flag is stored."""
+    imputed_cols = imputed_cols or []
+    if not packed:
+        layout = {"missing": "_qc_missing", "imputed": IMPUTED}
+        layout.update({f"outlier:{c}": f"_qc_outlier_{c}" for c in numeric_cols})
+        layout.update({f"imputed:{c}": f"{IMPUTED}_{c}" for c in imputed_cols})
+        return layout
+    layout = {"missing": f"{QC_FLAGS} bit {MISSING_BIT}", "imputed": f"{QC_FLAGS} bit {IMPUTED_BIT}"}
+    for i, c in enumerate(numeric_cols):
+        bit = FIRST_OUTLIER_BIT + i
+        layout[f"outlier:{c}"] = f"{QC_FLAGS} bit {bit}" if bit < MAX_FLAG_BITS else f"_qc_outlier_{c}"
+    for i, c in enumerate(imputed_cols):
+        bit = IMPUTED_CODE_BITS * i
+        layout[f"imputed:{c}"] = f"{IMPUTED} bits {bit}-{bit + IMPUTED_CODE_BITS - 1}" \
+            if bit < MAX_FLAG_BITS else f"{IMPUTED}_{c}"
+    return layout
+
+
+def _flag_bit(df, bit):
+    return (df[QC_FLAGS].to_numpy().astype("uint64") >> np.uint64(bit)) & np.uint64(1) == 1
+
+
+def row_flag(df, name):
+    """Boolean mask of the "missing" or "imputed" row flag, packed or not."""
+    if QC_FLAGS in df.columns:
+        return _flag_bit(df, MISSING_BIT if name == "missing" else IMPUTED_BIT)
+    return df[f"_qc_{name}"].to_numpy(dtype=bool)
+
+
+def imputed_codes(df, imputed_cols):
+    """
+    uint8 DataFrame of the imputation code (imputation.STRATEGIES, 0 =
+    observed) of each cell of `imputed_cols`, in the order they were packed,
+    for the columns `df` has codes for.
+    """
+    codes = {}
+    packed = IMPUTED in df.columns and df[IMPUTED].dtype != bool
+    mask = np.uint64(2 ** IMPUTED_CODE_BITS - 1)
+    for i, c in enumerate(imputed_cols):
+        if f"{IMPUTED}_{c}" in df.columns:
+            codes[c] = df[f"{IMPUTED}_{c}"].to_numpy(dtype="uint8")
+        elif packed and IMPUTED_CODE_BITS * i < MAX_FLAG_BITS:
+            shift = np.uint64(IMPUTED_CODE_BITS * i)
+            codes[c] = ((df[IMPUTED].to_numpy().astype("uint64") >> shift) & mask).astype("uint8")
+    return pd.DataFrame(codes, index=df.index)
+
+
+def outlier_flags(df, numeric_cols):
+    """
+    Boolean DataFrame of the per-column outlier flags of `numeric_cols`
+    (in the order their bits were packed), for the columns `df` has flags for.
+    """
+    flags = {}
+    for i, c in enumerate(numeric_cols):
+        if f"_qc_outlier_{c}" in df.columns:
+            flags[c] = df[f"_qc_outlier_{c}"].to_numpy(dtype=bool)
+        elif QC_FLAGS in df.columns and FIRST_OUTLIER_BIT + i < MAX_FLAG_BITS:
+            flags[c] = _flag_bit(df, FIRST_OUTLIER_BIT + i)
+    return pd.DataFrame(flags, index=df.index)
+
+
+def numeric_matrix(df, columns):
+    """float64 matrix of `columns` with missing values as NaN (float32 columns widened exactly)."""
+    if any(df[c].dtype == "float32" for c in columns):
+        return np.column_stack([dtypes.to_float64(df[c]) for c in columns])
+    return df[columns].to_numpy(dtype="float64", na_value=np.nan)
+
+
+class QCProfile:
+    """
+    Data-quality statistics for a DataFrame, computed once and reused.
+
+    Holds row/duplicate/missing counts and, for every numeric column, the
+    IQR quantiles, fences and outlier counts (per group when `group_by`
+    is set). `fences` is a tidy table with one row per column (and group).
+    The row-aligned `outliers`, `row_missing` and `duplicated` masks are kept in memory
+    only; to_dict/from_dict round-trip the summary statistics so the
+    profile can travel in stage metadata.
+    """
+
+    def __init__(self, rows, duplicates, missing, numeric_cols, fences, outlier_counts, group_by=None):
+        self.rows = rows
+        self.duplicates = duplicates
+        self.missing = missing
+        self.numeric_cols = numeric_cols
+        self.fences = fences
+        self.outlier_counts = outlier_counts
+        self.group_by = group_by or []
+        self.outliers = None
+        self.row_missing = None
+        self.duplicated = None
+
+    def outlier_table(self):
+        """DataFrame(column, iqr_outliers) for reports."""
+        return pd.DataFrame(
+            {"column": self.numeric_cols, "iqr_outliers": [int(self.outlier_counts[c]) for c in self.numeric_cols]}
+        )
+
+    def to_dict(self):
+        return {
+            "rows": int(self.rows),
+            "duplicates": int(self.duplicates),
+            "missing": {str(k): int(v) for k, v in self.missing.items()},
+            "numeric_cols": list(self.numeric_cols),
+            "fences": self.fences.to_dict(orient="records"),
+            "outlier_counts": {c: int(n) for c, n in self.outlier_counts.items()},
+            "group_by": list(self.group_by),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            rows=data["rows"],
+            duplicates=data["duplicates"],
+            missing=pd.Series(data["missing"], dtype="int64"),
+            numeric_cols=data["numeric_cols"],
+            fences=pd.DataFrame(data["fences"]),
+            outlier_counts=pd.Series(data["outlier_counts"], dtype="int64"),
+            group_by=data.get("group_by"),
+        )
+
+
+def profile_frame(df, group_by=None, row_hashes=None):
+    """
+    Compute a QCProfile for `df` in one batched pass: missing counts from a
+    single isna(), duplicate count (from `row_hashes` when given, see
+    dedup), and quantiles/fences/outlier masks for
+    all numeric columns at once with NumPy. With `group_by`, quantiles are
+    computed per group by a vectorized groupby and broadcast back to rows.
+    """
+    group_by = [c for c in (group_by or []) if c in df.columns]
+    isna = df.isna()
+    missing = isna.sum()
+    row_missing = isna.any(axis=1)
+    duplicated = dedup.duplicated(row_hashes) if row_hashes is not None else df.duplicated().to_numpy()
+    duplicates = int(duplicated.sum())
+
+    numeric_cols = [c for c in numeric_columns(df) if c not in group_by]
+    values = numeric_matrix(df, numeric_cols)
+
+    if not numeric_cols:
+        fences = pd.DataFrame(columns=group_by + ["column", "q1", "q3", "lower", "upper"])
+        outliers = np.zeros((len(df), 0), dtype=bool)
+    elif group_by:
+        grouped = df[numeric_cols].groupby([df[c] for c in group_by], dropna=False, sort=False, observed=True)
+        q1 = grouped.transform("quantile", 0.25).to_numpy(dtype="float64")
+        q3 = grouped.transform("quantile", 0.75).to_numpy(dtype="float64")
+        lower, upper = iqr_fences(q1, q3)
+        outliers = outlier_matrix(values, lower, upper)
+
+        per_group = grouped.quantile([0.25, 0.75])
+        q1g, q3g = per_group.xs(0.25, level=-1), per_group.xs(0.75, level=-1)
+        lg, ug = iqr_fences(q1g.to_numpy(), q3g.to_numpy())
+        # Tidy table: one row per (group, column), in row-major order of the group x column matrices.
+        keys = q1g.index.to_frame(index=False)
+        fences = keys.loc[keys.index.repeat(len(numeric_cols))].reset_index(drop=True)
+        fences.columns = group_by
+        fences["column"] = numeric_cols * len(keys)
+        fences["q1"] = q1g.to_numpy().ravel()
+        fences["q3"] = q3g.to_numpy().ravel()
+        fences["lower"] = lg.ravel()
+        fences["upper"] = ug.ravel()
+    else:
+        if len(df):
+            with warnings.catch_warnings():
+                # All-NaN columns just yield NaN quantiles (and no outliers).
+                warnings.simplefilter("ignore", RuntimeWarning)
+                q1, q3 = np.nanquantile(values, [0.25, 0.75], axis=0)
+        else:
+            q1 = q3 = np.full(len(numeric_cols), np.nan)
+        lower, upper = iqr_fences(q1, q3)
+        outliers = outlier_matrix(values, lower, upper)
+        fences = pd.DataFrame({"column": numeric_cols, "q1": q1, "q3": q3, "lower": lower, "upper": upper})
+
+    profile = QCProfile(
+        rows=len(df),
+        duplicates=duplicates,
+        missing=missing,
+        numeric_cols=numeric_cols,
+        fences=fences,
+        outlier_counts=pd.Series(outliers.sum(axis=0), index=numeric_cols, dtype="int64"),
+        group_by=group_by,
+    )
+    profile.outliers = pd.DataFrame(outliers, index=df.index, columns=numeric_cols)
+    profile.row_missing = row_missing
+    profile.duplicated = duplicated
+    return profile
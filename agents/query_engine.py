@@ -0,0 +1,575 @@
+import re
+import calendar
+import pandas as pd
+from agents import aggregation, dtypes
+
+MONTHS = {
+    name: i + 1
+    for i, names in enumerate([
+        ("january", "jan"), ("february", "feb"), ("march", "mar"), ("april", "apr"),
+        ("may",), ("june", "jun"), ("july", "jul"), ("august", "aug"),
+        ("september", "sep", "sept"), ("october", "oct"), ("november", "nov"), ("december", "dec"),
+    ])
+    for name in names
+}
+NUMBER_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+                "eight": 8, "nine": 9, "ten": 10, "twenty": 20}
+
+# Question keywords -> aggregation; checked in order, first match wins.
+AGG_KEYWORDS = [
+    ("count", r"\bhow many\b|\bcount\b|\bnumber of\b"),
+    ("mean", r"\baverage\b|\bmean\b|\bavg\b|\btypical\b"),
+    ("max", r"\bmax(imum)?\b|\bpeak\b"),
+    ("min", r"\bmin(imum)?\b"),
+    ("sum", r"\btotal\b|\bsum\b|\bhow much\b|\bcumulative\b|\boverall\b"),
+]
+# Ranking words order results ("which district had the highest rain") rather than pick an aggregate.
+RANKING_WORDS = r"\b(highest|most|wettest|largest|biggest|lowest|least|driest|smallest|bottom)\b"
+ASCENDING_WORDS = r"\b(lowest|least|driest|smallest|bottom)\b"
+# Measures whose natural aggregate is a total rather than an average.
+ADDITIVE_HINTS = ("rain", "precip", "consumption", "units", "load", "amount", "count")
+AGG_LABELS = {"sum": "Total", "mean": "Average", "max": "Maximum", "min": "Minimum", "count": "Number of records for"}
+MONTH_KEY = "_month"
+# Cubes keep these per cell; REAGG says how to roll cells up further (mean = sum / count).
+CUBE_AGGS = ("sum", "count", "max", "min")
+REAGG = {"sum": "sum", "count": "sum", "max": "max", "min": "min"}
+# Question patterns answered from the precomputed rollup tables (see aggregation); first match wins.
+ROLLUP_PATTERNS = [
+    ("anomalies", r"\banomal|\bdeparture|\bdeficien|\bdeficit|\bexcess|\bdrought|\b(above|below) normal"),
+    ("seasonal", r"\bseason|\bmonsoon|\bwinter\b"),
+    ("weekly", r"\bweekly\b|\bby week\b|\bper week\b|\bweek by week\b|\bweek[- ]?wise\b"),
+    ("daily", r"\brolling\b|\b\d+[- ]day\b"),
+]
+SEASON_WORDS = [
+    ("northeast_monsoon", r"north[- ]?east|\bretreating|\brabi\b"),
+    ("pre_monsoon", r"\bpre[- ]?monsoon|\bsummer\b"),
+    ("winter", r"\bwinter\b"),
+    ("southwest_monsoon", r"south[- ]?west|\bmonsoon|\bkharif\b"),
+]
+
+
+def _tokens(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+class QueryResult:
+    """A computed answer: a one-line `text` plus the `table` it was derived from."""
+
+    def __init__(self, text, table=None, intent=None):
+        self.text = text
+        self.table = table
+        self.intent = intent or {}
+
+    def __str__(self):
+        return self.text
+
+
+class QueryEngine:
+    """
+    Answers common analytical questions from a resident DataFrame.
+
+    On construction the transformed data is indexed once: dimension columns
+    (e.g. district, mandal) become categoricals, and sum/count/max/min cubes
+    are pre-aggregated over the dimension hierarchy, by month and by date.
+    `answer()` parses a question into an intent (aggregate, measure,
+    filters, group-by, top-N, trend) and resolves it from the smallest cube
+    that covers it, so typical questions take a few milliseconds and never
+    touch an LLM. Returns None for questions it cannot map to an intent.
+
+    `rollups` ({name: DataFrame} from aggregation.load_rollups) answer
+    weekly, rolling-window, seasonal and departure-from-normal questions.
+    """
+
+    def __init__(self, df, dimensions=None, date_col=None, measures=None, rollups=None):
+        df = df.copy(deep=False)
+        if date_col is None:
+            # CSV checkpoints come back with dates as text.
+            for col in df.columns:
+                if "date" in str(col).lower() and df[col].dtype == object and not str(col).endswith("_yyyy_mm"):
+                    parsed = pd.to_datetime(df[col], errors="coerce", format="mixed")
+                    if parsed.notna().mean() > 0.9:
+                        df[col] = parsed
+        self.date_col = date_col or next(
+            (c for c in df.columns if pd.api.types.is_datetime64_any_dtype(df[c])), None
+        )
+        self.measures = measures or [
+            c for c in df.select_dtypes(include=["number"]).columns if not str(c).startswith("_qc_")
+        ]
+        if dimensions is None:
+            dimensions = [
+                c for c in df.select_dtypes(include=["object", "category"]).columns
+                if not str(c).startswith("_") and not str(c).endswith("_yyyy_mm")
+            ]
+            # Coarse to fine, so prefixes of the list form a hierarchy (district > mandal).
+            dimensions = sorted(dimensions, key=lambda c: df[c].nunique())
+        self.dimensions = list(dimensions)
+        for col in self.dimensions:
+            df[col] = df[col].astype("category")
+        if self.date_col:
+            df[MONTH_KEY] = df[self.date_col].dt.to_period("M")
+        self.df = df
+        self._values = self._index_values()
+        # Normalized name -> dimensions having it, coarsest first.
+        self._names = {}
+        for dim in self.dimensions:
+            for name in self._values[dim]:
+                self._names.setdefault(name, []).append(dim)
+        self._max_name_words = max((len(n.split()) for n in self._names), default=1)
+        self.cubes = self._build_cubes()
+        self.rollups = rollups or {}
+
+    # --- indexing ---
+
+    def _index_values(self):
+        """{dimension: {lowercased value: value}} for matching names in questions."""
+        values = {}
+        for col in self.dimensions:
+            values[col] = {
+                " ".join(_tokens(str(v))): v for v in self.df[col].cat.categories if not str(v).strip().isdigit()
+            }
+        return values
+
+    def _cube_keys(self):
+        keys = [()]
+        for i in range(1, len(self.dimensions) + 1):
+            keys.append(tuple(self.dimensions[:i]))
+        if self.date_col:
+            keys += [k + (MONTH_KEY,) for k in list(keys)]
+            keys += [(self.date_col,)]
+            if self.dimensions:
+                keys += [(self.dimensions[0], self.date_col)]
+        return keys
+
+    def _aggregate(self, df, keys, values=None):
+        """
+        sum/count/max/min of every measure per `keys`, in columns named
+        "<measure>:<agg>". Measures stored compactly (float32) are
+        aggregated in float64; pass `values` to reuse widened measures.
+        """
+        aggs = {_cell(m, f): (m, f) for m in self.measures for f in CUBE_AGGS}
+        values = dtypes.widen(df, self.measures) if values is None else values
+        if not keys:
+            return pd.DataFrame({k: [getattr(values[c], f)()] for k, (c, f) in aggs.items()})
+        return values.groupby([df[k] for k in keys], observed=True, sort=True).agg(**aggs).reset_index()
+
+    def _build_cubes(self):
+        values = dtypes.widen(self.df, self.measures)
+        return {keys: self._aggregate(self.df, keys, values) for keys in self._cube_keys()}
+
+    # --- question parsing ---
+
+    def parse(self, question):
+        """Intent dict for `question`, or None when no measure (or count) is named."""
+        q = question.lower()
+        tokens = _tokens(q)
+        token_set = set(tokens)
+
+        measure, used = self._match_measure(token_set)
+        q_for_agg = " ".join(t for t in tokens if t not in used)
+        agg = next((name for name, pattern in AGG_KEYWORDS if re.search(pattern, q_for_agg)), None)
+        rollup = next((name for name, pattern in ROLLUP_PATTERNS if re.search(pattern, q)), None)
+        if rollup not in self.rollups:
+            rollup = None
+        if measure is None:
+            additive = [m for m in self.measures if aggregation.is_additive(m)]
+            if rollup == "anomalies" and additive:
+                # "which districts are in drought": the main additive measure (rainfall).
+                measure = additive[0]
+            elif agg != "count" or not self.measures:
+                return None
+            else:
+                measure = self.measures[0]
+        ranking = bool(re.search(RANKING_WORDS, q_for_agg))
+
+        filters = self._match_entities(tokens)
+        period = self._match_period(q)
+        if period and not self.date_col:
+            return None
+
+        top_n = None
+        descending = not re.search(ASCENDING_WORDS, q)
+        number = r"(\d+|" + "|".join(NUMBER_WORDS) + r")"
+        dims = "|".join(map(re.escape, self.dimensions)) or "$^"
+        m = re.search(rf"\b(?:top|bottom|first|last)\s+{number}\b", q) or re.search(rf"\b{number}\s+(?:{dims})s?\b", q)
+        explicit_top_n = m is not None
+        if m:
+            top_n = int(m.group(1)) if m.group(1).isdigit() else NUMBER_WORDS[m.group(1)]
+        elif re.search(rf"\b(which|what)\s+(\w+\s+)?({dims})s?\b", q):
+            top_n = 1
+
+        group = None
+        for dim in self.dimensions:
+            if re.search(rf"\b(by|per|each|every|across|which|all|(top|bottom|first|last)?\s*{number})\s+{re.escape(dim)}s?\b", q) or \
+                    re.search(rf"\b{re.escape(dim)}[- ]?wise\b", q):
+                group = dim
+        trend = bool(re.search(r"\btrend|over time|daily|day by day|by date|by day|monthly|by month|per day", q))
+        if top_n and group is None and self.dimensions:
+            # "top 5 by rain" ranks the next level below whatever is filtered.
+            finer = [d for d in self.dimensions if d not in filters]
+            group = finer[0] if finer else self.dimensions[-1]
+
+        if agg is None and ranking and not top_n:
+            # "highest rainfall in Adilabad" with no ranking dimension: the single largest reading.
+            agg = "max" if descending else "min"
+        if agg is None:
+            agg = "sum" if any(h in measure.lower() for h in ADDITIVE_HINTS) else "mean"
+
+        intent = {
+            "measure": measure,
+            "agg": agg,
+            "filters": filters,
+            "period": period,
+            "group": group,
+            "top_n": top_n,
+            "trend": "monthly" if trend and re.search(r"month", q) else ("daily" if trend else None),
+            "descending": descending,
+        }
+        if rollup:
+            intent["rollup"] = rollup
+            # "rain in mandals of Medak", "which districts ...": list every entity at that level.
+            plural = [d for d in self.dimensions if d not in filters and re.search(rf"\b{re.escape(d)}s\b", q)]
+            if plural:
+                intent["group"] = plural[-1]
+                if not explicit_top_n:
+                    intent["top_n"] = None
+            if rollup == "anomalies":
+                deficit = re.search(r"\bdeficien|\bdeficit|\bdrought|\bbelow|\bdry|\bdri", q)
+                surplus = re.search(r"\bexcess|\babove|\bsurplus", q)
+                intent["descending"] = not deficit
+                intent["categories"] = (
+                    aggregation.DEPARTURE_LABELS[:3] if deficit and not surplus else
+                    aggregation.DEPARTURE_LABELS[-2:] if surplus and not deficit else None
+                )
+            elif rollup == "seasonal":
+                intent["season"] = next((name for name, pattern in SEASON_WORDS if re.search(pattern, q)), None)
+            elif rollup == "daily":
+                m = re.search(r"\b(\d+)[- ]day\b", q)
+                intent["window"] = int(m.group(1)) if m else None
+        return intent
+
+    def _match_measure(self, token_set):
+        best, best_score, best_tokens = None, 0, set()
+        for m in self.measures:
+            name_tokens = {t for t in _tokens(str(m)) if len(t) > 1 and t not in ("mm", "pct")}
+            score = len(name_tokens & token_set)
+            # Stems like "rainfall" / "rainy" also count for "rain".
+            score += sum(1 for t in name_tokens for w in token_set if w != t and w.startswith(t) and len(t) > 3)
+            if score > best_score:
+                best, best_score, best_tokens = m, score, name_tokens & token_set
+        if best is None and len(self.measures) == 1:
+            return self.measures[0], set()
+        return best, best_tokens
+
+    def _match_entities(self, tokens):
+        """
+        {dimension: [values]} named in the question, by n-gram lookup in the
+        value index (longest names first). A name shared by several
+        dimensions goes to the one named right after it ("Medak mandal"),
+        otherwise to the coarsest.
+        """
+        filters = {}
+        i = 0
+        while i < len(tokens):
+            for n in range(min(self._max_name_words, len(tokens) - i), 0, -1):
+                dims = self._names.get(" ".join(tokens[i:i + n]))
+                if dims:
+                    break
+            else:
+                i += 1
+                continue
+            following = tokens[i + n] if i + n < len(tokens) else ""
+            dim = next((d for d in dims if following.rstrip("s") == d), dims[0])
+            value = self._values[dim][" ".join(tokens[i:i + n])]
+            if value not in filters.setdefault(dim, []):
+                filters[dim].append(value)
+            i += n
+        return filters
+
+    def _match_period(self, q):
+        month_pattern = "|".join(sorted(MONTHS, key=len, reverse=True))
+        m = re.search(rf"\b(\d{{1,2}})(?:st|nd|rd|th)?\s+({month_pattern})\b|\b({month_pattern})\s+(\d{{1,2}})(?:st|nd|rd|th)?\b(?!\d)", q)
+        year_m = re.search(r"\b(19|20)\d{2}\b", q)
+        year = int(year_m.group(0)) if year_m else None
+        if m:
+            day = int(m.group(1) or m.group(4))
+            month = MONTHS[m.group(2) or m.group(3)]
+            if 1 <= day <= 31:
+                return {"day": day, "month": month, "year": year}
+        m = re.search(rf"\b({month_pattern})\b", q)
+        if m:
+            return {"month": MONTHS[m.group(1)], "year": year}
+        if year:
+            return {"year": year}
+        return None
+
+    # --- execution ---
+
+    def _pick_cube(self, needed):
+        """Smallest precomputed cube whose keys cover `needed`, or None."""
+        best = None
+        for keys, cube in self.cubes.items():
+            if set(needed) <= set(keys) and (best is None or len(cube) < len(self.cubes[best])):
+                best = keys
+        return best
+
+    def _period_mask(self, frame, period, key):
+        if key == MONTH_KEY:
+            col = frame[MONTH_KEY]
+            mask = col.dt.month == period["month"] if "month" in period else pd.Series(True, index=frame.index)
+            if period.get("year"):
+                mask &= col.dt.year == period["year"]
+            return mask
+        col = frame[key]
+        mask = pd.Series(True, index=frame.index)
+        for part in ("year", "month", "day"):
+            if period.get(part):
+                mask &= getattr(col.dt, part) == period[part]
+        return mask
+
+    def execute(self, intent):
+        if intent.get("rollup"):
+            result = self._execute_rollup(intent)
+            if result is not None:
+                return result
+        measure, agg = intent["measure"], intent["agg"]
+        filters, period = intent["filters"], intent["period"]
+        group_dims = []
+        if intent["group"]:
+            # Finer dimensions are grouped together with their parents (mandal names repeat across districts).
+            group_dims = self.dimensions[: self.dimensions.index(intent["group"]) + 1]
+        time_key = None
+        if intent["trend"] == "daily" or (period and "day" in period):
+            time_key = self.date_col
+        elif intent["trend"] == "monthly" or period:
+            time_key = MONTH_KEY
+        needed = set(filters) | set(group_dims)
+        if filters:
+            # Filter dimensions need their parents too, to use the hierarchical cubes.
+            deepest = max(self.dimensions.index(d) for d in filters)
+            needed |= set(self.dimensions[: deepest + 1])
+        if time_key:
+            needed.add(time_key)
+
+        keys = self._pick_cube(needed)
+        frame = self.cubes[keys] if keys is not None else self._aggregate(self.df, tuple(sorted(needed)))
+        mask = pd.Series(True, index=frame.index)
+        for dim, values in filters.items():
+            mask &= frame[dim].isin(values)
+        if period and time_key:
+            mask &= self._period_mask(frame, period, time_key)
+        frame = frame[mask]
+
+        out_keys = list(group_dims)
+        if intent["trend"]:
+            out_keys.append(time_key)
+        if out_keys:
+            grouped = frame.groupby(out_keys, observed=True, sort=True)
+            parts = {f: grouped[_cell(measure, f)].agg(REAGG[f]) for f in CUBE_AGGS}
+        else:
+            parts = {f: getattr(frame[_cell(measure, f)], REAGG[f])() for f in CUBE_AGGS}
+        value = parts["sum"] / parts["count"] if agg == "mean" else parts[agg]
+
+        if not out_keys:
+            # An empty selection sums to 0; report it like the grouped path does.
+            if not parts["count"]:
+                return QueryResult("No matching records.", None, intent)
+            return QueryResult(self._phrase(intent, value), None, intent)
+
+        table = value.rename(measure).reset_index() if hasattr(value, "reset_index") else None
+        if table is None or table.empty:
+            return QueryResult("No matching records.", table, intent)
+        table = table.dropna(subset=[measure])
+        if intent["trend"]:
+            table = table.sort_values(out_keys)
+        else:
+            table = table.sort_values(measure, ascending=not intent["descending"])
+            if intent["top_n"]:
+                table = table.head(intent["top_n"])
+        return QueryResult(self._phrase(intent, table), table.reset_index(drop=True), intent)
+
+    def _execute_rollup(self, intent):
+        """Answer from a rollup table; None when the table can't (e.g. no such rolling window)."""
+        name, measure = intent["rollup"], intent["measure"]
+        table = self.rollups[name]
+        filters, period = intent["filters"], intent["period"]
+        dims = [d for d in self.dimensions if d in table.columns]
+        if intent["group"] in dims:
+            level = intent["group"]
+        elif filters and set(filters) <= set(dims):
+            level = max(filters, key=dims.index)
+        elif name == "anomalies" and dims:
+            level = dims[0]
+        else:
+            level = aggregation.LEVEL_ALL
+        keys = dims[: dims.index(level) + 1] if level in dims else []
+
+        value_col = measure
+        if name == "daily":
+            windows = sorted(int(c.split(":roll")[1][:-1]) for c in table.columns if c.startswith(f"{measure}:roll"))
+            window = intent["window"] or (windows[0] if windows else None)
+            if window not in windows:
+                return None
+            value_col = f"{measure}:roll{window}d"
+        elif name == "anomalies":
+            value_col = "departure_pct"
+        if value_col not in table.columns and name != "anomalies":
+            return None
+
+        mask = table[aggregation.LEVEL] == level
+        for dim, values in filters.items():
+            if dim in table.columns:
+                mask &= table[dim].isin(values)
+        if name == "anomalies":
+            mask &= table["measure"] == measure
+            if intent.get("categories") and aggregation.is_additive(measure):
+                mask &= table["category"].isin(intent["categories"])
+        if name == "seasonal":
+            if intent.get("season"):
+                mask &= table["season"] == intent["season"]
+            if period and period.get("year"):
+                mask &= table["season_year"] == period["year"]
+        elif period:
+            mask &= self._period_mask(table, period, aggregation.PERIOD)
+        frame = table[mask]
+        if frame.empty:
+            return QueryResult("No matching records.", frame, intent)
+        if name in ("anomalies", "daily") and not (period and period.get("day")):
+            # Latest month (or day) unless one was asked for.
+            frame = frame[frame[aggregation.PERIOD] == frame[aggregation.PERIOD].max()]
+
+        time_cols = ["season_year", "season"] if name == "seasonal" else [aggregation.PERIOD]
+        extra = ["actual", "normal", "category"] if name == "anomalies" else []
+        out = frame[keys + time_cols + extra + [value_col]].dropna(subset=[value_col])
+        ranked = bool(keys) and (name != "weekly" or intent["top_n"]) and len(out[time_cols].drop_duplicates()) == 1
+        if ranked:
+            out = out.sort_values(value_col, ascending=not intent["descending"])
+            if intent["top_n"]:
+                out = out.head(intent["top_n"])
+        else:
+            out = out.sort_values(keys + time_cols)
+        out = out.reset_index(drop=True)
+        ranked_by = keys[-1] if ranked and keys[-1] not in filters else None
+        return QueryResult(self._phrase_rollup(intent, out, value_col, ranked_by), out, intent)
+
+    def _phrase_rollup(self, intent, table, value_col, ranked_by=None):
+        name, measure = intent["rollup"], intent["measure"]
+        if name == "anomalies":
+            label = f"Departure from normal of {measure} (%)"
+        elif name == "seasonal":
+            label = f"{AGG_LABELS['sum' if aggregation.is_additive(measure) else 'mean']} {measure} by season"
+        elif name == "weekly":
+            label = f"Weekly {measure}"
+        else:
+            label = f"{value_col.split(':roll')[1][:-1]}-day rolling {measure}"
+        label += self._describe_scope(intent)
+        if ranked_by and intent["top_n"]:
+            label += f", {'top' if intent['descending'] else 'bottom'} {intent['top_n']} by {ranked_by}"
+        elif ranked_by:
+            label += f" by {ranked_by}"
+        lines = []
+        for _, row in table.head(50).iterrows():
+            key = ", ".join(str(row[c]) if c == "season_year" else _fmt(row[c])
+                            for c in table.columns if c not in (value_col, "actual", "normal", "category"))
+            value = _fmt(row[value_col])
+            if name == "anomalies":
+                value = f"{row[value_col]:+.1f}% ({_fmt(row['actual'])} vs normal {_fmt(row['normal'])}"
+                value += f", {row['category']})" if pd.notna(row["category"]) else ")"
+            lines.append(f"- {key}: {value}")
+        return label + ":\n" + "\n".join(lines)
+
+    def _describe_scope(self, intent):
+        parts = []
+        for dim, values in intent["filters"].items():
+            parts.append(f"{dim} {', '.join(map(str, values))}")
+        period = intent["period"]
+        if period:
+            label = []
+            if period.get("day"):
+                label.append(str(period["day"]))
+            if period.get("month"):
+                label.append(calendar.month_name[period["month"]])
+            if period.get("year"):
+                label.append(str(period["year"]))
+            parts.append(" ".join(label))
+        return f" in {' / '.join(parts)}" if parts else ""
+
+    def _phrase(self, intent, value):
+        label = f"{AGG_LABELS[intent['agg']]} {intent['measure']}{self._describe_scope(intent)}"
+        if isinstance(value, pd.DataFrame):
+            measure = intent["measure"]
+            lines = []
+            for _, row in value.head(50).iterrows():
+                key = ", ".join(_fmt(row[c]) for c in value.columns if c != measure)
+                lines.append(f"- {key}: {_fmt(row[measure])}")
+            if intent["trend"]:
+                heading = f"{label}, {intent['trend']}"
+            elif intent["top_n"]:
+                order = "top" if intent["descending"] else "bottom"
+                heading = f"{label}, {order} {intent['top_n']} by {intent['group']}"
+            else:
+                heading = f"{label} by {intent['group']}"
+            return heading + ":\n" + "\n".join(lines)
+        if pd.isna(value):
+            return f"{label}: no matching records."
+        return f"{label}: {_fmt(value)}"
+
+    def answer(self, question):
+        """QueryResult for `question`, or None if it doesn't map to a supported intent."""
+        intent = self.parse(question)
+        if intent is None:
+            return None
+        return self.execute(intent)
+
+    def schema_summary(self):
+        """Compact description of the data for LLM fallback prompts."""
+        lines = [f"Rows: {len(self.df)}"]
+        for dim in self.dimensions:
+            lines.append(f"Dimension {dim}: {self.df[dim].nunique()} values")
+        if self.date_col:
+            lines.append(f"Date column {self.date_col}: {self.df[self.date_col].min()} to {self.df[self.date_col].max()}")
+        totals = self.cubes[()]
+        for m in self.measures:
+            stats = {f: totals[_cell(m, f)].iloc[0] for f in CUBE_AGGS}
+            mean = stats["sum"] / stats["count"] if stats["count"] else float("nan")
+            lines.append(
+                f"Measure {m}: total {_fmt(stats['sum'])}, mean {_fmt(mean)}, "
+                f"min {_fmt(stats['min'])}, max {_fmt(stats['max'])}"
+            )
+        return "\n".join(lines)
+
+
+def _cell(measure, agg):
+    return f"{measure}:{agg}"
+
+
+def _fmt(value):
+    if isinstance(value, pd.Timestamp) and value == value.normalize():
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return f"{value:,}" if isinstance(value, int) else str(value)
+
+
+def answer(engine, question, llm=None, phrase_with_llm=False):
+    """
+    Answer `question` from `engine`; the LLM (anything with .ask(prompt)) is
+    only used to reword a computed answer when `phrase_with_llm` is set, or
+    for questions the engine can't map, with a schema summary as context.
+    """
+    result = engine.answer(question)
+    if result is None:
+        if llm is None:
+            return "Sorry, I can't answer that from the data."
+        prompt = (
+            f"Dataset summary:\n{engine.schema_summary()}\n\n"
+            f"Sample rows:\n{engine.df.drop(columns=[MONTH_KEY], errors='ignore').head(5).to_csv(index=False)}\n"
+            f"User question: {question}\n\nPlease answer concisely."
+        )
+        return llm.ask(prompt)
+    if phrase_with_llm and llm is not None:
+        prompt = (
+            f"User question: {question}\n\nComputed answer:\n{result.text}\n\n"
+            "Rephrase the computed answer as a short reply. Do not change any numbers."
+        )
+        return llm.ask(prompt)
+    return result.text
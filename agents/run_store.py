@@ -0,0 +1,328 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from datetime import datetime, timezone
+import yaml
+from agents import provenance
+from agents.artifacts import CHECKPOINTS, TABLE_FORMATS
+
+DEFAULT_STORE = "run_artifacts/provenance.db"
+RUN_METADATA = "run_metadata.json"
+PERFORMANCE_REPORT = "performance_report.json"
+
+# Environments and configs are stored once per content hash and referenced
+# by the runs that used them. Checksums are lowercase hex SHA-256.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS environments (
+    hash TEXT PRIMARY KEY,
+    python_version TEXT,
+    platform TEXT,
+    requirements TEXT
+);
+CREATE TABLE IF NOT EXISTS configs (
+    hash TEXT PRIMARY KEY,
+    body TEXT
+);
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    run_dir TEXT UNIQUE NOT NULL,
+    started TEXT,
+    mode TEXT,
+    dataset TEXT,
+    dataset_checksum TEXT,
+    config_hash TEXT REFERENCES configs (hash),
+    environment_hash TEXT REFERENCES environments (hash),
+    git_commit TEXT,
+    llm_model TEXT,
+    user TEXT,
+    wall_seconds REAL,
+    peak_rss_mb REAL
+);
+CREATE TABLE IF NOT EXISTS stages (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    stage TEXT NOT NULL,
+    seconds REAL,
+    cpu_seconds REAL,
+    rows_in INTEGER,
+    rows_out INTEGER,
+    cache TEXT,
+    peak_rss_mb REAL
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    path TEXT NOT NULL,
+    checksum TEXT,
+    bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS runs_by_checksum ON runs (dataset_checksum, started);
+CREATE INDEX IF NOT EXISTS runs_by_started ON runs (started);
+CREATE INDEX IF NOT EXISTS stages_by_run ON stages (run_id, stage, seconds);
+CREATE INDEX IF NOT EXISTS outputs_by_checksum ON outputs (checksum);
+CREATE INDEX IF NOT EXISTS outputs_by_run ON outputs (run_id);
+"""
+
+RUN_COLUMNS = ["id", "started", "mode", "dataset", "dataset_checksum", "wall_seconds", "git_commit"]
+
+
+def content_hash(value):
+    """SHA-256 of `value` as canonical JSON."""
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def output_artifacts(output_dir):
+    """Exported checkpoint tables and rollup tables in a run's output dir."""
+    names = [name + ext for name in CHECKPOINTS for ext in TABLE_FORMATS.values()]
+    names += sorted(n for n in os.listdir(output_dir) if n.startswith("rollup_") and n.endswith(".parquet"))
+    return [os.path.join(output_dir, n) for n in names if os.path.isfile(os.path.join(output_dir, n))]
+
+
+def _load_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _utc(timestamp):
+    """ISO `timestamp` as UTC with a Z suffix (as in run_metadata.json); naive ones are local time."""
+    if not timestamp:
+        return None
+    try:
+        when = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+    except ValueError:
+        return timestamp
+    return when.astimezone(timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+def _run_config(metadata):
+    """The config a run was started with, from its metadata's config_path if that is still readable."""
+    path = metadata.get("config_path")
+    if not path:
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+    except (OSError, yaml.YAMLError):
+        return None
+    return config if isinstance(config, dict) else None
+
+
+def _checksum_range(prefix):
+    """Bounds selecting every hex checksum starting with `prefix`, so the index is used."""
+    prefix = prefix.lower()
+    return prefix, prefix + "g"
+
+
+class RunStore:
+    """
+    Provenance of every run in one SQLite database: when it started, in
+    which mode, on which dataset (by checksum), with which config and
+    environment (each stored once per content hash), how long each stage
+    took and the checksums of the artifacts it wrote. Indexed on dataset
+    and artifact checksums and on start time, so lineage and timing
+    history queries over thousands of runs don't touch the run dirs.
+    Safe to write from concurrent runs (WAL journal, busy timeout).
+    """
+
+    def __init__(self, path=DEFAULT_STORE):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    @classmethod
+    def from_config(cls, config: dict):
+        """The store named by `provenance.store`, or None if it is disabled."""
+        cfg = (config or {}).get("provenance", {}) or {}
+        path = cfg.get("store", DEFAULT_STORE)
+        return cls(path) if path else None
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, run_dir, config=None, dataset_checksum=None, output_checksums=True):
+        """
+        Record (or re-record) the run in `run_dir` from its run_metadata.json
+        and performance_report.json. `dataset_checksum` fills in for runs
+        whose metadata has none (e.g. URL sources). Returns the run id.
+        """
+        metadata = _load_json(os.path.join(run_dir, RUN_METADATA)) or {}
+        report = _load_json(os.path.join(run_dir, PERFORMANCE_REPORT)) or {}
+        env_hash = None
+        if metadata.get("requirements") is not None:
+            env = {k: metadata.get(k) for k in ("python_version", "platform", "requirements")}
+            env_hash = content_hash(env)
+        config_hash = content_hash(config) if config is not None else None
+        outputs = [
+            (path, provenance.sha256(path) if output_checksums else None, os.path.getsize(path))
+            for path in output_artifacts(run_dir)
+        ]
+        if config is not None:
+            mode = (config.get("execution", {}) or {}).get("mode") or "memory"
+            dataset = (config.get("dataset_source", {}) or {}).get("location")
+        else:
+            mode, dataset = None, None
+
+        with self.conn:
+            if env_hash:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO environments VALUES (?, ?, ?, ?)",
+                    (env_hash, metadata.get("python_version"), metadata.get("platform"),
+                     json.dumps(metadata["requirements"])),
+                )
+            if config_hash:
+                self.conn.execute(
+                    "INSERT OR IGNORE INTO configs VALUES (?, ?)", (config_hash, json.dumps(config, default=str))
+                )
+            run_dir = os.path.abspath(run_dir)
+            old = self.conn.execute("SELECT id FROM runs WHERE run_dir = ?", (run_dir,)).fetchone()
+            if old:
+                for table in ("stages", "outputs"):
+                    self.conn.execute(f"DELETE FROM {table} WHERE run_id = ?", (old["id"],))
+                self.conn.execute("DELETE FROM runs WHERE id = ?", (old["id"],))
+            run_id = self.conn.execute(
+                "INSERT INTO runs (run_dir, started, mode, dataset, dataset_checksum, config_hash, environment_hash,"
+                " git_commit, llm_model, user, wall_seconds, peak_rss_mb) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_dir, _utc(metadata.get("timestamp") or report.get("generated")), mode, dataset,
+                 metadata.get("dataset_checksum") or dataset_checksum, config_hash, env_hash,
+                 metadata.get("git_commit"), metadata.get("llm_model"), metadata.get("user"),
+                 report.get("wall_seconds"), report.get("peak_rss_mb")),
+            ).lastrowid
+            self.conn.executemany(
+                "INSERT INTO stages VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(run_id, s["stage"], s.get("seconds"), s.get("cpu_seconds"), s.get("rows_in"), s.get("rows_out"),
+                  s.get("cache"), s.get("peak_rss_mb")) for s in report.get("stages", [])],
+            )
+            self.conn.executemany(
+                "INSERT INTO outputs VALUES (?, ?, ?, ?)",
+                [(run_id, os.path.abspath(path), checksum, size) for path, checksum, size in outputs],
+            )
+        return run_id
+
+    def import_runs(self, root, output_checksums=True):
+        """
+        Record every run dir under `root` (dirs holding a performance report)
+        that isn't in the store yet, with the config named in its metadata
+        when that file is still readable; returns how many were added.
+        """
+        recorded = {r[0] for r in self.conn.execute("SELECT run_dir FROM runs")}
+        n = 0
+        for dirpath, _, filenames in os.walk(root):
+            if PERFORMANCE_REPORT in filenames and os.path.abspath(dirpath) not in recorded:
+                metadata = _load_json(os.path.join(dirpath, RUN_METADATA)) or {}
+                self.record(dirpath, _run_config(metadata), output_checksums=output_checksums)
+                n += 1
+        return n
+
+    def _where(self, checksum=None, dataset=None, since=None, until=None):
+        clauses, params = [], []
+        if checksum:
+            clauses.append("runs.dataset_checksum >= ? AND runs.dataset_checksum < ?")
+            params += _checksum_range(checksum)
+        if dataset:
+            clauses.append("runs.dataset LIKE ?")
+            params.append(f"%{dataset}%")
+        if since:
+            clauses.append("runs.started >= ?")
+            params.append(since)
+        if until:
+            # Dates compare as string prefixes of the ISO timestamps, so a whole `until` day is included.
+            clauses.append("runs.started < ?")
+            params.append(until + "~")
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def runs(self, checksum=None, dataset=None, since=None, until=None, limit=50):
+        """Runs matching the filters, newest first, as dicts."""
+        where, params = self._where(checksum, dataset, since, until)
+        rows = self.conn.execute(
+            f"SELECT {', '.join(RUN_COLUMNS)} FROM runs{where} ORDER BY started DESC LIMIT ?", params + [limit]
+        )
+        return [dict(r) for r in rows]
+
+    def stage_history(self, stage=None, checksum=None, dataset=None, since=None, until=None):
+        """
+        Per-stage timing summary over matching runs, stages taking the most
+        total time first: runs, mean, p50, p95 and max seconds, and the
+        seconds of the latest run.
+        """
+        where, params = self._where(checksum, dataset, since, until)
+        if stage:
+            where += (" AND" if where else " WHERE") + " stages.stage = ?"
+            params.append(stage)
+        # CROSS JOIN keeps runs as the outer table: matching runs come from its
+        # indexes in start order, and their stages from the covering stages index.
+        rows = self.conn.execute(
+            "SELECT stages.stage, stages.seconds FROM runs CROSS JOIN stages ON stages.run_id = runs.id"
+            f"{where} ORDER BY runs.started",
+            params,
+        )
+        by_stage = {}
+        for name, seconds in rows:
+            if seconds is not None:
+                by_stage.setdefault(name, []).append(seconds)
+        history = []
+        for name, seconds in sorted(by_stage.items(), key=lambda item: -sum(item[1])):
+            ordered = sorted(seconds)
+            at = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))], 3)
+            history.append({
+                "stage": name, "runs": len(seconds), "mean": round(sum(seconds) / len(seconds), 3),
+                "p50": at(0.5), "p95": at(0.95), "max": round(ordered[-1], 3), "latest": round(seconds[-1], 3),
+            })
+        return history
+
+    def lineage(self, checksum, depth=10, _seen=()):
+        """
+        Runs that read the file with `checksum` (or a prefix of it) as their
+        dataset, and the runs that wrote it, each with the lineage of its own
+        dataset, up to `depth` levels upstream.
+        """
+        seen = set(_seen) | {checksum}
+        low, high = _checksum_range(checksum)
+        consumed = self.conn.execute(
+            f"SELECT {', '.join(RUN_COLUMNS)} FROM runs WHERE dataset_checksum >= ? AND dataset_checksum < ?"
+            " ORDER BY started DESC", (low, high),
+        )
+        produced = self.conn.execute(
+            f"SELECT DISTINCT {', '.join('runs.' + c for c in RUN_COLUMNS)}, outputs.path AS output FROM outputs"
+            " JOIN runs ON runs.id = outputs.run_id WHERE outputs.checksum >= ? AND outputs.checksum < ?"
+            " ORDER BY runs.started DESC", (low, high),
+        )
+        producers = []
+        for r in produced:
+            run = dict(r)
+            # A run's `raw` checkpoint can be byte-identical to its own input; don't loop on it.
+            if depth > 0 and run["dataset_checksum"] and run["dataset_checksum"] not in seen:
+                run["upstream"] = self.lineage(run["dataset_checksum"], depth - 1, seen)["produced_by"]
+            producers.append(run)
+        return {"checksum": checksum, "consumed_by": [dict(r) for r in consumed], "produced_by": producers}
+
+
+def format_table(rows, columns=None):
+    """Plain-text table of dict rows (for the query CLI)."""
+    if not rows:
+        return "(no runs)"
+    columns = columns or list(rows[0])
+    cells = [[("" if r.get(c) is None else str(r.get(c))) for c in columns] for r in rows]
+    widths = [max(len(c), *(len(row[i]) for row in cells)) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.ljust(w) for c, w in zip(columns, widths))]
+    lines.append("  ".join("-" * w for w in widths))
+    lines += ["  ".join(v.ljust(w) for v, w in zip(row, widths)) for row in cells]
+    return "\n".join(lines)
+
+
+def timed_query(fn, *args, **kwargs):
+    """(result, milliseconds) of one store query."""
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
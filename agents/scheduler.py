@@ -0,0 +1,110 @@
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class TaskGraph:
+    """
+    Small dependency-aware task runner.
+
+    Tasks are added with the names of the tasks they depend on; a task's
+    function is called with its dependencies' results as positional
+    arguments, in the order the dependencies were listed. `run` executes
+    every task whose dependencies are done on a thread pool, records
+    start/end times per task and returns {name: result}.
+    """
+
+    def __init__(self):
+        self.tasks = {}
+        self.results = {}
+        self.timings = {}
+        self._t0 = None
+
+    def add(self, name, fn, deps=()):
+        for dep in deps:
+            if dep not in self.tasks:
+                raise ValueError(f"Task '{name}' depends on unknown task '{dep}'")
+        self.tasks[name] = (fn, list(deps))
+        return name
+
+    def _call(self, name):
+        fn, deps = self.tasks[name]
+        start = time.perf_counter()
+        try:
+            return fn(*[self.results[d] for d in deps])
+        finally:
+            end = time.perf_counter()
+            self.timings[name] = {
+                "start": round(start - self._t0, 6),
+                "end": round(end - self._t0, 6),
+                "duration": round(end - start, 6),
+                "thread": threading.current_thread().name,
+            }
+
+    def run(self, workers=1):
+        """Run all tasks with up to `workers` in parallel; the first failure is re-raised."""
+        self._t0 = time.perf_counter()
+        pending = dict(self.tasks)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="stage") as pool:
+            while pending or running:
+                ready = [n for n, (_, deps) in pending.items() if all(d in self.results for d in deps)]
+                for name in ready:
+                    del pending[name]
+                    running[pool.submit(self._call, name)] = name
+                if not running:
+                    raise RuntimeError(f"Unsatisfiable dependencies for tasks: {sorted(pending)}")
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    name = running.pop(fut)
+                    try:
+                        self.results[name] = fut.result()
+                    except Exception:
+                        for other in running:
+                            other.cancel()
+                        raise
+        return self.results
+
+    def critical_path(self):
+        """(task names, seconds) of the longest dependency chain by measured duration."""
+        finish = {}
+        via = {}
+        for name in self._topological_order():
+            _, deps = self.tasks[name]
+            best = max(deps, key=lambda d: finish[d], default=None)
+            via[name] = best
+            finish[name] = (finish[best] if best else 0.0) + self.timings.get(name, {}).get("duration", 0.0)
+        if not finish:
+            return [], 0.0
+        node = max(finish, key=finish.get)
+        total = finish[node]
+        path = []
+        while node:
+            path.append(node)
+            node = via[node]
+        return path[::-1], round(total, 6)
+
+    def _topological_order(self):
+        order, seen = [], set()
+
+        def visit(name):
+            if name in seen:
+                return
+            seen.add(name)
+            for dep in self.tasks[name][1]:
+                visit(dep)
+            order.append(name)
+
+        for name in self.tasks:
+            visit(name)
+        return order
+
+    def report(self):
+        path, total = self.critical_path()
+        wall = max((t["end"] for t in self.timings.values()), default=0.0)
+        return {
+            "wall_seconds": wall,
+            "critical_path": path,
+            "critical_path_seconds": total,
+            "tasks": {n: dict(self.timings[n], deps=self.tasks[n][1]) for n in self.tasks if n in self.timings},
+        }
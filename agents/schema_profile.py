@@ -0,0 +1,163 @@
+import os
+import csv
+import json
+import hashlib
+import threading
+import pandas as pd
+
+DEFAULT_PROFILE_DIR = ".schema_profiles"
+# Bump when the stored profile layout changes.
+PROFILE_FORMAT = 1
+SNIFF_BYTES = 64 * 1024
+SNIFF_DELIMITERS = ",\t;| "
+# Explicit formats tried (on a sample) when a date column is first seen.
+DATE_FORMATS = [
+    "%d-%b-%y", "%d-%b-%Y", "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%dT%H:%M:%S",
+    "%d/%m/%Y", "%m/%d/%Y", "%d-%m-%Y", "%m-%d-%Y", "%d.%m.%Y", "%Y/%m/%d",
+    "%d/%m/%y", "%m/%d/%y", "%d %b %Y", "%b %d %Y", "%Y%m%d",
+]
+DATE_SAMPLE_SIZE = 200
+# Text columns with at most this share of distinct values are read as categoricals.
+CATEGORICAL_MAX_RATIO = 0.5
+# Leading rows that decide, on a first read, which text columns are categoricals.
+CATEGORICAL_SAMPLE_ROWS = 50_000
+
+
+def sniff_delimiter(path, nbytes=SNIFF_BYTES):
+    """Delimiter of a delimited text file, sniffed once from its first `nbytes`."""
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        prefix = f.read(nbytes)
+    # Only whole lines, so a row cut off at the prefix end doesn't skew the sniffer.
+    if "\n" in prefix and len(prefix) == nbytes:
+        prefix = prefix[: prefix.rindex("\n")]
+    try:
+        return csv.Sniffer().sniff(prefix, delimiters=SNIFF_DELIMITERS).delimiter
+    except csv.Error:
+        return ","
+
+
+def detect_date_format(series, sample_size=DATE_SAMPLE_SIZE):
+    """
+    The DATE_FORMATS entry that parses the most of a sample of distinct
+    values of `series` (at least 90% of them), or None.
+    """
+    values = pd.Series(series.dropna().unique()).astype(str).drop_duplicates()
+    if values.empty:
+        return None
+    values = values.head(sample_size)
+    best, best_ok = None, 0.9 * len(values)
+    for fmt in DATE_FORMATS:
+        ok = pd.to_datetime(values, format=fmt, errors="coerce").notna().sum()
+        if ok > best_ok:
+            best, best_ok = fmt, ok
+            if ok == len(values):
+                break
+    return best
+
+
+def categorical_columns(df):
+    """Text columns whose values repeat enough to be worth a categorical dtype."""
+    n = max(len(df), 1)
+    return [
+        c for c in df.select_dtypes(include=["object"]).columns
+        if df[c].nunique(dropna=True) / n <= CATEGORICAL_MAX_RATIO
+    ]
+
+
+class SchemaProfile:
+    """
+    What was learned about a source the first time it was read: delimiter,
+    column dtypes (including categoricals), date columns and their explicit
+    formats. Persisted per source so later runs skip sniffing and inference
+    and read/parse with the known settings; a source whose header no longer
+    matches is profiled again.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        self.data = {}
+        self._lock = threading.Lock()
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") == PROFILE_FORMAT and data.get("source") == source:
+                self.data = data
+        except (OSError, ValueError):
+            pass
+
+    @classmethod
+    def for_source(cls, config: dict):
+        """Profile of the configured dataset_source, or None if disabled."""
+        profile_cfg = (config or {}).get("schema_profile", {}) or {}
+        if not profile_cfg.get("enabled", True):
+            return None
+        source = config["dataset_source"]
+        location = source["location"]
+        if source.get("type", "file") == "file":
+            location = os.path.abspath(location)
+        key = hashlib.sha256(location.encode("utf-8")).hexdigest()[:16]
+        profile_dir = profile_cfg.get("dir", DEFAULT_PROFILE_DIR)
+        os.makedirs(profile_dir, exist_ok=True)
+        return cls(os.path.join(profile_dir, key + ".json"), location)
+
+    def get(self, name, default=None):
+        return self.data.get(name, default)
+
+    def update(self, **values):
+        with self._lock:
+            self.data.update(values, format=PROFILE_FORMAT, source=self.source)
+            tmp = f"{self.path}.{threading.get_ident()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.data, f, indent=2)
+            os.replace(tmp, self.path)
+
+    def reset(self):
+        with self._lock:
+            self.data = {}
+
+
+def read_csv(path, profile=None):
+    """
+    Read a delimited file in one pass. With a profile, the cached delimiter
+    and dtypes are used directly; otherwise (or if the file no longer fits
+    the profile) the delimiter is sniffed, text columns with repeating
+    values (judged on the first CATEGORICAL_SAMPLE_ROWS rows) are read as
+    categoricals, and the profile is updated.
+    """
+    if profile is not None and profile.get("dtypes"):
+        try:
+            df = pd.read_csv(path, sep=profile.get("delimiter"), dtype=profile.get("dtypes"))
+            if list(df.columns) == list(profile.get("dtypes")):
+                return df
+        except (ValueError, TypeError):
+            pass
+        profile.reset()
+
+    delimiter = sniff_delimiter(path)
+    df = pd.read_csv(path, sep=delimiter, nrows=CATEGORICAL_SAMPLE_ROWS)
+    categorical = categorical_columns(df)
+    if len(df) == CATEGORICAL_SAMPLE_ROWS:
+        # Decided on the leading rows, so the whole file's strings never exist as objects.
+        df = pd.read_csv(path, sep=delimiter, dtype={c: "category" for c in categorical})
+    for col in categorical:
+        df[col] = df[col].astype("category")
+    if profile is not None:
+        profile.update(delimiter=delimiter, dtypes={str(c): str(t) for c, t in df.dtypes.items()})
+    return df
+
+
+def read_csv_chunks(path, chunk_size, profile=None):
+    """
+    Iterator of `chunk_size`-row DataFrames of a delimited file, read with
+    the profile's delimiter and dtypes while its header still matches the
+    profile (the delimiter is sniffed otherwise). Categorical and integer
+    columns are left to per-chunk inference: each chunk would get its own
+    categories, and a later chunk may hold missing values.
+    """
+    dtypes = (profile.get("dtypes") or {}) if profile is not None else {}
+    delimiter = profile.get("delimiter") if dtypes else None
+    if delimiter is None or list(pd.read_csv(path, sep=delimiter, nrows=0).columns) != list(dtypes):
+        delimiter, dtypes = sniff_delimiter(path), {}
+    dtypes = {c: t for c, t in dtypes.items() if t != "category" and not t.startswith(("int", "uint"))}
+    return pd.read_csv(path, sep=delimiter, dtype=dtypes or None, chunksize=chunk_size)
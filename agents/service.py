@@ -0,0 +1,319 @@
+"""
+Long-running Q&A service: a small HTTP/JSON server over the query engine.
+
+The transformed dataset of a finished pipeline run is loaded once into a
+resident QueryEngine that every request shares. Questions are answered
+concurrently (asyncio for connections, a thread pool for the engine and
+any LLM fallback), and the service hot-swaps to a newer finished run as
+soon as one appears, without dropping in-flight requests.
+
+    GET  /health    current run and row count
+    GET  /metrics   request counts, latency percentiles, throughput, swaps
+    POST /query     {"question": "..."} -> {"answer": "...", ...}
+    POST /reload    {"run_dir": "..."} (optional) -> swap to that or the latest run
+"""
+import os
+import glob
+import json
+import time
+import asyncio
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+
+from agents import aggregation, logging_agent, query_engine
+from agents.artifacts import find_artifact, read_artifact
+from agents.query_engine import QueryEngine
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8000
+DEFAULT_WORKERS = 4
+DEFAULT_WATCH_INTERVAL_S = 5
+DEFAULT_ARTIFACTS_ROOT = "run_artifacts"
+# Latency percentiles are computed over this many most recent requests.
+LATENCY_WINDOW = 10_000
+THROUGHPUT_WINDOW_S = 60
+# Engine answers cached per snapshot (repeated questions skip parsing and execution).
+ANSWER_CACHE_SIZE = 1024
+MAX_BODY_BYTES = 1024 * 1024
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def latest_run(root=DEFAULT_ARTIFACTS_ROOT):
+    """
+    Newest finished run under `root`: the directory whose performance report
+    (written last by run_pipeline) is most recent and that has a transformed
+    checkpoint. Returns None if there is none.
+    """
+    reports = glob.glob(os.path.join(root, "**", logging_agent.PERFORMANCE_REPORT), recursive=True)
+    for report in sorted(reports, key=os.path.getmtime, reverse=True):
+        run_dir = os.path.dirname(report)
+        if find_artifact(run_dir, "transformed"):
+            return run_dir
+    return None
+
+
+class Snapshot:
+    """One loaded run: its QueryEngine, an answer cache, and where and when it came from."""
+
+    def __init__(self, run_dir, path, engine, load_seconds):
+        self.run_dir = run_dir
+        self.path = path
+        self.mtime = os.path.getmtime(path)
+        self.engine = engine
+        self.rows = len(engine.df)
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self._answers = OrderedDict()
+
+    def cached(self, question):
+        """Cached engine answer for `question`, or the string "miss" (cheap enough to call on the event loop)."""
+        key = " ".join(question.lower().split())
+        if key not in self._answers:
+            return "miss"
+        self._answers.move_to_end(key)
+        return self._answers[key]
+
+    def answer(self, question):
+        """Engine answer (QueryResult or None) for `question`, LRU-cached by normalized text."""
+        result = self.cached(question)
+        if result != "miss":
+            return result
+        key = " ".join(question.lower().split())
+        result = self.engine.answer(question)
+        self._answers[key] = result
+        if len(self._answers) > ANSWER_CACHE_SIZE:
+            self._answers.popitem(last=False)
+        return result
+
+    @classmethod
+    def load(cls, run_dir):
+        path = find_artifact(run_dir, "transformed")
+        if path is None:
+            raise FileNotFoundError(f"No transformed checkpoint in {run_dir}")
+        start = time.perf_counter()
+        engine = QueryEngine(read_artifact(path), rollups=aggregation.load_rollups(run_dir))
+        return cls(run_dir, path, engine, time.perf_counter() - start)
+
+    def is_current(self, run_dir):
+        path = find_artifact(run_dir, "transformed")
+        return run_dir == self.run_dir and path == self.path and os.path.getmtime(path) == self.mtime
+
+
+class ServiceMetrics:
+    """Request counters, a rolling latency window and swap history."""
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = Counter()
+        self.in_flight = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.finished = deque()
+        self.swaps = []
+
+    def record(self, latency, status, source=None):
+        now = time.time()
+        self.counters["requests"] += 1
+        self.counters[f"status.{status}"] += 1
+        if source:
+            self.counters[f"answered_by.{source}"] += 1
+        self.latencies.append(latency)
+        self.finished.append(now)
+        while self.finished and self.finished[0] < now - THROUGHPUT_WINDOW_S:
+            self.finished.popleft()
+
+    def report(self):
+        uptime = time.time() - self.started
+        ordered = sorted(self.latencies)
+        pct = lambda q: round(ordered[min(len(ordered) - 1, int(len(ordered) * q))] * 1000, 3) if ordered else None
+        return {
+            "uptime_seconds": round(uptime, 3),
+            "in_flight": self.in_flight,
+            "counters": dict(self.counters),
+            "latency_ms": {"p50": pct(0.5), "p95": pct(0.95), "p99": pct(0.99), "max": pct(1.0),
+                           "window": len(ordered)},
+            "throughput_rps": {
+                f"last_{THROUGHPUT_WINDOW_S}s": round(len(self.finished) / min(uptime, THROUGHPUT_WINDOW_S), 3)
+                if uptime else 0.0,
+                "overall": round(self.counters["requests"] / uptime, 3) if uptime else 0.0,
+            },
+            "swaps": self.swaps[-10:],
+        }
+
+
+class QueryService:
+    """
+    Serves questions about the latest finished run (or a pinned `run_dir`)
+    from one resident QueryEngine. `llm` (anything with .ask(prompt)) is
+    only used for questions the engine can't map, or to phrase answers
+    when `query.phrase_with_llm` is set.
+    """
+
+    def __init__(self, config, llm=None, run_dir=None, artifacts_root=DEFAULT_ARTIFACTS_ROOT, log_dir=None):
+        service_cfg = config.get("service", {}) or {}
+        self.config = config
+        self.llm = llm
+        self.pinned = run_dir
+        self.artifacts_root = artifacts_root
+        self.watch_interval = service_cfg.get("watch_interval_s", DEFAULT_WATCH_INTERVAL_S)
+        self.phrase = (config.get("query", {}) or {}).get("phrase_with_llm", False)
+        self.log_dir = log_dir or os.path.join(artifacts_root, "service")
+        os.makedirs(self.log_dir, exist_ok=True)
+        self.metrics = ServiceMetrics()
+        self.snapshot = None
+        self._swap_lock = asyncio.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=service_cfg.get("workers", DEFAULT_WORKERS), thread_name_prefix="query"
+        )
+
+    # -- dataset --------------------------------------------------------
+
+    async def swap(self, run_dir=None):
+        """
+        Load `run_dir` (default: the pinned or latest run) off the event loop
+        and swap it in. Requests already running keep the snapshot they
+        started with; returns True if a new snapshot was installed.
+        """
+        async with self._swap_lock:
+            run_dir = run_dir or self.pinned or latest_run(self.artifacts_root)
+            if run_dir is None:
+                return False
+            if self.snapshot is not None and self.snapshot.is_current(run_dir):
+                return False
+            loop = asyncio.get_running_loop()
+            snapshot = await loop.run_in_executor(self._pool, Snapshot.load, run_dir)
+            previous, self.snapshot = self.snapshot, snapshot
+            self.metrics.swaps.append({
+                "run_dir": run_dir, "rows": snapshot.rows, "load_seconds": round(snapshot.load_seconds, 3),
+                "at": snapshot.loaded_at, "replaced": previous.run_dir if previous else None,
+            })
+            logging_agent.log_event(
+                f"Serving {snapshot.path} ({snapshot.rows} rows, loaded in {snapshot.load_seconds:.3f}s)",
+                self.log_dir, event="service_swap", run_dir=run_dir,
+            )
+            return True
+
+    async def watch(self):
+        """Poll for a newer finished run and hot-swap to it."""
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            try:
+                await self.swap()
+            except Exception as e:
+                logging_agent.log_event(f"[WARN] Hot-swap failed: {e}", self.log_dir)
+
+    # -- requests -------------------------------------------------------
+
+    def _answer(self, snapshot, question):
+        result = snapshot.answer(question)
+        if result is not None and not (self.phrase and self.llm is not None):
+            return result.text, "engine"
+        text = query_engine.answer(snapshot.engine, question, self.llm, phrase_with_llm=self.phrase)
+        return text, "llm" if self.llm is not None else "engine"
+
+    async def handle(self, method, path, body):
+        """Route one request; returns (status, payload, answered_by)."""
+        if path == "/health" and method == "GET":
+            snap = self.snapshot
+            status = "ok" if snap else "loading"
+            return (200 if snap else 503), {"status": status, "run_dir": snap and snap.run_dir,
+                                            "rows": snap and snap.rows}, None
+        if path == "/metrics" and method == "GET":
+            payload = self.metrics.report()
+            payload["run_dir"] = self.snapshot and self.snapshot.run_dir
+            return 200, payload, None
+        if path == "/query" and method == "POST":
+            question = (body or {}).get("question")
+            if not isinstance(question, str) or not question.strip():
+                return 400, {"error": "Body must be JSON with a non-empty 'question'."}, None
+            snapshot = self.snapshot
+            if snapshot is None:
+                return 503, {"error": "No finished pipeline run to serve yet."}, None
+            hit = snapshot.cached(question)
+            if hit is not None and hit != "miss" and not (self.phrase and self.llm is not None):
+                return 200, {"answer": hit.text, "answered_by": "engine", "run_dir": snapshot.run_dir}, "engine"
+            loop = asyncio.get_running_loop()
+            text, source = await loop.run_in_executor(self._pool, self._answer, snapshot, question)
+            return 200, {"answer": text, "answered_by": source, "run_dir": snapshot.run_dir}, source
+        if path == "/reload" and method == "POST":
+            swapped = await self.swap((body or {}).get("run_dir"))
+            return 200, {"swapped": swapped, "run_dir": self.snapshot and self.snapshot.run_dir}, None
+        if path in ("/health", "/metrics", "/query", "/reload"):
+            return 405, {"error": f"{method} not allowed on {path}"}, None
+        return 404, {"error": f"Unknown path {path}"}, None
+
+    async def _connection(self, reader, writer):
+        # HTTP/1.1 with keep-alive; one request at a time per connection.
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                start = time.perf_counter()
+                self.metrics.in_flight += 1
+                source = None
+                try:
+                    length = int(headers.get("content-length") or 0)
+                    if length > MAX_BODY_BYTES:
+                        status, payload = 413, {"error": "Request body too large."}
+                    else:
+                        raw = await reader.readexactly(length) if length else b""
+                        try:
+                            body = json.loads(raw) if raw else None
+                        except ValueError:
+                            status, payload = 400, {"error": "Body is not valid JSON."}
+                        else:
+                            status, payload, source = await self.handle(method.upper(), target.split("?")[0], body)
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                finally:
+                    self.metrics.in_flight -= 1
+                latency = time.perf_counter() - start
+                self.metrics.record(latency, status, source)
+                if isinstance(payload, dict) and target.startswith("/query"):
+                    payload["latency_ms"] = round(latency * 1000, 3)
+                data = json.dumps(payload, default=str).encode("utf-8")
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if not keep_alive or status == 413:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None):
+        """Load the current run, then serve until cancelled. `ready(host, port)` is called once listening."""
+        await self.swap()
+        server = await asyncio.start_server(self._connection, host, port)
+        host, port = server.sockets[0].getsockname()[:2]
+        logging_agent.log_event(f"Service listening on http://{host}:{port}", self.log_dir, event="service_start")
+        if ready:
+            ready(host, port)
+        watcher = None if self.pinned else asyncio.create_task(self.watch())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if watcher:
+                watcher.cancel()
+            self._pool.shutdown(wait=False)
+            logging_agent.write_performance_report(self.log_dir, service=self.metrics.report())
@@ -0,0 +1,152 @@
+import numpy as np
+import pandas as pd
+
+
+class QuantileSketch:
+    """
+    Mergeable approximate quantile summary of a numeric stream.
+
+    Values are kept as at most `size` weighted centroids; compressing
+    merges neighbours of equal total weight, so the rank error of any
+    quantile is about count / size. Memory is O(size) regardless of how
+    many values are added, and two sketches can be merged (e.g. across
+    chunks or runs).
+    """
+
+    def __init__(self, size=2000):
+        self.size = size
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self):
+        return float(self.weights.sum())
+
+    def update(self, values):
+        values = np.asarray(values, dtype="float64")
+        values = values[~np.isnan(values)]
+        if values.size == 0:
+            return self
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        self._absorb(values, np.ones(values.size))
+        return self
+
+    def merge(self, other):
+        if other.weights.size:
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._absorb(other.means, other.weights)
+        return self
+
+    def _absorb(self, means, weights):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        if means.size > self.size:
+            # Assign each point to one of `size` equal-weight buckets by its midpoint rank.
+            mid_rank = np.cumsum(weights) - weights / 2
+            bucket = np.minimum((mid_rank / weights.sum() * self.size).astype("int64"), self.size - 1)
+            new_weights = np.bincount(bucket, weights=weights, minlength=self.size)
+            new_means = np.bincount(bucket, weights=weights * means, minlength=self.size)
+            keep = new_weights > 0
+            weights = new_weights[keep]
+            means = new_means[keep] / weights
+        self.means, self.weights = means, weights
+
+    def quantile(self, q):
+        """Approximate q-quantile(s), q in [0, 1]; NaN if the sketch is empty."""
+        if self.weights.size == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        total = self.weights.sum()
+        ranks = np.concatenate([[0.0], np.cumsum(self.weights) - self.weights / 2, [total]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(np.asarray(q) * total, ranks, values)
+
+    def histogram(self, bins=20):
+        """(counts, edges) histogram approximated from the centroids."""
+        if self.weights.size == 0:
+            return np.zeros(bins), np.linspace(0, 1, bins + 1)
+        return np.histogram(self.means, bins=bins, range=(self.min, self.max), weights=self.weights)
+
+    def to_dict(self):
+        return {
+            "size": self.size,
+            "means": self.means.tolist(),
+            "weights": self.weights.tolist(),
+            "min": None if self.weights.size == 0 else float(self.min),
+            "max": None if self.weights.size == 0 else float(self.max),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data.get("size", 2000))
+        sketch.means = np.asarray(data.get("means", []), dtype="float64")
+        sketch.weights = np.asarray(data.get("weights", []), dtype="float64")
+        if sketch.weights.size:
+            sketch.min, sketch.max = data["min"], data["max"]
+        return sketch
+
+
+class TopKSketch:
+    """
+    Mergeable approximate frequent-values summary (Misra-Gries).
+
+    Keeps at most `capacity` values with lower-bound counts: a value's
+    count is short by at most total / (capacity + 1), so any value more
+    frequent than that is kept. Counts are exact while a column has no
+    more than `capacity` distinct values. Each update is one vectorized
+    value_counts plus a partial sort, however many distinct values the
+    input has.
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype="int64")
+        self.missing = 0
+        self.total = 0
+        self.trimmed = 0
+
+    def update(self, values):
+        values = pd.Series(values)
+        counts = values.value_counts(sort=False)
+        self.missing += int(len(values) - counts.sum())
+        if counts.index.dtype == "category":
+            counts = counts[counts > 0]
+            counts.index = counts.index.astype(object)
+        return self._absorb(counts, len(values))
+
+    def merge(self, other):
+        self.missing += other.missing
+        self.trimmed += other.trimmed
+        return self._absorb(other.counts, other.total)
+
+    def _absorb(self, counts, total):
+        self.total += int(total)
+        counts = self.counts.add(counts.astype("int64"), fill_value=0).astype("int64") if len(self.counts) else counts.astype("int64")
+        if len(counts) > self.capacity:
+            # Subtract the (capacity + 1)-th largest count from all and drop what falls to zero.
+            cut = int(np.partition(counts.to_numpy(), -(self.capacity + 1))[-(self.capacity + 1)])
+            counts = counts[counts > cut] - cut
+            self.trimmed += cut
+        self.counts = counts
+        return self
+
+    @property
+    def exact(self):
+        return self.trimmed == 0
+
+    def most_common(self, n=None):
+        """[(value, count)] by descending count, missing values (None key) included."""
+        top = self.counts.nlargest(n) if n else self.counts.sort_values(ascending=False)
+        items = list(top.items())
+        if self.missing:
+            items.append((None, self.missing))
+            items.sort(key=lambda item: -item[1])
+        return items[:n] if n else items
+
+    def __len__(self):
+        return len(self.counts) + (1 if self.missing else 0)
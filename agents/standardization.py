@@ -1,9 +1,12 @@
 import os
+import numpy as np
 import pandas as pd
-import re
 import json
+from agents import schema_profile
+from agents.artifacts import read_artifact
 
 DATETIME_KEYWORDS = ['date', 'datetime', 'timestamp', 'time', 'dt']
+DATE_LIKE_PATTERN = r"\d{1,4}[\/\.\-\s]\d{1,4}[\/\.\-\s]\d{1,4}"
 
 
 def _is_datetime_col(colname: str) -> bool:
@@ -19,62 +22,98 @@ def _detect_datetime_columns(df):
             candidates.append(col)
             continue
 
-        
+        # Value-based heuristic (text columns only), one vectorized match over a sample
+        if pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_datetime64_any_dtype(df[col]):
+            continue
         non_null_series = df[col].dropna()
         if len(non_null_series) == 0:
             continue
-        sample = non_null_series.astype(str).sample(min(20, len(non_null_series)))
-        date_match_count = sum(
-            bool(re.match(r"\d{1,4}[\/\.\-\s]\d{1,4}[\/\.\-\s]\d{1,4}", x)) for x in sample
-        )
-        if date_match_count > len(sample) // 2:
+        sample = non_null_series.sample(min(20, len(non_null_series))).astype(str)
+        if sample.str.match(DATE_LIKE_PATTERN).sum() > len(sample) // 2:
             candidates.append(col)
     return candidates
 
 
-def ingest_file(filepath):
+def ingest_file(filepath, profile=None):
     if filepath.endswith('.csv'):
-        
-        for delim in [',', '\t', ';', ' ']:
-            try:
-                df = pd.read_csv(filepath, delimiter=delim)
-                if len(df.columns) > 1:
-                    return df
-            except Exception:
-                continue
+        # Delimiter sniffed once from a byte prefix (or taken from the source's profile)
+        df = schema_profile.read_csv(filepath, profile)
+        if len(df.columns) > 1:
+            return df
         raise ValueError("Unable to load CSV with standard delimiters.")
     elif filepath.endswith('.xlsx'):
         return pd.read_excel(filepath)
+    elif filepath.endswith(('.parquet', '.arrow', '.feather')):
+        return read_artifact(filepath)
     else:
         raise ValueError(f"Unsupported file type for ingestion: {filepath}")
 
 
-def standardize_data(raw_path, output_dir):
-    df = ingest_file(raw_path)
+def standard_name(col):
+    """Snake_case name of a raw column."""
+    return col.strip().lower().replace(' ', '_')
+
 
-  
+def standardize_columns(df):
+    """Rename df's columns in place to snake_case; returns {original: standardized}."""
     original_cols = list(df.columns)
-    std_cols = [c.strip().lower().replace(' ', '_') for c in original_cols]
-    schema_map = dict(zip(original_cols, std_cols))
+    std_cols = [standard_name(c) for c in original_cols]
     df.columns = std_cols
-
-   
+    return dict(zip(original_cols, std_cols))
+
+
+def _to_datetime(s, fmt):
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        # Parse each distinct value once and expand by the category codes.
+        parsed = pd.DatetimeIndex(_to_datetime(pd.Series(s.cat.categories), fmt))
+        values = parsed.take(s.cat.codes.to_numpy(), allow_fill=True, fill_value=pd.NaT)
+        return pd.Series(values, index=s.index, name=s.name)
+    if fmt:
+        return pd.to_datetime(s, errors='coerce', format=fmt)
+    return pd.to_datetime(s, errors='coerce')
+
+
+def _year_month(s, categorical=False):
+    """`s.dt.to_period("M").astype(str)`, formatting each distinct month once."""
+    codes, months = pd.factorize(s.dt.to_period("M"))
+    # Code -1 (NaT) picks the trailing "NaT" label.
+    labels = np.append(months.astype(str).to_numpy(dtype=object), "NaT")
+    if categorical:
+        if not (codes == -1).any():
+            labels = labels[:-1]
+        codes = np.where(codes == -1, len(labels) - 1, codes)
+        return pd.Series(pd.Categorical.from_codes(codes, labels), index=s.index)
+    return pd.Series(labels[codes], index=s.index, dtype=object)
+
+
+def parse_date_columns(df, candidates, force=False, formats=None, categorical=False):
+    """
+    Parse candidate date columns in place, adding `<col>_yyyy_mm` (a
+    categorical with `categorical`); returns the parsed columns. Columns
+    that don't parse at all are left as-is unless `force` is set (used by
+    streaming so every chunk keeps the same schema).
+
+    `formats` ({column: strftime format or None}) caches each column's
+    detected format: columns missing from it are detected once from a
+    sample and added, so later chunks/runs parse with the explicit format.
+    """
+    formats = {} if formats is None else formats
     parsed_dates = []
-    for col in _detect_datetime_columns(df):
-        s = pd.to_datetime(df[col], errors='coerce', infer_datetime_format=True)
-        if s.notna().any():
+    for col in candidates:
+        if col not in formats:
+            formats[col] = schema_profile.detect_date_format(df[col])
+        s = _to_datetime(df[col], formats[col])
+        if force or s.notna().any():
             df[col] = s
-            df[f"{col}_yyyy_mm"] = s.dt.to_period("M").astype(str)
+            df[f"{col}_yyyy_mm"] = _year_month(s, categorical)
             parsed_dates.append(col)
+    return parsed_dates
 
-    std_path = os.path.join(output_dir, "standardized.csv")
-    df.to_csv(std_path, index=False)
 
-   
+def write_standardization_summary(output_dir, schema_map, parsed_dates):
     with open(os.path.join(output_dir, "schema_map.json"), "w", encoding="utf-8") as f:
         json.dump(schema_map, f, ensure_ascii=False, indent=2)
 
-
     summary_md_path = os.path.join(output_dir, "02_standardization_summary.md")
     with open(summary_md_path, "w", encoding="utf-8") as f:
         f.write("# Standardization Summary\n\n")
@@ -89,5 +128,33 @@ def standardize_data(raw_path, output_dir):
             f.write(", ".join(parsed_dates) + "\n")
         else:
             f.write("None found\n")
-
+    return summary_md_path
+
+
+def standardize_frame(df, output_dir, profile=None):
+    """
+    Standardize column names and parse date columns; returns (df, meta).
+    With a schema profile, date columns and formats detected on an earlier
+    run of the same source are reused (and recorded on the first run).
+    """
+    df = df.copy(deep=False)
+    schema_map = standardize_columns(df)
+    date_columns = profile.get("date_columns") if profile is not None else None
+    formats = dict(profile.get("date_formats") or {}) if profile is not None else {}
+    if date_columns is None or not set(date_columns) <= set(df.columns):
+        date_columns = _detect_datetime_columns(df)
+    parsed_dates = parse_date_columns(df, date_columns, formats=formats, categorical=True)
+    recorded = {"date_columns": parsed_dates, "date_formats": {c: formats[c] for c in parsed_dates}}
+    if profile is not None and any(profile.get(k) != v for k, v in recorded.items()):
+        profile.update(**recorded)
+    summary_md_path = write_standardization_summary(output_dir, schema_map, parsed_dates)
+
+    meta = {"schema_map": schema_map, "parsed_dates": parsed_dates, "summary": summary_md_path}
+    return df, meta
+
+
+def standardize_data(raw_path, output_dir, profile=None):
+    df, _ = standardize_frame(ingest_file(raw_path, profile), output_dir, profile)
+    std_path = os.path.join(output_dir, "standardized.csv")
+    df.to_csv(std_path, index=False)
     return std_path
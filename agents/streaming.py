@@ -0,0 +1,288 @@
+import os
+from collections import Counter
+import pandas as pd
+from agents import aggregation, cleaning, dedup, download, imputation, ingestion, insights, quality, schema_profile, standardization, transformation
+from agents.artifacts import CHECKPOINTS, ChunkWriter, TABLE_FORMATS, table_formats
+from agents.sketch import QuantileSketch, TopKSketch
+
+DEFAULT_CHUNK_SIZE = 100_000
+# Categorical value counts are sketched with this many counters per column
+# (exact below that many distinct values).
+MAX_TRACKED_CATEGORIES = 1000
+
+
+def _read_chunks(location, chunk_size, profile=None):
+    return schema_profile.read_csv_chunks(location, chunk_size, profile)
+
+
+def _standardize_chunk(chunk, date_cols, date_formats):
+    standardization.standardize_columns(chunk)
+    standardization.parse_date_columns(chunk, date_cols, force=True, formats=date_formats)
+    return chunk
+
+
+class ColumnStats:
+    """Running count/sum/min/max, missing counts, quantile and top-K sketches over chunks."""
+
+    def __init__(self):
+        self.rows = 0
+        self.missing = None
+        self.sketches = {}
+        self.sums = {}
+        self.categories = {}
+
+    def update(self, df, numeric_cols, categorical_cols=()):
+        self.rows += len(df)
+        missing = df.isna().sum()
+        self.missing = missing if self.missing is None else self.missing.add(missing, fill_value=0)
+        for col in numeric_cols:
+            values = pd.to_numeric(df[col], errors="coerce")
+            self.sketches.setdefault(col, QuantileSketch()).update(values.to_numpy())
+            self.sums[col] = self.sums.get(col, 0.0) + float(values.sum())
+        for col in categorical_cols:
+            self.categories.setdefault(col, TopKSketch(MAX_TRACKED_CATEGORIES)).update(df[col])
+
+    def describe(self):
+        rows = []
+        for col, sketch in self.sketches.items():
+            count = sketch.count
+            q1, median, q3 = sketch.quantile([0.25, 0.5, 0.75])
+            rows.append({
+                "column": col,
+                "count": int(count),
+                "mean": self.sums[col] / count if count else float("nan"),
+                "min": sketch.min if count else float("nan"),
+                "25%": q1,
+                "50%": median,
+                "75%": q3,
+                "max": sketch.max if count else float("nan"),
+            })
+        return pd.DataFrame(rows).set_index("column") if rows else pd.DataFrame()
+
+
+def run_streaming(config, output_dir, index=None, profile=None):
+    """
+    Run ingestion -> standardization -> cleaning -> transformation -> insights
+    over a CSV in bounded-size chunks, so peak memory only grows with input
+    size by the dedup hash table (16-32 bytes per distinct row).
+
+    Chunks are read with the delimiter, dtypes and date formats of the
+    source's schema `profile` when given (see schema_profile).
+    Pass 1 standardizes each chunk and builds per-column quantile sketches
+    (for IQR fences), missing counts and the first valid value of each
+    column. Pass 2 re-reads the chunks, flags QC issues against those
+    global fences, drops duplicates (by row hash over `dedup.key_columns`,
+    checked against an in-memory dedup.HashIndex of the rows kept so far,
+    so repeats in later chunks go too, as in memory mode) and, with a
+    cross-run `index`, rows earlier runs already produced, carries each group's
+    last observation forward (across chunks, see imputation), applies `scope.filters`, appends
+    the results to the checkpoint artifacts and folds them into the rollup
+    base table (see aggregation). Returns a dict of row counts,
+    the transformed artifact path and the insight outputs.
+    """
+    # URL sources are streamed to the download cache first and read from there.
+    location = download.local_path(config["dataset_source"], config)
+    chunk_size = int((config.get("execution", {}) or {}).get("chunk_size", DEFAULT_CHUNK_SIZE))
+    filters = config.get("scope", {}).get("filters", {}) or {}
+    packed = (config.get("memory", {}) or {}).get("pack_qc_flags", True)
+
+    # --- Pass 1: schema, global statistics ---
+    first_raw = None
+    date_cols = None
+    numeric_cols = None
+    schema_map = None
+    # Date formats come from the schema profile, or are detected on the first
+    # chunk (and recorded there), and are reused for the rest.
+    date_formats = dict(profile.get("date_formats") or {}) if profile is not None else {}
+    std_stats = ColumnStats()
+    for chunk in _read_chunks(location, chunk_size, profile):
+        if date_cols is None:
+            first_raw = chunk.head(5).copy()
+            schema_map = standardization.standardize_columns(chunk)
+            known = profile.get("date_columns") if profile is not None else None
+            if known is None or not set(known) <= set(chunk.columns):
+                known = standardization._detect_datetime_columns(chunk)
+            date_cols = standardization.parse_date_columns(chunk, known, formats=date_formats)
+            recorded = {"date_columns": date_cols, "date_formats": {c: date_formats[c] for c in date_cols}}
+            if profile is not None and any(profile.get(k) != v for k, v in recorded.items()):
+                profile.update(**recorded)
+            numeric_cols = chunk.select_dtypes(include=["number"]).columns.tolist()
+        else:
+            _standardize_chunk(chunk, date_cols, date_formats)
+        std_stats.update(chunk, numeric_cols)
+
+    if date_cols is None:
+        raise ValueError(f"No rows found in {location}")
+
+    quartiles = [std_stats.sketches[col].quantile([0.25, 0.75]) for col in numeric_cols]
+    lower, upper = quality.iqr_fences([q[0] for q in quartiles], [q[1] for q in quartiles])
+
+    # --- Pass 2: QC flags, cleaning, filtering, export ---
+    checkpoints = (config.get("artifacts", {}) or {}).get("checkpoints", []) or []
+    checkpoints = set(CHECKPOINTS if checkpoints == "all" else checkpoints) | {"transformed"}
+    compression = (config.get("artifacts", {}) or {}).get("compression")
+    writers = {
+        name: [
+            ChunkWriter(os.path.join(output_dir, name + TABLE_FORMATS[fmt]), fmt, compression)
+            for fmt in table_formats(config)
+        ]
+        for name in checkpoints
+    }
+
+    def export(name, df):
+        for writer in writers.get(name, []):
+            writer.write(df)
+
+    dup_count = 0
+    # Hashes of every row this run has kept (or found in the cross-run index) so far.
+    seen_in_run = dedup.HashIndex()
+    seen_before = 0 if index is not None else None
+    rows_after_cleaning = 0
+    cleaned_missing = None
+    carry = None
+    imputed_cols = None
+    filled = Counter()
+    out_stats = ColumnStats()
+    outlier_counts = Counter()
+    # Rollups are built from per-chunk base tables (small: one row per entity and day).
+    rollup_plan = None
+    rollup_base = None
+    try:
+        for chunk in _read_chunks(location, chunk_size, profile):
+            export("raw", chunk)
+            _standardize_chunk(chunk, date_cols, date_formats)
+            export("standardized", chunk)
+
+            hashes = dedup.row_hashes(chunk, dedup.key_columns(chunk, config))
+            keep = ~dedup.duplicated(hashes)
+            keep &= ~seen_in_run.contains(hashes)
+            seen_in_run.add(hashes[keep])
+            dup_count += int((~keep).sum())
+            if index is not None:
+                seen = index.contains(hashes) & keep
+                seen_before += int(seen.sum())
+                keep &= ~seen
+                index.add(hashes[keep])
+            if not keep.all():
+                chunk = chunk[keep]
+
+            row_missing = chunk.isna().any(axis=1)
+            outliers = quality.outlier_matrix(quality.numeric_matrix(chunk, numeric_cols), lower, upper)
+            outliers = pd.DataFrame(outliers, index=chunk.index, columns=numeric_cols)
+            # Carry the last observation forward within each group, across chunks.
+            chunk, codes, carry = imputation.impute_chunk(chunk, config, carry)
+            imputed_cols = list(codes.columns)
+            filled.update(imputation.count_codes(codes))
+            for name, values in quality.flag_columns(row_missing, codes, outliers, packed).items():
+                chunk[name] = values
+
+            rows_after_cleaning += len(chunk)
+            missing = chunk.isna().sum()
+            cleaned_missing = missing if cleaned_missing is None else cleaned_missing.add(missing, fill_value=0)
+            export("cleaned", chunk)
+
+            chunk = transformation.apply_filters(chunk, filters)
+            export("transformed", chunk)
+            if rollup_plan is None and len(chunk):
+                rollup_plan = aggregation.plan(chunk, config)
+            if rollup_plan is not None and rollup_plan[1] is not None and rollup_plan[2]:
+                dims, date_col, measures = rollup_plan
+                part = aggregation.base_table(chunk, dims, date_col, measures)
+                rollup_base = aggregation.merge_base([rollup_base, part], dims)
+
+            categorical_cols = chunk.select_dtypes(include=["object", "category"]).columns.tolist()
+            out_stats.update(chunk, numeric_cols, categorical_cols)
+            outlier_counts.update(quality.outlier_flags(chunk, numeric_cols).sum().astype(int).to_dict())
+    finally:
+        for ws in writers.values():
+            for writer in ws:
+                writer.close()
+
+    # --- Stage summaries ---
+    dataset_name = os.path.basename(location)
+    ingestion.write_ingestion_summary(
+        output_dir, dataset_name, (std_stats.rows, len(schema_map)), list(schema_map), first_raw
+    )
+    standardization.write_standardization_summary(output_dir, schema_map, date_cols)
+    cleaning.write_cleaning_summary(
+        output_dir, std_stats.rows, dup_count, rows_after_cleaning,
+        std_stats.missing.astype(int), cleaned_missing.astype(int),
+        flag_layout=quality.flag_layout(numeric_cols, packed, imputed_cols),
+        imputed=imputation.summary(chunk, config, filled, chunked=True), seen_before=seen_before,
+    )
+    transformation.write_transformation_summary(output_dir, rows_after_cleaning, out_stats.rows, filters)
+    rollups = {}
+    if rollup_base is not None:
+        dims, date_col, measures = rollup_plan
+        rollups = aggregation.build_rollups(rollup_base, dims, measures, config)
+        aggregation.write_rollups(rollups, output_dir)
+    summary_md, plot_paths = write_streaming_insights(output_dir, out_stats, outlier_counts, rollups=rollups, config=config)
+
+    return {
+        "dataset_name": dataset_name,
+        "rows": std_stats.rows,
+        "rows_after_cleaning": rows_after_cleaning,
+        "rows_transformed": out_stats.rows,
+        "duplicates_removed": dup_count,
+        "seen_in_earlier_runs": seen_before,
+        "transformed_path": writers["transformed"][0].path,
+        "summary": summary_md,
+        "plots": plot_paths,
+    }
+
+
+def write_streaming_insights(output_dir, stats, outlier_counts, mode="streaming", rollups=None, config=None):
+    """
+    summary.md and distribution charts built from chunk statistics (and
+    rollup tables, if any) instead of raw rows: histograms come from the
+    quantile sketches, value counts from the top-K sketches.
+    """
+    insights_cfg = (config or {}).get("insights", {}) or {}
+    hists = {col: sketch.histogram(insights_cfg.get("bins", insights.DEFAULT_BINS)) for col, sketch in stats.sketches.items()}
+    plot_paths = insights.render_charts(
+        insights.histogram_charts(hists, output_dir),
+        insights_cfg.get("chart_processes", insights.DEFAULT_CHART_PROCESSES),
+    )
+    n_top = insights_cfg.get("top_values", insights.DEFAULT_TOP_VALUES)
+
+    missing = (stats.missing if stats.missing is not None else pd.Series(dtype=int)).astype(int)
+    missing = missing.rename("missing_count").to_frame()
+    missing["missing_pct"] = (missing["missing_count"] / max(stats.rows, 1) * 100).round(2)
+
+    summary_md = os.path.join(output_dir, "summary.md")
+    with open(summary_md, "w", encoding="utf-8") as f:
+        f.write("# Dataset Summary & Insights\n\n")
+        f.write(f"_Computed in {mode} mode over {stats.rows} rows; quantiles are approximate._\n\n")
+
+        f.write("## Summary Statistics\n\n")
+        describe = stats.describe()
+        if not describe.empty:
+            f.write(describe.to_markdown())
+        f.write("\n\n")
+
+        f.write("## Missing Values\n\n")
+        f.write(missing.to_markdown())
+        f.write("\n\n")
+
+        if outlier_counts:
+            f.write("## Outlier Counts (IQR method)\n\n")
+            outlier_df = pd.DataFrame(
+                [{"column": c, "iqr_outliers": n} for c, n in outlier_counts.items()]
+            )
+            f.write(outlier_df.to_markdown(index=False))
+            f.write("\n\n")
+
+        if stats.categories:
+            f.write(f"## Categorical Columns Value Counts (Top {n_top})\n\n")
+            for c, sketch in stats.categories.items():
+                f.write(f"### Column: {c}\n\n")
+                top = pd.Series(dict(sketch.most_common(n_top)), name="count")
+                f.write(top.to_frame().to_markdown())
+                if not sketch.exact:
+                    f.write(f"\n\n_Approximate: counts may be low by up to {sketch.trimmed}._")
+                f.write("\n\n")
+
+        f.write(insights.trends_section(rollups))
+        f.write(insights.chart_note(list(hists), output_dir))
+
+    return summary_md, plot_paths
@@ -1,26 +1,51 @@
 import os
 import json
 import pandas as pd
+from agents import filters as filter_engine
+from agents.artifacts import read_artifact
 
-def transform_data(clean_path, config, output_dir):
-    df = pd.read_csv(clean_path)
-
-    rows_before = len(df)
-    filters = config.get("scope", {}).get("filters", {}) or {}
+def apply_filters(df, filters):
+    """
+    Keep rows matching `filters` (equality, `in`, ranges and and/or/not;
+    text compared case-insensitively). See agents.filters for the syntax.
+    """
+    return filter_engine.apply(df, filters)
 
-    for col, val in filters.items():
-        if col in df.columns:
-            df = df[df[col].astype(str).str.lower() == str(val).lower()]
-
-    rows_after = len(df)
-    transformed_path = os.path.join(output_dir, "transformed.csv")
-    df.to_csv(transformed_path, index=False)
 
+def write_transformation_summary(output_dir, rows_before, rows_after, filters):
     summary_path = os.path.join(output_dir, "04_transformation_summary.md")
     with open(summary_path, "w", encoding="utf-8") as f:
         f.write("# Transformation Summary\n\n")
         f.write(f"- **Rows before:** {rows_before}\n")
         f.write(f"- **Rows after:** {rows_after}\n")
-        f.write(f"- **Filters applied:** `{json.dumps(filters)}`\n")
+        f.write(f"- **Filters applied:** `{json.dumps(filters, default=str)}`\n")
+        f.write(f"- **Filter expression:** `{filter_engine.describe(filter_engine.compile_filters(filters))}`\n")
+    return summary_path
 
+
+def transform_frame(df, config, output_dir, rows_before=None):
+    """
+    Apply `scope.filters` to `df`; returns (filtered df, meta). Pass
+    `rows_before` when `df` was already filtered while being read.
+    """
+    rows_before = len(df) if rows_before is None else rows_before
+    filters = config.get("scope", {}).get("filters", {}) or {}
+    df = apply_filters(df, filters)
+    rows_after = len(df)
+    summary_path = write_transformation_summary(output_dir, rows_before, rows_after, filters)
+
+    meta = {"rows_before": rows_before, "rows_after": rows_after, "summary": summary_path}
+    return df, meta
+
+
+def transform_data(clean_path, config, output_dir):
+    filters = config.get("scope", {}).get("filters", {}) or {}
+    if filters and clean_path.endswith((".parquet", ".arrow", ".feather")):
+        # Push the filters down to the reader; only matching rows are loaded.
+        df = filter_engine.read_filtered(clean_path, filters)
+        df, _ = transform_frame(df, config, output_dir, rows_before=filter_engine.count_rows(clean_path))
+    else:
+        df, _ = transform_frame(read_artifact(clean_path), config, output_dir)
+    transformed_path = os.path.join(output_dir, "transformed.csv")
+    df.to_csv(transformed_path, index=False)
     return transformed_path
@@ -0,0 +1,228 @@
+"""
+Pipeline benchmarks on synthetic datasets.
+
+    python -m benchmarks.run run --sizes 10000,100000,1000000 --out benchmarks/results/current.json
+    python -m benchmarks.run compare benchmarks/results/baseline.json benchmarks/results/current.json
+
+Every stage is timed in isolation (its inputs are prepared outside the
+timer) and the whole Orchestrator is timed end to end, with the LLM
+stubbed out. Each (dataset, size) runs in its own process so peak RSS
+is per case.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import subprocess
+import statistics
+import multiprocessing as mp
+from datetime import datetime
+
+import typer
+import pandas as pd
+from tabulate import tabulate
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic  # noqa: E402
+
+app = typer.Typer()
+
+DEFAULT_SIZES = "10000,100000,1000000"
+DEFAULT_DATA_DIR = os.path.join("benchmarks", "data")
+RESULTS_FORMAT = 1
+# Above this many rows the in-memory pipeline is skipped and only streaming mode runs.
+DEFAULT_MEMORY_LIMIT_ROWS = 5_000_000
+
+
+def _peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _bench_config(path, work_dir, mode="memory"):
+    return {
+        "dataset_source": {"type": "file", "location": path},
+        "scope": {"filters": {}},
+        "llm": {"provider": "stub", "cache_dir": None},
+        "execution": {"mode": mode},
+        "quality": {"group_by": []},
+        "artifacts": {"checkpoints": ["transformed"], "async": True},
+        "cache": {"enabled": False},
+        "schema_profile": {"dir": os.path.join(work_dir, "profiles")},
+        "incremental": {"store_dir": os.path.join(work_dir, "incremental")},
+        "export_formats": ["parquet"],
+    }
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+def _stage_timings(config, out_dir):
+    """{stage: seconds} for one pass over the stages, each fed the previous stage's output."""
+    from agents import aggregation, cleaning, ingestion, insights, standardization, transformation
+    from agents.query_engine import QueryEngine
+    from agents.quality import QCProfile
+    from agents.schema_profile import SchemaProfile
+
+    profile = SchemaProfile.for_source(config)
+    timings, rss = {}, {}
+
+    def stage(name, fn):
+        timings[name], result = _timed(fn)
+        rss[name] = _peak_rss_mb()
+        return result
+
+    raw, _ = stage("ingestion", lambda: ingestion.load_frame(config["dataset_source"], out_dir, profile, config))
+    std, _ = stage("standardization", lambda: standardization.standardize_frame(raw, out_dir, profile))
+    stage("llm_suggestions", lambda: cleaning.suggest_cleaning(std, config, out_dir))
+    cleaned, meta = stage("cleaning", lambda: cleaning.clean_frame(std, config, out_dir))
+    transformed, _ = stage("transformation", lambda: transformation.transform_frame(cleaned, config, out_dir))
+    stage("aggregation", lambda: aggregation.aggregate_frame(transformed, config, out_dir))
+    rollups = aggregation.load_rollups(out_dir)
+    stage("insights_charts", lambda: insights.render_distributions(transformed, out_dir))
+    qc = QCProfile.from_dict(meta["qc_profile"])
+    stage("insights_report", lambda: insights.write_insights_report(transformed, config, out_dir, qc, rollups))
+    stage("query_engine", lambda: QueryEngine(transformed, rollups=rollups))
+    return timings, rss
+
+
+def _end_to_end(config, out_dir):
+    from agents import llm_agent
+    from agents.orchestrator import Orchestrator
+
+    orchestrator = Orchestrator(llm_agent.LLMAgent(config), out_dir, config)
+    seconds, _ = _timed(orchestrator.run_pipeline)
+    return seconds
+
+
+def _run_case(kind, rows, path, repeat, memory_limit_rows, queue):
+    """Child process: time every stage and the end-to-end run `repeat` times."""
+    samples, rss = {}, {}
+    work_dir = tempfile.mkdtemp(prefix="bench_")
+    try:
+        for _ in range(repeat):
+            out_dir = tempfile.mkdtemp(dir=work_dir)
+            if rows <= memory_limit_rows:
+                config = _bench_config(path, work_dir)
+                timings, stage_rss = _stage_timings(config, out_dir)
+                for name, seconds in timings.items():
+                    samples.setdefault(f"stage:{name}", []).append(seconds)
+                    rss[f"stage:{name}"] = stage_rss[name]
+                samples.setdefault("end_to_end:memory", []).append(_end_to_end(config, tempfile.mkdtemp(dir=work_dir)))
+                rss["end_to_end:memory"] = _peak_rss_mb()
+            config = _bench_config(path, work_dir, mode="streaming")
+            samples.setdefault("end_to_end:streaming", []).append(_end_to_end(config, out_dir))
+            rss["end_to_end:streaming"] = _peak_rss_mb()
+        queue.put([
+            {
+                "dataset": kind,
+                "rows": rows,
+                "case": case,
+                "seconds": [round(s, 6) for s in values],
+                "median": round(statistics.median(values), 6),
+                "min": round(min(values), 6),
+                "peak_rss_mb": rss[case],
+            }
+            for case, values in samples.items()
+        ])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+@app.command()
+def run(
+    sizes: str = typer.Option(DEFAULT_SIZES, help="Comma-separated row counts (up to 50M)."),
+    datasets: str = typer.Option("rainfall,consumption", help="Comma-separated: rainfall, consumption."),
+    repeat: int = typer.Option(3, help="Timed repetitions per case."),
+    out: str = typer.Option(os.path.join("benchmarks", "results", "current.json"), help="Results JSON path."),
+    data_dir: str = typer.Option(DEFAULT_DATA_DIR, help="Where generated datasets are cached."),
+    memory_limit_rows: int = typer.Option(DEFAULT_MEMORY_LIMIT_ROWS, help="Largest size run in memory mode."),
+    seed: int = typer.Option(0),
+):
+    """Generate (or reuse) synthetic datasets and benchmark every stage on each."""
+    # The stub LLM keeps timings free of network latency; Agg keeps charts headless.
+    os.environ.setdefault("MPLBACKEND", "Agg")
+    results = []
+    ctx = mp.get_context("spawn")
+    for kind in [d.strip() for d in datasets.split(",") if d.strip()]:
+        for rows in [int(s) for s in sizes.split(",") if s.strip()]:
+            typer.echo(f"Generating {kind} x {rows} rows...")
+            path = synthetic.dataset_path(data_dir, kind, rows, seed)
+            typer.echo(f"Benchmarking {kind} x {rows} rows ({repeat} runs)...")
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_case, args=(kind, rows, path, repeat, memory_limit_rows, queue))
+            proc.start()
+            case_results = queue.get()
+            proc.join()
+            results.extend(case_results)
+            for r in case_results:
+                typer.echo(f"  {r['case']:<28} median {r['median']:.4f}s  peak RSS {r['peak_rss_mb']} MB")
+
+    report = {
+        "format": RESULTS_FORMAT,
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "git_commit": _git_commit(),
+        "python_version": platform.python_version(),
+        "pandas_version": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": repeat,
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    typer.echo(f"Results written to {out}")
+
+
+@app.command()
+def compare(
+    baseline: str,
+    current: str,
+    threshold: float = typer.Option(0.10, help="Flag cases slower (or larger) than baseline by more than this fraction."),
+    min_seconds: float = typer.Option(0.005, help="Ignore time differences smaller than this."),
+):
+    """Compare two results files; exits with status 1 if any case regressed."""
+    with open(baseline, encoding="utf-8") as f:
+        base = {(r["dataset"], r["rows"], r["case"]): r for r in json.load(f)["results"]}
+    with open(current, encoding="utf-8") as f:
+        cur = {(r["dataset"], r["rows"], r["case"]): r for r in json.load(f)["results"]}
+
+    rows, regressions = [], 0
+    for key in sorted(set(base) & set(cur)):
+        b, c = base[key], cur[key]
+        ratio = c["median"] / b["median"] if b["median"] else float("inf")
+        slower = ratio > 1 + threshold and c["median"] - b["median"] > min_seconds
+        bigger = c["peak_rss_mb"] > b["peak_rss_mb"] * (1 + threshold)
+        status = "REGRESSION" if slower or bigger else ("faster" if ratio < 1 - threshold else "ok")
+        regressions += status == "REGRESSION"
+        rows.append([*key, f"{b['median']:.4f}", f"{c['median']:.4f}", f"{ratio:.2f}x",
+                     b["peak_rss_mb"], c["peak_rss_mb"], status])
+    typer.echo(tabulate(rows, headers=["dataset", "rows", "case", "base s", "current s", "ratio",
+                                       "base RSS MB", "current RSS MB", "status"]))
+    missing = sorted(set(base) - set(cur))
+    if missing:
+        typer.echo(f"\n{len(missing)} baseline cases missing from current results.")
+    if regressions:
+        typer.echo(f"\n{regressions} regression(s) beyond {threshold:.0%}.")
+        raise typer.Exit(code=1)
+
+
+if __name__ == "__main__":
+    app()
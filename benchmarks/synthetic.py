@@ -0,0 +1,98 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Generated in blocks so 50M-row files never need more than one block in memory.
+BLOCK_ROWS = 1_000_000
+MISSING_RATE = 0.005
+DUPLICATE_RATE = 0.002
+
+N_DISTRICTS = 33
+N_MANDALS = 621
+
+
+def _inject_noise(df, rng, numeric_cols):
+    """Blank out a few numeric values and repeat a few rows, like the real exports."""
+    for col in numeric_cols:
+        df.loc[rng.random(len(df)) < MISSING_RATE, col] = np.nan
+    n_dup = int(len(df) * DUPLICATE_RATE)
+    if n_dup:
+        src = rng.integers(0, len(df), n_dup)
+        dst = rng.integers(0, len(df), n_dup)
+        df.iloc[dst] = df.iloc[src].to_numpy()
+    return df
+
+
+def rainfall_block(start, rows, rng):
+    """
+    Rows [start, start + rows) of a District/Mandal/Date/Rain/Humidity table:
+    one row per mandal per day, dates formatted like the bundled CSV (06-Apr-25).
+    """
+    idx = np.arange(start, start + rows)
+    mandal = idx % N_MANDALS
+    day = idx // N_MANDALS
+    district_names = np.array([f"District_{i:02d}" for i in range(N_DISTRICTS)], dtype=object)
+    mandal_names = np.array([f"Mandal_{i:03d}" for i in range(N_MANDALS)], dtype=object)
+    days = pd.date_range("2020-01-01", periods=int(day.max()) + 1, freq="D")
+    day_labels = days.strftime("%d-%b-%y").to_numpy(dtype=object)
+
+    wet = rng.random(rows) < 0.4
+    rain = np.where(wet, rng.gamma(0.8, 12.0, rows), 0.0).round(1)
+    min_h = rng.normal(55, 12, rows).clip(0, 100).round(1)
+    max_h = np.maximum(min_h, rng.normal(88, 8, rows).clip(0, 100)).round(1)
+    df = pd.DataFrame({
+        "District": district_names[mandal % N_DISTRICTS],
+        "Mandal": mandal_names[mandal],
+        "Date": day_labels[day],
+        "Rain (mm)": rain,
+        "Min Humidity (%)": min_h,
+        "Max Humidity (%)": max_h,
+    })
+    return _inject_noise(df, rng, ["Rain (mm)", "Min Humidity (%)", "Max Humidity (%)"])
+
+
+def consumption_block(start, rows, rng):
+    """Rows of a TG-SPDCL-style consumption table (circle/division/.../area, category, services, units, load)."""
+    section = rng.integers(0, 2000, rows)
+    categories = np.array(["DOMESTIC", "NON-DOMESTIC", "INDUSTRIAL", "COTTAGE", "AGRICULTURE",
+                           "STREET LIGHTING", "GENERAL PURPOSE", "TEMPORARY"], dtype=object)
+    cat = rng.integers(0, len(categories), rows)
+    total = rng.integers(1, 500, rows)
+    df = pd.DataFrame({
+        "Circle": np.char.add("CIRCLE_", (section // 100).astype(str)).astype(object),
+        "Division": np.char.add("DIV_", (section // 20).astype(str)).astype(object),
+        "SubDivision": np.char.add("SUBDIV_", (section // 5).astype(str)).astype(object),
+        "Section": np.char.add("SEC_", section.astype(str)).astype(object),
+        "Area": np.char.add("AREA_", rng.integers(0, 10_000, rows).astype(str)).astype(object),
+        "CatCode": cat + 1,
+        "CatDesc": categories[cat],
+        "TotServices": total,
+        "BilledServices": (total * rng.uniform(0.8, 1.0, rows)).astype("int64"),
+        "Units": rng.lognormal(7, 1.5, rows).round(2),
+        "Load": rng.lognormal(3, 1.0, rows).round(2),
+    })
+    return _inject_noise(df, rng, ["Units", "Load"])
+
+
+GENERATORS = {"rainfall": rainfall_block, "consumption": consumption_block}
+
+
+def generate(kind, rows, path, seed=0):
+    """Write a synthetic `kind` dataset of `rows` rows to `path` (CSV), block by block."""
+    block_fn = GENERATORS[kind]
+    rng = np.random.default_rng(seed)
+    tmp = path + ".tmp"
+    for start in range(0, rows, BLOCK_ROWS):
+        block = block_fn(start, min(BLOCK_ROWS, rows - start), rng)
+        block.to_csv(tmp, mode="w" if start == 0 else "a", header=start == 0, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def dataset_path(data_dir, kind, rows, seed=0):
+    """Path of the cached synthetic dataset, generating it on first use."""
+    os.makedirs(data_dir, exist_ok=True)
+    path = os.path.join(data_dir, f"{kind}_{rows}_s{seed}.csv")
+    if not os.path.exists(path):
+        generate(kind, rows, path, seed)
+    return path
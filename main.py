@@ -1,34 +1,40 @@
+import sys
 import typer
 import yaml
-import os
-from datetime import datetime
-from agents import llm_agent, logging_agent
-from agents.provenance import save_run_metadata
-from agents.orchestrator import Orchestrator  # NEW Orchestrator agent
+from typing import List
+from agents import logging_agent
 
 app = typer.Typer()
+# Subcommands; any other first argument is taken as a config path for run-pipeline.
+COMMANDS = ("run-pipeline", "batch", "serve", "runs", "lineage", "perf", "import-runs")
 
 @app.command()
-def run_pipeline(config_path: str):
+def run_pipeline(
+    config_path: str,
+    workers: int = typer.Option(None, help="Max pipeline tasks to run in parallel (default: execution.workers or 4)."),
+    goal: str = typer.Option(None, help="What the run is for; with planner.mode llm, decides which stages run."),
+):
+    """Run the pipeline on the configured dataset, then answer questions interactively."""
     # Load config
     with open(config_path) as f:
         config = yaml.safe_load(f)
+    if goal:
+        config["planner"] = dict(config.get("planner") or {}, goal=goal)
 
-    # Prepare output directory
-    today = datetime.now().strftime("%Y-%m-%d")
-    output_dir = os.path.join("run_artifacts", today)
-    os.makedirs(output_dir, exist_ok=True)
+    # Heavy dependencies (pandas, the LLM SDK) load here rather than at startup,
+    # so `--help` and argument errors return immediately.
+    from agents import llm_agent
+    from agents.artifacts import run_directory
+    from agents.orchestrator import Orchestrator
 
-    logging_agent.log_event("Run started", output_dir)
+    # Prepare output directory (one per run: run_artifacts/<date>/<dataset>_<time>)
+    output_dir = run_directory("run_artifacts", config["dataset_source"]["location"])
 
-    dataset_file = config["dataset_source"].get("location")
-    llm_model = config.get("llm", {}).get("model")
-    save_run_metadata(output_dir, config_path, dataset_file, llm_model)
-    logging_agent.log_event("Saved run metadata", output_dir)
+    logging_agent.log_event("Run started", output_dir)
 
-    # Initialize orchestrator
-    llm = llm_agent.LLMAgent(model_name=llm_model)
-    orchestrator = Orchestrator(llm, output_dir, config)
+    # Initialize orchestrator (run provenance is collected in the background)
+    llm = llm_agent.LLMAgent(config)
+    orchestrator = Orchestrator(llm, output_dir, config, config_path=config_path, workers=workers)
 
     typer.echo("🚀 Running agentic pipeline with dynamic orchestration...\n")
     transformed_df = orchestrator.run_pipeline()
@@ -41,10 +47,159 @@ def run_pipeline(config_path: str):
         if user_q.lower() in ["exit", "quit"]:
             break
         answer = orchestrator.handle_query(user_q, transformed_df)
-        typer.echo(f"\n🤖 LLM Answer:\n{answer}\n")
+        typer.echo(f"\n🤖 Answer:\n{answer}\n")
 
     logging_agent.log_event("Run completed", output_dir)
+    logging_agent.flush(output_dir)
+
+
+@app.command()
+def batch(
+    sources: List[str] = typer.Argument(None, help="Dataset files, globs (quote them) or URLs."),
+    config_path: str = typer.Option("config.yaml", "--config", help="Base config; dataset_source is replaced per dataset."),
+    source_list: str = typer.Option(None, "--list", help="Text file with one file, glob or URL per line."),
+    processes: int = typer.Option(None, help="Datasets processed in parallel (default: batch.processes)."),
+    llm_concurrency: int = typer.Option(None, help="LLM calls in flight across all datasets (default: batch.llm_concurrency)."),
+):
+    """Run the pipeline on many datasets in parallel processes and write a consolidated index."""
+    from agents import batch as batch_runner
+
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    patterns = list(sources or [])
+    if source_list:
+        patterns += batch_runner.read_source_list(source_list)
+    datasets = batch_runner.expand_sources(patterns)
+    if not datasets:
+        typer.echo("No datasets to process.")
+        raise typer.Exit(code=1)
+
+    typer.echo(f"🚀 Processing {len(datasets)} datasets...\n")
+    report = lambda e: typer.echo(f"  {'✅' if e['status'] == 'ok' else '❌'} {e['source']} ({e['seconds']}s) -> {e['run_dir']}"
+                                  + (f"  {e['error']}" if e.get("error") else ""))
+    index = batch_runner.run_batch(config, datasets, config_path=config_path, processes=processes,
+                                   llm_concurrency=llm_concurrency, on_result=report)
+    typer.echo(f"\n{index['ok']} ok, {index['failed']} failed in {index['wall_seconds']}s. "
+               f"Index: {index['batch_dir']}/index.md")
+    if index["failed"]:
+        raise typer.Exit(code=1)
+
+
+@app.command()
+def serve(
+    config_path: str,
+    run_dir: str = typer.Option(None, help="Serve this run only (default: the latest finished run, hot-swapped as new runs finish)."),
+    host: str = typer.Option(None, help="Bind address (default: service.host or 127.0.0.1)."),
+    port: int = typer.Option(None, help="Port (default: service.port or 8000)."),
+):
+    """Serve Q&A over HTTP/JSON from a resident copy of the latest processed dataset."""
+    import asyncio
+    from agents import llm_agent, service
+
+    with open(config_path) as f:
+        config = yaml.safe_load(f)
+    service_cfg = config.get("service", {}) or {}
+    qs = service.QueryService(config, llm_agent.LLMAgent(config), run_dir=run_dir)
+    ready = lambda h, p: typer.echo(f"🛰️  Serving Q&A on http://{h}:{p} (POST /query, GET /metrics)")
+    try:
+        asyncio.run(qs.serve(host or service_cfg.get("host", service.DEFAULT_HOST),
+                             port or service_cfg.get("port", service.DEFAULT_PORT), ready))
+    except KeyboardInterrupt:
+        typer.echo("\nService stopped.")
+
+
+def _run_store(config_path):
+    """The provenance store named in `config_path` (the default location if the file is missing)."""
+    import os
+    from agents import run_store
+
+    config = {}
+    if os.path.exists(config_path):
+        with open(config_path) as f:
+            config = yaml.safe_load(f) or {}
+    store = run_store.RunStore.from_config(config)
+    if store is None:
+        typer.echo("The provenance store is disabled (provenance.store in the config).")
+        raise typer.Exit(code=1)
+    return store
+
+
+@app.command()
+def runs(
+    checksum: str = typer.Option(None, help="Dataset checksum, or a prefix of it."),
+    dataset: str = typer.Option(None, help="Part of the dataset location."),
+    since: str = typer.Option(None, help="Runs started on or after this date (YYYY-MM-DD)."),
+    until: str = typer.Option(None, help="Runs started on or before this date (YYYY-MM-DD)."),
+    limit: int = typer.Option(20, help="Most recent runs to list."),
+    config_path: str = typer.Option("config.yaml", "--config", help="Config naming the provenance store."),
+):
+    """List recorded runs, newest first: when, in which mode, on which dataset and how long they took."""
+    from agents import run_store
+
+    with _run_store(config_path) as store:
+        rows, ms = run_store.timed_query(store.runs, checksum, dataset, since, until, limit)
+    typer.echo(run_store.format_table(rows, run_store.RUN_COLUMNS))
+    typer.echo(f"\n{len(rows)} runs ({ms:.1f} ms)")
+
+
+@app.command()
+def lineage(
+    target: str = typer.Argument(..., help="A file, or a checksum (prefix)."),
+    config_path: str = typer.Option("config.yaml", "--config", help="Config naming the provenance store."),
+):
+    """Which runs read a file and which wrote it, tracing each writer's own input upstream."""
+    import os
+    from agents import provenance, run_store
+
+    checksum = provenance.sha256(target) if os.path.isfile(target) else target
+    with _run_store(config_path) as store:
+        result, ms = run_store.timed_query(store.lineage, checksum)
+    typer.echo(f"Checksum {checksum}\n\nRead by:\n{run_store.format_table(result['consumed_by'], run_store.RUN_COLUMNS)}")
+
+    def show(producers, indent):
+        for run in producers:
+            typer.echo(f"{indent}run {run['id']} ({run['started']}, {run['mode']}) wrote {run['output']}"
+                       f" from {run['dataset']} [{(run['dataset_checksum'] or '?')[:12]}]")
+            show(run.get("upstream", []), indent + "  ")
+
+    typer.echo("\nWritten by:")
+    show(result["produced_by"], "  ")
+    if not result["produced_by"]:
+        typer.echo("  (no recorded run)")
+    typer.echo(f"\n({ms:.1f} ms)")
+
+
+@app.command()
+def perf(
+    stage: str = typer.Option(None, help="Only this stage."),
+    checksum: str = typer.Option(None, help="Only runs on this dataset checksum (or prefix)."),
+    dataset: str = typer.Option(None, help="Only runs whose dataset location contains this."),
+    since: str = typer.Option(None, help="Runs started on or after this date (YYYY-MM-DD)."),
+    until: str = typer.Option(None, help="Runs started on or before this date (YYYY-MM-DD)."),
+    config_path: str = typer.Option("config.yaml", "--config", help="Config naming the provenance store."),
+):
+    """Stage timing history over recorded runs: mean, p50, p95, max and latest seconds per stage."""
+    from agents import run_store
+
+    with _run_store(config_path) as store:
+        rows, ms = run_store.timed_query(store.stage_history, stage, checksum, dataset, since, until)
+    typer.echo(run_store.format_table(rows))
+    typer.echo(f"\n({ms:.1f} ms)")
+
+
+@app.command("import-runs")
+def import_runs(
+    root: str = typer.Argument("run_artifacts", help="Directory holding run output dirs."),
+    config_path: str = typer.Option("config.yaml", "--config", help="Config naming the provenance store."),
+):
+    """Record run dirs written before the provenance store existed (skipping any already in it)."""
+    with _run_store(config_path) as store:
+        n = store.import_runs(root)
+    typer.echo(f"Recorded {n} runs in {store.path}")
 
 
 if __name__ == "__main__":
+    # `python main.py config.yaml` predates the subcommands; keep it meaning run-pipeline.
+    if len(sys.argv) > 1 and not sys.argv[1].startswith("-") and sys.argv[1] not in COMMANDS:
+        sys.argv.insert(1, "run-pipeline")
     app()
@@ -0,0 +1,137 @@
+"""
+Downloader checks against a local HTTP stand-in (a threaded http.server
+that speaks ETag, If-None-Match and Range/If-Range), so no network is
+needed: `python -m pytest tests`.
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+from agents import download
+
+# Over 2 * download.CHUNK_BYTES, so half a body already holds a whole chunk on disk.
+BODY = b"district,mandal,rain\n" + b"".join(b"Adilabad,Bela,%d\n" % i for i in range(150_000))
+ETAG = '"v1"'
+LAST_PAGE = 3
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        server.requests.append((url.path, self.headers.get("If-None-Match"), self.headers.get("Range")))
+        if url.path == "/pages":
+            page = int(parse_qs(url.query)["page"][0])
+            if page > LAST_PAGE:
+                return self._send(404)
+            return self._send(200, b"id,page\n%d,%d\n" % (page, page), {"ETag": f'"p{page}"'})
+
+        if self.headers.get("If-None-Match") == ETAG:
+            return self._send(304, headers={"ETag": ETAG})
+        requested = self.headers.get("Range")
+        if requested and self.headers.get("If-Range") == ETAG:
+            start = int(requested.split("=")[1].rstrip("-"))
+            if start >= len(BODY):
+                return self._send(416, headers={"Content-Range": f"bytes */{len(BODY)}"})
+            return self._send(206, BODY[start:], {
+                "ETag": ETAG, "Content-Range": f"bytes {start}-{len(BODY) - 1}/{len(BODY)}",
+            })
+        if server.truncate_next:
+            # Promise the whole body, send half of it and hang up.
+            server.truncate_next = False
+            self.send_response(200)
+            self.send_header("ETag", ETAG)
+            self.send_header("Content-Length", str(len(BODY)))
+            self.end_headers()
+            self.wfile.write(BODY[: len(BODY) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        return self._send(200, BODY, {"ETag": ETAG})
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.requests = []
+    httpd.truncate_next = False
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.base = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def downloader(tmp_path):
+    with download.Downloader(cache_dir=str(tmp_path / "cache"), concurrency=2, backoff_s=0) as d:
+        yield d
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_unchanged_body_is_revalidated_and_reused(server, downloader):
+    url = server.base + "/data.csv"
+    path = downloader.fetch(url)
+    mtime = os.path.getmtime(path)
+    assert downloader.fetch(url) == path
+    assert _read(path) == BODY
+    assert os.path.getmtime(path) == mtime
+    assert server.requests[-1] == ("/data.csv", ETAG, None)
+
+
+def test_truncated_body_is_resumed_with_a_range_request(server, downloader):
+    server.truncate_next = True
+    url = server.base + "/data.csv"
+    path = downloader.fetch(url)
+    assert _read(path) == BODY
+    assert not os.path.exists(path + ".part")
+    ranges = [r for _, _, r in server.requests if r]
+    assert len(ranges) == 1 and int(ranges[0].split("=")[1].rstrip("-")) >= download.CHUNK_BYTES
+
+
+def test_partial_file_longer_than_body_restarts(server, downloader):
+    url = server.base + "/data.csv"
+    entry = downloader.cache.entry(url)
+    os.makedirs(entry)
+    with open(os.path.join(entry, "data.csv.part"), "wb") as f:
+        f.write(BODY + b"stale tail\n")
+    downloader.cache.save_meta(url, {"etag": ETAG, "last_modified": None, "complete": False})
+    path = downloader.fetch(url)
+    assert _read(path) == BODY
+    assert [r for _, _, r in server.requests] == [f"bytes={len(BODY) + 11}-", None]
+
+
+def test_pages_are_fetched_concurrently_until_a_404(server, downloader):
+    pages = {"param": "page", "start": 1, "max_pages": 10}
+    paths = download.fetch_pages(downloader, server.base + "/pages", pages)
+    assert [_read(p) for p in paths] == [b"id,page\n%d,%d\n" % (i, i) for i in range(1, LAST_PAGE + 1)]
+    # Batches of `concurrency` pages: 1-2, then 3-4, where 4 doesn't exist.
+    assert sorted(p for p, _, _ in server.requests) == ["/pages"] * (LAST_PAGE + 1)
+
+
+def test_fetch_source_combines_pages_under_one_header(server, tmp_path):
+    config = {"download": {"cache_dir": str(tmp_path / "cache"), "concurrency": 2, "backoff_s": 0}}
+    source = {"type": "url", "location": server.base + "/pages", "pages": {"param": "page"}}
+    path = download.fetch_source(source, config)
+    assert _read(path) == b"id,page\n1,1\n2,2\n3,3\n"